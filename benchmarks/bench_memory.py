@@ -0,0 +1,93 @@
+"""Пиковая память при просмотре большого хранилища в разных режимах
+
+Запуск: python benchmarks/bench_memory.py --notes 100000 --words 200 --format packed
+
+Во временной папке создаётся хранилище journal, затем каждый режим в
+отдельном процессе читает заметки, выполняет поиск, считает статистику
+и читает все тексты пачками (как экспорт). Печатается пиковый RSS
+процесса (ru_maxrss, только Unix) и его доля от размера снимка.
+"""
+import argparse
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from synthetic import make_notes, make_store
+
+MODES = {
+    'journal': {'kind': 'journal', 'lazy': False},
+    'journal-lazy': {'kind': 'journal', 'lazy': True},
+    'mmap': {'kind': 'mmap', 'lazy': True},
+}
+QUERIES = ["проект", "дедлайн", "zzz"]
+BATCH = 500
+
+
+def child(mode, snapshot_format, compression):
+    import resource
+    from notes_core import NotesLibrary
+    from notes_storage import open_store
+
+    started = time.perf_counter()
+    library = NotesLibrary(open_store(snapshot_format=snapshot_format, compression=compression,
+                                      **MODES[mode]))
+    library.load()
+    loaded = time.perf_counter() - started
+    for query in QUERIES:
+        library.search(query, 100)
+    library.stats()
+    for start in range(0, len(library.notes), BATCH):
+        library.store.read_contents(library.notes[start:start + BATCH])
+    total = time.perf_counter() - started
+    library.close()
+    # ru_maxrss: килобайты в Linux, байты в macOS
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return {'rss': rss if sys.platform == 'darwin' else rss * 1024,
+            'load': loaded, 'total': total}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--notes', type=int, default=100000)
+    parser.add_argument('--words', type=int, default=200)
+    parser.add_argument('--format', choices=('json', 'packed'), default='json')
+    parser.add_argument('--compression', default='zlib')
+    parser.add_argument('--child', choices=('make',) + tuple(MODES), help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child == 'make':
+        make_store('.', make_notes(args.notes, args.words), 'journal',
+                   snapshot_format=args.format, compression=args.compression)
+        return
+    if args.child:
+        print(json.dumps(child(args.child, args.format, args.compression)))
+        return
+
+    with tempfile.TemporaryDirectory() as path:
+        # Хранилище создаёт отдельный процесс: ru_maxrss наследуется
+        # дочерними процессами и исказил бы замеры
+        subprocess.run([sys.executable, os.path.abspath(__file__), '--child', 'make',
+                        '--notes', str(args.notes), '--words', str(args.words),
+                        '--format', args.format, '--compression', args.compression],
+                       cwd=path, check=True)
+        name = 'notes_data.pack' if args.format == 'packed' else 'notes_data.json'
+        size = os.path.getsize(os.path.join(path, name))
+        print(f"Заметок: {args.notes}, снимок {name}: {size / 2 ** 20:.0f} МБ")
+        print(f"\n{'режим':<14}{'пик RSS, МБ':>13}{'от снимка':>11}{'загрузка, мс':>14}{'всё, мс':>10}")
+        for mode in MODES:
+            output = subprocess.run([sys.executable, os.path.abspath(__file__), '--child', mode,
+                                     '--format', args.format, '--compression', args.compression],
+                                    cwd=path, capture_output=True, text=True, check=True).stdout
+            result = json.loads(output.strip().splitlines()[-1])
+            print(f"{mode:<14}{result['rss'] / 2 ** 20:>13.0f}{result['rss'] / size:>10.0%}"
+                  f"{result['load'] * 1000:>14.0f}{result['total'] * 1000:>10.0f}")
+
+
+if __name__ == '__main__':
+    main()
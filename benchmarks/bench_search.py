@@ -0,0 +1,96 @@
+"""Сравнение поиска по индексу (SearchIndex.rank) с линейным просмотром заметок
+
+Запуск: python benchmarks/bench_search.py --notes 20000 --words 300
+"""
+import argparse
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from notes_index import SearchIndex, tokenize
+
+
+WORDS = ("заметка план идея проект встреча задача дедлайн бюджет цель решение "
+         "note plan idea project meeting task deadline budget goal decision "
+         "python tkinter поиск индекс скорость память файл сохранение").split()
+
+QUERIES = ["проект", "дедлайн", "me", "ции", "idea proj", "zzz", "сохранение файл", "прокет"]
+LIMIT = 500  # сколько лучших просит окно (ModernNotesApp.SEARCH_LIMIT)
+
+
+def make_notes(count, words_per_note, seed=42):
+    """Синтетические заметки со смесью кириллицы и латиницы"""
+    rnd = random.Random(seed)
+    notes = []
+    for i in range(count):
+        words = [rnd.choice(WORDS) + (str(rnd.randrange(1000)) if rnd.random() < 0.2 else "")
+                 for _ in range(rnd.randint(words_per_note // 2, words_per_note))]
+        notes.append({
+            'id': i,
+            'title': " ".join(rnd.sample(WORDS, 3)).capitalize(),
+            'content': " ".join(words),
+        })
+    return notes
+
+
+def linear_search(notes, query):
+    """Просмотр всех заметок: каждое слово запроса - подстрока заголовка или текста"""
+    terms = tokenize(query)
+    return {note['id'] for note in notes
+            if all(term in note['title'].lower() or term in note['content'].lower()
+                   for term in terms)}
+
+
+def ranked_search(index, query, limit=None):
+    """Поиск, которым пользуется приложение (NotesLibrary.search)"""
+    return index.rank(query, limit)
+
+
+def timed(func, *args, repeat=5):
+    best = float('inf')
+    result = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = func(*args)
+        best = min(best, time.perf_counter() - start)
+    return best, result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--notes', type=int, default=20000)
+    parser.add_argument('--words', type=int, default=300)
+    args = parser.parse_args()
+
+    notes = make_notes(args.notes, args.words)
+    size_mb = sum(len(n['content'].encode('utf-8')) for n in notes) / 1e6
+    print(f"Заметок: {len(notes)}, объём текста: {size_mb:.1f} МБ")
+
+    index = SearchIndex()
+    start = time.perf_counter()
+    index.build((note['id'], note['title'], note['content']) for note in notes)
+    print(f"Построение индекса: {time.perf_counter() - start:.2f} с")
+
+    start = time.perf_counter()
+    index.update(notes[0]['id'], notes[0]['title'], notes[0]['content'] + " правка")
+    print(f"Обновление одной заметки: {(time.perf_counter() - start) * 1000:.2f} мс")
+    index.update(notes[0]['id'], notes[0]['title'], notes[0]['content'])
+
+    print(f"\n{'запрос':<18}{'линейно, мс':>14}{'rank, мс':>11}{f'rank {LIMIT}, мс':>15}"
+          f"{'найдено':>10}{'rank':>8}")
+    for query in QUERIES:
+        linear_time, expected = timed(linear_search, notes, query)
+        rank_time, ranked = timed(ranked_search, index, query)
+        top_time, _ = timed(ranked_search, index, query, LIMIT)
+        found = {key for _, key, _ in ranked}
+        # rank находит всё, что линейный просмотр, и ещё слова с опечатками
+        assert expected <= found, query
+        print(f"{query:<18}{linear_time * 1000:>14.2f}{rank_time * 1000:>11.2f}"
+              f"{top_time * 1000:>15.2f}{len(expected):>10}{len(found):>8}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,98 @@
+"""Время запуска: до первого экрана карточек и до конца отложенной подготовки
+
+Запуск: python benchmarks/bench_startup.py --sizes 1000 10000 100000 --words 100
+
+Для каждого размера во временной папке создаётся хранилище с
+синтетическими заметками, затем запуск замеряется в отдельном процессе
+(вместе с импортом модулей). Без дисплея (или с --headless) вместо окна
+замеряется NotesLibrary: чтение хранилища и данные первого экрана.
+"""
+import argparse
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from synthetic import make_notes, make_store
+
+FIRST_SCREEN = 12  # карточек на первом экране
+
+
+def child_headless():
+    started = time.perf_counter()
+    from notes_core import NotesLibrary
+    from notes_storage import open_store
+
+    settings = json.load(open('app_settings.json', encoding='utf-8'))
+    library = NotesLibrary(open_store(settings['storage']))
+    library.use_loaded(library.store.load(), deferred=True)
+    for note in library.notes[:FIRST_SCREEN]:
+        note.title, note.preview, note.words, note.time_label
+    first = time.perf_counter() - started
+    library.finish_warmup()
+    full = time.perf_counter() - started
+    library.close()
+    return first, full
+
+
+def child_gui():
+    started = time.perf_counter()
+    import proga
+
+    app = proga.ModernNotesApp()
+    while not app.loaded:
+        app.root.update()
+    app.root.update_idletasks()
+    first = time.perf_counter() - started
+    while app.library.warmup is not None:
+        app.root.update()
+    full = time.perf_counter() - started
+    app.store_writer.close()
+    app.tasks.shutdown()
+    app.store.close()
+    app.root.destroy()
+    return first, full
+
+
+def has_display():
+    try:
+        import tkinter
+        tkinter.Tk().destroy()
+        return True
+    except Exception:
+        return False
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--sizes', type=int, nargs='+', default=[1000, 10000, 100000])
+    parser.add_argument('--words', type=int, default=100)
+    parser.add_argument('--storage', choices=('journal', 'sqlite'), default='journal')
+    parser.add_argument('--headless', action='store_true', help="без окна, только NotesLibrary")
+    parser.add_argument('--child', choices=('gui', 'headless'), help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        first, full = child_gui() if args.child == 'gui' else child_headless()
+        print(json.dumps({'first': first, 'full': full}))
+        return
+
+    mode = 'headless' if args.headless or not has_display() else 'gui'
+    print(f"Режим: {mode}, хранилище: {args.storage}")
+    print(f"\n{'заметок':>10}{'первый экран, мс':>20}{'всё готово, мс':>22}")
+    for size in args.sizes:
+        with tempfile.TemporaryDirectory() as path:
+            make_store(path, make_notes(size, args.words), args.storage)
+            output = subprocess.run([sys.executable, os.path.abspath(__file__), '--child', mode],
+                                    cwd=path, capture_output=True, text=True, check=True).stdout
+            result = json.loads(output.strip().splitlines()[-1])
+        print(f"{size:>10}{result['first'] * 1000:>20.0f}{result['full'] * 1000:>22.0f}")
+
+
+if __name__ == '__main__':
+    main()
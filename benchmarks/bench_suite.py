@@ -0,0 +1,250 @@
+"""Набор замеров горячих путей с результатами в JSON и сравнением с базой
+
+Запуск:
+    python benchmarks/bench_suite.py --notes 10000 --output results.json
+    python benchmarks/bench_suite.py --baseline baseline.json    # код 1 при регрессии
+    xvfb-run python benchmarks/bench_suite.py --gui              # с окном Tk
+
+Без --gui замеряется NotesLibrary (то же, что делает окно, без виджетов).
+С --gui - сам ModernNotesApp: запуск, список карточек, поиск, выбор
+заметки, статистика и автосохранение. Результаты каждого замера - медиана,
+95-й процентиль и минимум в миллисекундах. Базой служит прошлый файл
+результатов; допустимый рост медианы задаёт --tolerance или поле
+"thresholds" ({замер: доля}) в файле базы.
+"""
+import argparse
+import json
+import os
+import platform
+import random
+import sys
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from synthetic import make_notes, make_store, write_notes_file
+from notes_core import NotesLibrary
+from notes_io import Progress, read_notes
+from notes_pack import CODECS
+from notes_storage import open_store
+
+
+QUERIES = ["проект", "дедлайн бюджет", "me", "прокет", "план 12", "zzz"]
+IMPORT_NOTES = 1000  # заметок в файле для замера загрузки с добавлением
+
+
+def measure(func, repeat):
+    """Время repeat вызовов func в мс: медиана, 95-й процентиль, минимум, все"""
+    runs = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        func()
+        runs.append((time.perf_counter() - started) * 1000)
+    ordered = sorted(runs)
+    return {'median_ms': ordered[len(ordered) // 2],
+            'p95_ms': ordered[min(len(ordered) - 1, int(len(ordered) * 0.95))],
+            'min_ms': ordered[0],
+            'runs': [round(run, 3) for run in runs]}
+
+
+def library_cases(path, args):
+    """Замеры без окна: хранилище, индексы, поиск, сохранение, загрузка файла"""
+    rnd = random.Random(1)
+    results = {}
+
+    options = {'lazy': not args.eager, 'snapshot_format': args.format,
+               'compression': args.compression}
+
+    def load():
+        library = NotesLibrary(open_store(args.storage, **options))
+        library.load()
+        library.finish_warmup()
+        library.close()
+
+    results['load'] = measure(load, args.repeat)
+
+    library = NotesLibrary(open_store(args.storage, **options))
+    library.load()
+    results['warmup_indexes'] = measure(lambda: library.rebuild_indexes(), args.repeat)
+
+    def build_index():
+        library.search_index_ready = False
+        library.ensure_search_index()
+
+    results['search_index_build'] = measure(build_index, 1)
+    for query in QUERIES:
+        results[f'search:{query}'] = measure(lambda: library.search(query, 500), args.repeat * 3)
+
+    def edit_and_save():
+        for note in rnd.sample(library.notes, 10):
+            library.store.load_content(note)
+            note.content = note.content + " правка"
+            note.touch()
+            library.reindex_note(note)
+            library.change_tracker.mark(note)
+        library.save()
+
+    results['auto_save_10'] = measure(edit_and_save, args.repeat)
+    results['auto_save_idle'] = measure(library.save, args.repeat * 3)
+
+    import_path = os.path.join(path, 'import.json')
+    write_notes_file(import_path, make_notes(IMPORT_NOTES, args.words, seed=7))
+
+    def import_merge():
+        notes = []
+        read_notes(import_path, Progress(), notes.extend)
+        library.import_notes(notes)
+        library.save()
+
+    results[f'import_merge_{IMPORT_NOTES}'] = measure(import_merge, args.repeat)
+    library.close()
+    return results
+
+
+def gui_cases(path, args):
+    """Замеры окна приложения (нужен дисплей, например Xvfb)"""
+    import proga
+
+    rnd = random.Random(1)
+    results = {}
+    apps = []
+
+    def start():
+        app = proga.ModernNotesApp()
+        while not app.loaded:
+            app.root.update()
+        app.root.update_idletasks()
+        apps.append(app)
+
+    def close(app):
+        app.store_writer.close()
+        app.tasks.shutdown()
+        app.store.close()
+        app.root.destroy()
+
+    results['gui_load_notes'] = measure(lambda: (start(), close(apps.pop())), args.repeat)
+    start()
+    app = apps.pop()
+    app.library.finish_warmup()
+    update = app.root.update_idletasks
+
+    results['refresh_notes_list'] = measure(lambda: (app.refresh_notes_list(), update()),
+                                            args.repeat * 3)
+
+    def scroll():
+        app.notes_view.canvas.yview_moveto(rnd.random())
+        update()
+
+    results['scroll_cards'] = measure(scroll, args.repeat * 10)
+    results['update_stats'] = measure(app.update_stats, args.repeat * 10)
+
+    for query in QUERIES:
+        def search():
+            # Поиск в окне отложен до паузы в наборе - вызываем его сразу
+            app.search_var.set(query)
+            app.search_notes()
+            while app.search_progress is not None:  # поиск в хранилище идёт в пуле
+                app.root.update()
+            update()
+        results[f'search_notes:{query}'] = measure(search, args.repeat * 3)
+    app.search_var.set("")
+
+    results['select_note'] = measure(lambda: (app.select_note(rnd.choice(app.notes)), update()),
+                                     args.repeat * 10)
+
+    def edit_and_autosave():
+        app.text_area.insert('end', " правка")
+        app.on_text_change()
+        app.auto_save()
+
+    results['auto_save'] = measure(edit_and_autosave, args.repeat * 3)
+    close(app)
+    return results
+
+
+def compare(results, baseline, tolerance):
+    """Таблица сравнения с базой; True, если есть регрессии"""
+    thresholds = baseline.get('thresholds', {})
+    regressed = False
+    for key in ('notes', 'words', 'storage', 'format', 'compression', 'eager'):
+        if baseline.get('meta', {}).get(key) != results['meta'][key]:
+            print(f"Внимание: в базе другой параметр {key}: {baseline.get('meta', {}).get(key)}")
+    print(f"\n{'замер':<28}{'база, мс':>12}{'сейчас, мс':>12}{'изм.':>9}")
+    for name, result in results['cases'].items():
+        base = baseline.get('cases', {}).get(name)
+        if base is None:
+            print(f"{name:<28}{'-':>12}{result['median_ms']:>12.2f}{'new':>9}")
+            continue
+        change = result['median_ms'] / base['median_ms'] - 1 if base['median_ms'] else 0.0
+        allowed = thresholds.get(name, tolerance)
+        mark = "  РЕГРЕССИЯ" if change > allowed else ""
+        regressed = regressed or bool(mark)
+        print(f"{name:<28}{base['median_ms']:>12.2f}{result['median_ms']:>12.2f}"
+              f"{change * 100:>8.0f}%{mark}")
+    return regressed
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--notes', type=int, default=10000)
+    parser.add_argument('--words', type=int, default=80, help="медиана слов в заметке")
+    parser.add_argument('--storage', choices=('journal', 'sqlite'), default='journal')
+    parser.add_argument('--format', choices=('json', 'packed'), default='json',
+                        help="формат снимка хранилища journal")
+    parser.add_argument('--compression', choices=tuple(CODECS), default='zlib',
+                        help="сжатие записей для --format packed")
+    parser.add_argument('--eager', action='store_true',
+                        help="читать снимок целиком, без оглавления (lazy_load: false)")
+    parser.add_argument('--repeat', type=int, default=5)
+    parser.add_argument('--gui', action='store_true', help="замерять и окно приложения")
+    parser.add_argument('--output', default='bench_results.json')
+    parser.add_argument('--baseline', help="файл результатов, с которым сравнивать")
+    parser.add_argument('--tolerance', type=float, default=0.25,
+                        help="допустимый рост медианы (0.25 = 25%%)")
+    args = parser.parse_args()
+    output = os.path.abspath(args.output)
+    baseline = None
+    if args.baseline:
+        with open(args.baseline, encoding='utf-8') as f:
+            baseline = json.load(f)
+
+    print(f"Заметок: {args.notes}, хранилище: {args.storage}, снимок: {args.format}")
+    cwd = os.getcwd()
+    with tempfile.TemporaryDirectory() as path:
+        make_store(path, make_notes(args.notes, args.words), args.storage,
+                   snapshot_format=args.format, compression=args.compression)
+        os.chdir(path)
+        try:
+            # Размер снимка - до замеров, которые дописывают заметки
+            snapshot_bytes = sum(os.path.getsize(name) for name in ('notes_data.json',
+                                                                    'notes_data.pack')
+                                 if os.path.exists(name))
+            cases = library_cases(path, args)
+            if args.gui:
+                cases.update(gui_cases(path, args))
+        finally:
+            os.chdir(cwd)
+
+    results = {'meta': {'notes': args.notes, 'words': args.words, 'storage': args.storage,
+                        'format': args.format, 'compression': args.compression,
+                        'eager': args.eager, 'snapshot_bytes': snapshot_bytes,
+                        'repeat': args.repeat, 'python': platform.python_version(),
+                        'platform': platform.platform(),
+                        'date': time.strftime('%Y-%m-%dT%H:%M:%S')},
+               'cases': cases}
+    with open(output, 'w', encoding='utf-8') as f:
+        json.dump(results, f, ensure_ascii=False, indent=2)
+
+    print(f"\n{'замер':<28}{'медиана, мс':>14}{'p95, мс':>12}")
+    for name, result in cases.items():
+        print(f"{name:<28}{result['median_ms']:>14.2f}{result['p95_ms']:>12.2f}")
+    print(f"\nРезультаты: {output}")
+
+    if baseline is not None and compare(results, baseline, args.tolerance):
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
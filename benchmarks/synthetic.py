@@ -0,0 +1,98 @@
+"""Синтетические заметки и хранилища для замеров
+
+Тексты похожи на заметки из шаблонов приложения: строки с эмодзи,
+маркированные и нумерованные списки, смесь кириллицы и латиницы.
+Объём заметок распределён логнормально (много коротких, немного
+длинных), как в живых хранилищах.
+"""
+import json
+import os
+import random
+import time
+
+from notes_model import Note
+from notes_storage import open_store
+
+
+WORDS_RU = ("заметка план идея проект встреча задача дедлайн бюджет цель решение "
+            "отчёт клиент звонок купить прочитать сделать проверить обсудить "
+            "неделя месяц квартал команда результат вопрос ответ список").split()
+WORDS_EN = ("note plan idea project meeting task deadline budget goal decision "
+            "python tkinter search index memory file release review").split()
+HEADERS = ("📅 Дата:", "🎯 Цели на день:", "📝 Важные задачи:", "💡 Название проекта:",
+           "🤝 Встреча:", "💬 Обсуждение:", "✅ Выполнено:", "📋 Повестка дня:")
+TITLES = ("Ежедневный план", "Идея проекта", "Заметки встречи", "Список покупок",
+          "Отчёт", "Project notes", "TODO", "Мысли")
+LATIN_SHARE = 0.2  # доля латинских слов
+
+
+def note_words(rnd, median, sigma=1.0):
+    """Число слов заметки: логнормальное распределение с медианой median"""
+    return min(int(rnd.lognormvariate(0, sigma) * median), median * 20)
+
+
+def make_text(rnd, words):
+    """Текст заметки из words слов в духе шаблонов приложения"""
+    lines = []
+    left = words
+    number = 0
+    while left > 0:
+        size = min(left, rnd.randint(3, 12))
+        chunk = " ".join(rnd.choice(WORDS_EN if rnd.random() < LATIN_SHARE else WORDS_RU)
+                         + (str(rnd.randrange(100)) if rnd.random() < 0.05 else "")
+                         for _ in range(size))
+        kind = rnd.random()
+        if kind < 0.15:
+            lines.append("")
+            lines.append(f"{rnd.choice(HEADERS)} {chunk}")
+            number = 0
+        elif kind < 0.45:
+            lines.append(f"• {chunk}")
+        elif kind < 0.65:
+            number += 1
+            lines.append(f"{number}. {chunk}")
+        else:
+            lines.append(chunk.capitalize() + ".")
+        left -= size
+    return "\n".join(lines)
+
+
+def make_notes(count, median_words=80, seed=42, start_id=0):
+    """count синтетических заметок (Note), новые первыми, как в приложении"""
+    rnd = random.Random(seed)
+    now = int(time.time())
+    notes = []
+    for i in range(count):
+        created = now - rnd.randrange(365 * 24 * 3600)
+        title = f"{rnd.choice(TITLES)} {i}"
+        notes.append(Note(start_id + i, title, make_text(rnd, note_words(rnd, median_words)),
+                          created, created + rnd.randrange(3600)))
+    notes.sort(key=lambda note: note.modified, reverse=True)
+    return notes
+
+
+def make_store(path, notes, storage='journal', **options):
+    """Хранилище с заметками в папке path (и app_settings.json для окна)
+
+    options - параметры open_store (snapshot_format, compression), они
+    же записываются в настройки.
+    """
+    cwd = os.getcwd()
+    os.chdir(path)
+    try:
+        with open('app_settings.json', 'w', encoding='utf-8') as f:
+            json.dump(dict(options, storage=storage), f)
+        store = open_store(storage, **options)
+        store.load()
+        store.reserve_ids(notes)
+        store.save(notes)
+        store.compact(notes, background=False)
+        store.close()
+    finally:
+        os.chdir(cwd)
+
+
+def write_notes_file(path, notes):
+    """Файл заметок для «Открыть» (JSON-массив, как сохраняет приложение)"""
+    with open(path, 'w', encoding='utf-8') as f:
+        json.dump([note.to_dict() for note in notes], f, ensure_ascii=False, indent=2)
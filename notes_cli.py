@@ -0,0 +1,163 @@
+"""Работа с заметками из командной строки, без окна и без tkinter
+
+Примеры:
+    python notes_cli.py search "план"
+    python notes_cli.py export backup.jsonl
+    python notes_cli.py export notes.zip --format html
+    python notes_cli.py import old_notes.json
+    python notes_cli.py stats --json
+    python notes_cli.py compact
+
+Используются те же файлы, что и у окна приложения (в папке --dir);
+хранилище берётся из app_settings.json или задаётся --storage.
+Не запускайте команды, меняющие заметки, пока открыто окно приложения.
+С --storage mmap файлы открываются только для чтения (search, export, stats).
+"""
+import argparse
+import json
+import os
+import sys
+
+from notes_core import NotesLibrary
+from notes_export import FORMATS, export_all
+from notes_io import Progress, read_notes
+from notes_storage import open_store, read_with_fallback
+
+
+def load_settings():
+    """Настройки приложения; при отсутствии или ошибке - пустые"""
+    try:
+        settings, _ = read_with_fallback('app_settings.json', json.load, generations=2)
+    except Exception:
+        return {}
+    return settings or {}
+
+
+def open_library(args):
+    settings = load_settings()
+    store = open_store(args.storage or settings.get('storage', 'journal'),
+                       lazy=settings.get('lazy_load', True),
+                       snapshot_format=settings.get('snapshot_format', 'json'),
+                       compression=settings.get('compression', 'zlib'))
+    library = NotesLibrary(store)
+    library.load()
+    return library
+
+
+def cmd_search(library, args):
+    hits = library.search(args.query, args.limit or None)
+    for hit in hits:
+        print(f"{hit.note.id}\t{hit.score:.2f}\t{hit.note.title}")
+    return 0 if hits else 1
+
+
+def cmd_export(library, args):
+    fmt = args.format
+    if fmt is None:
+        lower = args.path.lower()
+        fmt = 'jsonl' if lower.endswith('.jsonl') else 'json' if lower.endswith('.json') else 'md'
+    if fmt in ('json', 'jsonl'):
+        library.export_file(args.path, jsonl=fmt == 'jsonl')
+        print(f"Сохранено заметок: {len(library.notes)}")
+    else:
+        written, skipped = export_all(library.notes, library.store, args.path, fmt,
+                                      workers=args.workers)
+        print(f"Выгружено заметок: {written}, без изменений: {skipped}")
+    return 0
+
+
+def cmd_import(library, args):
+    # Пачки записываются по мере чтения; при ошибке добавленное убирается
+    previous = list(library.notes)
+    imported = []
+
+    def on_batch(batch):
+        library.import_notes(batch)
+        library.save()
+        imported.extend(batch)
+
+    try:
+        read_notes(args.path, Progress(), on_batch)
+    except BaseException:
+        library.drop_notes(imported)
+        library.save()
+        raise
+    if args.replace:
+        library.drop_notes(previous)
+        library.save()
+    print(f"Загружено заметок: {len(imported)}")
+    return 0
+
+
+def cmd_stats(library, args):
+    stats = library.stats()
+    if args.json:
+        print(json.dumps(stats, ensure_ascii=False))
+    else:
+        print(f"Заметок: {stats['notes']}\nСлов: {stats['words']}\nСимволов: {stats['chars']}")
+    return 0
+
+
+def cmd_compact(library, args):
+    library.compact()
+    print(f"Хранилище сжато, заметок: {len(library.notes)}")
+    return 0
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(prog='notes_cli',
+                                     description="Заметки ZametkaPRO из командной строки")
+    parser.add_argument('--dir', default='.', help="папка с файлами заметок")
+    parser.add_argument('--storage', choices=('journal', 'sqlite', 'mmap'),
+                        help="хранилище (по умолчанию - из app_settings.json; "
+                             "mmap - файлы journal только для чтения)")
+    commands = parser.add_subparsers(dest='command', required=True)
+
+    search = commands.add_parser('search', help="поиск по заголовкам и текстам, лучшие первыми")
+    search.add_argument('query')
+    search.add_argument('--limit', type=int, default=0, help="не больше N результатов")
+    search.set_defaults(run=cmd_search)
+
+    export = commands.add_parser('export', help="сохранение в JSON/JSON Lines или выгрузка файлами")
+    export.add_argument('path', help="файл .json/.jsonl, папка или архив .zip")
+    export.add_argument('--format', choices=('json', 'jsonl') + tuple(FORMATS))
+    export.add_argument('--workers', type=int, default=None,
+                        help="процессов для выгрузки файлами (0 - без пула)")
+    export.set_defaults(run=cmd_export)
+
+    load = commands.add_parser('import', help="загрузка заметок из JSON или JSON Lines")
+    load.add_argument('path')
+    load.add_argument('--replace', action='store_true', help="заменить текущие заметки")
+    load.set_defaults(run=cmd_import)
+
+    stats = commands.add_parser('stats', help="число заметок, слов и символов")
+    stats.add_argument('--json', action='store_true')
+    stats.set_defaults(run=cmd_stats)
+
+    compact = commands.add_parser('compact', help="запись полного снимка и очистка журнала")
+    compact.set_defaults(run=cmd_compact)
+    return parser
+
+
+def main(argv=None):
+    args = build_parser().parse_args(argv)
+    if getattr(args, 'path', None):
+        # Пути файлов export/import - относительно папки вызова, а не --dir
+        args.path = os.path.abspath(args.path)
+    try:
+        os.chdir(args.dir)
+        library = open_library(args)
+    except Exception as e:
+        print(f"Ошибка: не удалось открыть заметки: {e}", file=sys.stderr)
+        return 2
+    try:
+        return args.run(library, args)
+    except Exception as e:
+        print(f"Ошибка: {e}", file=sys.stderr)
+        return 2
+    finally:
+        library.close()
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,361 @@
+import heapq
+from collections import namedtuple
+
+from notes_history import EditHistory
+from notes_index import SearchIndex
+from notes_stats import NoteStats
+from notes_storage import ChangeTracker, ContentCache, atomic_write
+from notes_io import export_records, write_records
+
+
+# Результат поиска: заметка, оценка (больше - лучше) и её слова, совпавшие с запросом
+Hit = namedtuple('Hit', 'note score words')
+
+
+class NotesLibrary:
+    """Заметки без интерфейса: упорядоченный список, поиск и статистика
+
+    Общая часть окна приложения и командной строки (notes_cli). Изменения
+    отмечаются в change_tracker; записывает их вызывающий - окно через
+    поток записи, командная строка через save(). tkinter не используется.
+
+    Индексы после загрузки можно строить по шагам (rebuild_indexes с
+    deferred=True): окно выполняет warmup_step() в свободное время цикла
+    событий, а поиск и статистика при необходимости доводят работу до
+    конца сами. Поисковый индекс по незагруженным текстам окно строит
+    пачками (start_indexing, index_batch, finish_indexing), читая тексты
+    в пуле потоков; пока он строится, поиск отвечает по уже
+    проиндексированной части (search_partial).
+    """
+
+    BATCH = 500  # заметок за один шаг построения индексов
+
+    def __init__(self, store, cache_budget=ContentCache.BUDGET, history_budget=EditHistory.BUDGET):
+        self.store = store
+        self.notes = []
+        self.notes_by_id = {}  # id -> заметка, те же заметки, что и в упорядоченном self.notes
+        self.search_index = SearchIndex()
+        self.search_index_ready = False  # индекс строится при первом поиске
+        self.indexing = False  # индекс строится по шагам прямо сейчас
+        self.index_generation = 0  # меняется при каждом новом построении индекса
+        self.reindexed = set()  # id, переиндексированные во время построения
+        self.warmup = None     # шаги отложенного построения индексов
+        self.note_stats = NoteStats()
+        self.content_cache = ContentCache(store, cache_budget)
+        self.change_tracker = ChangeTracker()
+        self.history = EditHistory(store, self.change_tracker, history_budget)
+
+    def load(self):
+        """Чтение заметок из хранилища (снимок + журнал изменений)"""
+        self.use_loaded(self.store.load())
+
+    def use_loaded(self, notes, deferred=False):
+        """Заметки, прочитанные из хранилища: индексы и ограничение памяти"""
+        self.set_notes(notes)
+        self.rebuild_indexes(deferred)
+        # Тексты, загруженные целиком (первый запуск, записи журнала),
+        # тоже подчиняются ограничению памяти
+        for note in self.notes:
+            if note.loaded:
+                self.content_cache.touch(note)
+
+    def set_notes(self, notes):
+        """Замена всего набора заметок"""
+        self.notes = notes
+        self.notes_by_id = {note.id: note for note in notes}
+
+    def add_note(self, note, front=True):
+        """Добавление заметки в начало (или конец) списка"""
+        if front:
+            self.notes.insert(0, note)
+        else:
+            self.notes.append(note)
+        self.notes_by_id[note.id] = note
+
+    def remove_note(self, note):
+        """Удаление заметки из списка и словаря по id"""
+        del self.notes_by_id[note.id]
+        # id уникальны, поэтому remove не спутает заметку с другой,
+        # совпадающей по содержимому
+        self.notes.remove(note)
+
+    def delete(self, note):
+        """Удаление заметки с отметкой для хранилища и очисткой индексов"""
+        self.remove_note(note)
+        self.change_tracker.mark_deleted(note)
+        self.search_index.remove(note.id)
+        self.note_stats.remove(note.id)
+        self.content_cache.forget(note)
+        self.history.forget(note.id)
+
+    def import_notes(self, notes):
+        """Добавление пачки заметок из файла в конец списка
+
+        Заметки получают новые id из счётчика хранилища: id из файла могут
+        совпасть с существующими или удалёнными. Файл читается пачками, и
+        вызывающий записывает каждую сразу, не копя весь файл в памяти.
+        Замена всех заметок - drop_notes(прежние) после последней пачки,
+        откат отменённой загрузки - drop_notes(добавленные).
+        """
+        for note in notes:
+            note.id = self.store.allocate_id()
+            self.add_note(note, front=False)
+            self.change_tracker.mark(note)
+            self.reindex_note(note)
+            self.content_cache.touch(note)
+
+    def drop_notes(self, notes):
+        """Удаление многих заметок разом, за один проход по списку"""
+        ids = {note.id for note in notes}
+        self.set_notes([note for note in self.notes if note.id not in ids])
+        for note in notes:
+            self.change_tracker.mark_deleted(note)
+            self.search_index.remove(note.id)
+            self.note_stats.remove(note.id)
+            self.content_cache.forget(note)
+            self.history.forget(note.id)
+
+    def export_file(self, path, notes=None, progress=None, jsonl=None):
+        """Запись заметок в JSON (или JSON Lines для .jsonl) потоково
+
+        notes - по умолчанию все; окно передаёт копии, чтобы заметки можно
+        было править во время записи.
+        """
+        if notes is None:
+            notes = self.notes
+        if jsonl is None:
+            jsonl = path.lower().endswith('.jsonl')
+        if progress is not None:
+            progress.total = len(notes)
+        atomic_write(path, lambda f: write_records(
+            f, export_records(notes, self.store, progress), jsonl))
+
+    def record_edit(self, note, old_title, old_content):
+        """Правка уже внесена в заметку: время, индексы, отметка и история"""
+        note.touch()
+        self.reindex_note(note)
+        self.change_tracker.mark(note)
+        self.history.record(note, old_title, old_content)
+
+    def undo(self, note):
+        """Отмена последней правки заметки
+
+        Возвращает notes_history.Splice - изменённый участок текста (его
+        же окно заменяет в поле редактора) - или None.
+        """
+        return self._apply_history(note, self.history.undo)
+
+    def redo(self, note):
+        """Повтор отменённой правки заметки; Splice или None"""
+        return self._apply_history(note, self.history.redo)
+
+    def _apply_history(self, note, step):
+        self.store.load_content(note)
+        splice = step(note)
+        if splice is not None:
+            note.touch()
+            self.reindex_note(note)
+            self.change_tracker.mark(note)
+        return splice
+
+    def reindex_note(self, note):
+        """Обновление поискового индекса и статистики одной заметки"""
+        if (self.search_index_ready or self.indexing) and not self.store.full_text_search:
+            self.search_index.update(note.id, note.title, note.content)
+            if self.indexing:
+                # Пачка с этой заметкой могла быть прочитана до правки
+                self.reindexed.add(note.id)
+        self.note_stats.set(note.id, note.words, note.chars)
+
+    def rebuild_indexes(self, deferred=False):
+        """Полное построение поискового индекса и статистики
+
+        Если тексты загружены не все, индекс в шаги не входит, чтобы
+        запуск не читал всё хранилище: его строит окно в фоне
+        (start_indexing) или первый поиск. Поиском в SQLite занимается
+        само хранилище. При deferred=True работа только планируется и
+        выполняется шагами warmup_step().
+        """
+        self.search_index.clear()
+        self.search_index_ready = False
+        self.indexing = False
+        self.index_generation += 1
+        self.note_stats.clear()
+        notes = list(self.notes)
+        steps = [self._stats_steps(notes)]
+        if (not self.store.full_text_search and
+                all(note.loaded for note in notes)):
+            steps.append(self._index_steps(notes))
+        self.warmup = (step for part in steps for step in part)
+        if not deferred:
+            self.finish_warmup()
+
+    def warmup_step(self):
+        """Один шаг отложенного построения индексов; False - работа закончена"""
+        if self.warmup is None:
+            return False
+        if next(self.warmup, StopIteration) is StopIteration:
+            self.warmup = None
+            return False
+        return True
+
+    def finish_warmup(self):
+        while self.warmup_step():
+            pass
+
+    def _stats_steps(self, notes):
+        for start in range(0, len(notes), self.BATCH):
+            for note in notes[start:start + self.BATCH]:
+                self.note_stats.set(note.id, note.words, note.chars)
+            yield
+
+    def _index_steps(self, notes):
+        """Построение индекса пачками в том же потоке
+
+        Незагруженные тексты читаются из хранилища и в памяти заметок не
+        остаются.
+        """
+        for batch in self.start_indexing(notes):
+            self.index_batch(batch, self.store.read_contents(batch))
+            yield
+        self.finish_indexing()
+
+    def needs_search_index(self):
+        """Нужно ли строить поисковый индекс (он не построен и не строится)"""
+        return (not self.search_index_ready and not self.indexing and
+                not self.store.full_text_search)
+
+    def start_indexing(self, notes=None):
+        """Начало построения индекса: пачки заметок по BATCH
+
+        Тексты пачки читает вызывающий (store.read_contents, можно в пуле
+        потоков) и передаёт в index_batch. Заметки, изменённые по ходу,
+        обновляет reindex_note.
+        """
+        if notes is None:
+            notes = list(self.notes)
+        self.search_index.clear()
+        self.search_index_ready = False
+        self.indexing = True
+        self.index_generation += 1
+        self.reindexed = set()
+        return [notes[start:start + self.BATCH] for start in range(0, len(notes), self.BATCH)]
+
+    def index_batch(self, batch, contents):
+        """Добавление пачки в индекс; contents - тексты незагруженных заметок пачки"""
+        for note in batch:
+            if note.id in self.reindexed or self.notes_by_id.get(note.id) is not note:
+                # Заметка уже переиндексирована после правки или удалена
+                continue
+            if note.loaded:
+                content = note.content
+            elif note.id in contents:
+                content = contents[note.id]
+            else:
+                # Текст был загружен при чтении пачки и с тех пор выгружен
+                content = self.store.read_contents([note])[note.id]
+            self.search_index.update(note.id, note.title, content)
+
+    def finish_indexing(self):
+        self.indexing = False
+        self.search_index_ready = True
+        self.reindexed = set()
+
+    def cancel_indexing(self):
+        """Прерванное построение: индекс построит первый поиск"""
+        self.search_index.clear()
+        self.indexing = False
+        self.index_generation += 1
+        self.reindexed = set()
+
+    def ensure_search_index(self):
+        """Построение поискового индекса, если он ещё не построен"""
+        if self.search_index_ready:
+            return
+        self.finish_warmup()
+        if not self.search_index_ready:
+            for _ in self._index_steps(list(self.notes)):
+                pass
+
+    def search(self, query, limit=None):
+        """Заметки по запросу, лучшие первыми: список Hit
+
+        С SQLite ранжирует FTS5 (bm25), иначе - поисковый индекс (BM25 с
+        опечатками, см. SearchIndex.rank). limit - сколько лучших вернуть.
+        Пока индекс строится, результат неполный (search_partial).
+        """
+        found = self.store.search(query)
+        if found is not None:
+            return self.store_hits(query, found, limit)
+
+        if not self.indexing:
+            self.ensure_search_index()
+        # Пока индекс строится в фоне, ответ - по уже проиндексированной
+        # части (search_partial), без чтения остальных текстов
+        ranked = self.search_index.rank(query, limit)
+        if ranked is None:
+            # В запросе нет ни букв, ни цифр: поиск подстроки по всем заметкам
+            return [Hit(note, 0.0, frozenset()) for note in self.substring_search(query, limit)]
+        # Удалённая во время построения индекса заметка могла в нём остаться
+        return [Hit(self.notes_by_id[key], score, words)
+                for score, key, words in ranked if key in self.notes_by_id]
+
+    @property
+    def search_partial(self):
+        """Поиск по индексу сейчас видит не все заметки: индекс ещё строится"""
+        return self.indexing
+
+    def store_hits(self, query, found, limit=None):
+        """Hit по результату store.search(query) - {id: оценка}
+
+        Отдельно от search, чтобы окно могло выполнить store.search в
+        пуле потоков. У открытых заметок текст мог измениться после
+        последнего сохранения, их проверяем напрямую.
+        """
+        terms = query.lower().split()
+        hits = []
+        for note in self.notes:
+            if note.loaded:
+                content = note.content.lower()
+                if all(term in note.title_lower or term in content for term in terms):
+                    hits.append(Hit(note, found.get(note.id, 0.0), frozenset()))
+            elif note.id in found:
+                hits.append(Hit(note, found[note.id], frozenset()))
+        if limit:
+            return heapq.nlargest(limit, hits, key=lambda hit: hit.score)
+        return sorted(hits, key=lambda hit: hit.score, reverse=True)
+
+    def substring_search(self, query, limit=None):
+        """Заметки с подстрокой query в заголовке или тексте, в порядке списка
+
+        С limit просмотр останавливается на limit-й найденной заметке.
+        """
+        query = query.lower()
+        found = []
+        for start in range(0, len(self.notes), self.BATCH):
+            batch = self.notes[start:start + self.BATCH]
+            contents = self.store.read_contents(batch)
+            found.extend(note for note in batch
+                         if query in note.title_lower or
+                         query in (note.content if note.loaded else contents[note.id]).lower())
+            if limit and len(found) >= limit:
+                return found[:limit]
+        return found
+
+    def stats(self):
+        """Число заметок, слов и символов"""
+        self.finish_warmup()
+        return {'notes': len(self.notes),
+                'words': self.note_stats.total_words,
+                'chars': self.note_stats.total_chars}
+
+    def save(self):
+        """Синхронная запись отмеченных изменений; возвращает число записей"""
+        return self.change_tracker.flush(self.store, self.notes)
+
+    def compact(self):
+        """Запись изменений и полный снимок хранилища (сжатие журнала)"""
+        self.change_tracker.apply(self.store, self.change_tracker.snapshot(self.notes, compact=True))
+
+    def close(self):
+        self.store.close()
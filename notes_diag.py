@@ -0,0 +1,166 @@
+import functools
+import io
+import json
+import time
+from collections import deque
+
+
+# Границы корзин гистограмм, мс (последняя корзина - всё, что дольше)
+BUCKETS_MS = (1, 2, 5, 10, 20, 50, 100, 200, 500, 1000)
+BARS = " ▁▂▃▄▅▆▇█"
+
+
+class Histogram:
+    """Скользящая гистограмма длительностей: последние WINDOW замеров"""
+
+    WINDOW = 1000
+
+    def __init__(self, window=WINDOW):
+        self.samples = deque(maxlen=window)
+        self.count = 0  # всего замеров, включая вытесненные из окна
+
+    def add(self, ms):
+        self.samples.append(ms)
+        self.count += 1
+
+    def buckets(self):
+        """Число замеров окна в каждой корзине BUCKETS_MS (+ корзина «дольше»)"""
+        counts = [0] * (len(BUCKETS_MS) + 1)
+        for ms in self.samples:
+            for i, edge in enumerate(BUCKETS_MS):
+                if ms < edge:
+                    break
+            else:
+                i = len(BUCKETS_MS)
+            counts[i] += 1
+        return counts
+
+    def summary(self):
+        """Сводка окна: число, медиана, 95-й процентиль, максимум, корзины"""
+        ordered = sorted(self.samples)
+        if not ordered:
+            return {'count': self.count, 'window': 0, 'median_ms': 0.0,
+                    'p95_ms': 0.0, 'max_ms': 0.0, 'buckets': self.buckets()}
+        return {'count': self.count,
+                'window': len(ordered),
+                'median_ms': ordered[len(ordered) // 2],
+                'p95_ms': ordered[min(len(ordered) - 1, int(len(ordered) * 0.95))],
+                'max_ms': ordered[-1],
+                'buckets': self.buckets()}
+
+    def bars(self):
+        """Гистограмма одной строкой символов ▁..█"""
+        counts = self.buckets()
+        top = max(counts) or 1
+        return "".join(BARS[(count * (len(BARS) - 1) + top - 1) // top] for count in counts)
+
+
+class Diagnostics:
+    """Замеры горячих путей интерфейса, задержка цикла событий и профиль
+
+    Обработчики, помеченные @traced, пишут длительность в гистограмму со
+    своим именем, пока enabled. Задержку цикла событий Tk измеряет
+    heartbeat: вызов через root.after каждые HEARTBEAT_MS и запись того,
+    насколько он опоздал. cProfile включается отдельно (start_profile) и
+    профилирует только поток интерфейса.
+    """
+
+    HEARTBEAT_MS = 100
+    LOOP_LAG = 'event_loop_lag'
+    PROFILE_TOP = 40  # функций профиля в выгрузке
+
+    def __init__(self, root=None, enabled=False):
+        self.root = root
+        self.enabled = False
+        self.spans = {}  # имя -> Histogram
+        self.heartbeat_job = None
+        self.expected = None
+        self.profiler = None
+        self.profile = None  # последний снятый профиль: список функций
+        if enabled:
+            self.enable()
+
+    def enable(self):
+        self.enabled = True
+        if self.root is not None and self.heartbeat_job is None:
+            self._schedule_heartbeat()
+
+    def disable(self):
+        self.enabled = False
+        if self.heartbeat_job is not None:
+            self.root.after_cancel(self.heartbeat_job)
+            self.heartbeat_job = None
+
+    def record(self, name, ms):
+        histogram = self.spans.get(name)
+        if histogram is None:
+            histogram = self.spans[name] = Histogram()
+        histogram.add(ms)
+
+    def _schedule_heartbeat(self):
+        self.expected = time.perf_counter() + self.HEARTBEAT_MS / 1000
+        self.heartbeat_job = self.root.after(self.HEARTBEAT_MS, self._heartbeat)
+
+    def _heartbeat(self):
+        self.record(self.LOOP_LAG, max(0.0, (time.perf_counter() - self.expected) * 1000))
+        self._schedule_heartbeat()
+
+    @property
+    def profiling(self):
+        return self.profiler is not None
+
+    def start_profile(self):
+        import cProfile
+
+        if self.profiler is None:
+            self.profiler = cProfile.Profile()
+            self.profiler.enable()
+
+    def stop_profile(self):
+        """Остановка профиля; возвращает самые дорогие функции (по общему времени)"""
+        if self.profiler is None:
+            return self.profile
+        self.profiler.disable()
+        import pstats
+
+        stats = pstats.Stats(self.profiler, stream=io.StringIO())
+        self.profiler = None
+        rows = []
+        for (filename, line, function), (_, calls, own, total, _) in stats.stats.items():
+            rows.append({'function': f"{filename}:{line}({function})", 'calls': calls,
+                         'own_ms': own * 1000, 'total_ms': total * 1000})
+        rows.sort(key=lambda row: row['total_ms'], reverse=True)
+        self.profile = rows[:self.PROFILE_TOP]
+        return self.profile
+
+    def snapshot(self):
+        """Все данные для выгрузки в JSON (снимаются в потоке интерфейса)"""
+        return {'date': time.strftime('%Y-%m-%dT%H:%M:%S'),
+                'buckets_ms': list(BUCKETS_MS),
+                'spans': {name: dict(histogram.summary(), samples=list(histogram.samples))
+                          for name, histogram in sorted(self.spans.items())},
+                'profile': self.profile}
+
+
+def write_snapshot(path, snapshot):
+    """Запись снимка диагностики в JSON"""
+    with open(path, 'w', encoding='utf-8') as f:
+        json.dump(snapshot, f, ensure_ascii=False, indent=2)
+
+
+def traced(method):
+    """Замер длительности метода в self.diag под именем метода"""
+    name = method.__name__
+
+    @functools.wraps(method)
+    def wrapper(self, *args, **kwargs):
+        diag = self.diag
+        if not diag.enabled:
+            return method(self, *args, **kwargs)
+        started = time.perf_counter()
+        try:
+            return method(self, *args, **kwargs)
+        finally:
+            diag.record(name, (time.perf_counter() - started) * 1000)
+
+    return wrapper
@@ -0,0 +1,303 @@
+import copy
+import html
+import json
+import os
+import re
+import struct
+import unicodedata
+import zipfile
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+
+from notes_model import format_time
+from notes_storage import atomic_write
+
+
+FORMATS = {'md': '.md', 'txt': '.txt', 'html': '.html'}
+MANIFEST = '.notes_export.json'
+MANIFEST_VERSION = 1
+BATCH = 200          # заметок в одной задаче процесса
+MAX_NAME = 100       # символов в имени файла без расширения
+UNTITLED = 'Без названия'
+
+_UNSAFE = re.compile(r'[<>:"/\\|?*\x00-\x1f]')
+_RESERVED = {'CON', 'PRN', 'AUX', 'NUL'} | {f'{p}{i}' for p in ('COM', 'LPT') for i in range(1, 10)}
+
+_HTML = """<!DOCTYPE html>
+<html lang="ru">
+<head>
+<meta charset="utf-8">
+<title>{title}</title>
+</head>
+<body>
+<h1>{title}</h1>
+<p>Создано: {created}<br>
+Изменено: {modified}</p>
+<hr>
+<pre>{content}</pre>
+</body>
+</html>
+"""
+
+
+def render_note(title, content, created, modified, fmt='txt'):
+    """Текст заметки для файла: заголовок, время создания и изменения, текст
+
+    txt и md - одинаковая разметка с заголовком «# ...», html -
+    отдельная страница.
+    """
+    if fmt == 'html':
+        return _HTML.format(title=html.escape(title), content=html.escape(content),
+                            created=format_time(created), modified=format_time(modified))
+    return (f"# {title}\n\n"
+            f"Создано: {format_time(created)}\n"
+            f"Изменено: {format_time(modified)}\n\n"
+            "---\n\n" + content)
+
+
+def render_batch(items, fmt):
+    """Отрисовка пачки (title, content, created, modified); выполняется в процессе пула"""
+    return [render_note(*item, fmt=fmt) for item in items]
+
+
+def safe_filename(title):
+    """Имя файла из заголовка, одинаковое на любой платформе
+
+    Запрещённые в Windows символы заменяются на «_», пробелы схлопываются,
+    точки и пробелы по краям убираются, зарезервированные имена получают
+    «_» в начале, длина ограничена MAX_NAME.
+    """
+    name = unicodedata.normalize('NFC', title)
+    name = _UNSAFE.sub('_', name)
+    name = ' '.join(name.split())[:MAX_NAME].strip(' .')
+    if not name:
+        return UNTITLED
+    if name.split('.')[0].upper() in _RESERVED:
+        name = '_' + name
+    return name
+
+
+def unique_name(base, extension, used):
+    """Первое свободное имя «base», «base (2)», ... без учёта регистра; занимает его в used"""
+    name = base + extension
+    number = 1
+    while name.lower() in used:
+        number += 1
+        name = f"{base} ({number}){extension}"
+    used.add(name.lower())
+    return name
+
+
+def assign_names(notes, extension, previous):
+    """Имена файлов для заметок: id -> имя
+
+    Заметка с тем же заголовком, что при прошлой выгрузке, сохраняет своё
+    имя; остальные получают новые в порядке id, поэтому результат не
+    зависит от порядка заметок в списке.
+    """
+    names = {}
+    used = set()
+    ordered = sorted(notes, key=lambda note: note.id)
+    for note in ordered:
+        entry = previous.get(str(note.id))
+        if (entry is not None and entry['title'] == note.title and
+                entry['name'].endswith(extension) and entry['name'].lower() not in used):
+            names[note.id] = entry['name']
+            used.add(entry['name'].lower())
+    for note in ordered:
+        if note.id not in names:
+            names[note.id] = unique_name(safe_filename(note.title), extension, used)
+    return names
+
+
+def _rendered(jobs, fmt, workers):
+    """Отрисованные пачки в исходном порядке
+
+    jobs - пары (данные для вызывающего, пачка для render_batch). В работе
+    одновременно не больше двух пачек на процесс, так что в памяти не
+    оказывается вся выгрузка. workers=0 - отрисовка в этом же процессе.
+    """
+    if workers == 0:
+        for key, items in jobs:
+            yield key, render_batch(items, fmt)
+        return
+    pool = ProcessPoolExecutor(max_workers=workers)
+    try:
+        pending = deque()
+        for key, items in jobs:
+            pending.append((key, pool.submit(render_batch, items, fmt)))
+            if len(pending) > workers * 2:
+                key, future = pending.popleft()
+                yield key, future.result()
+        while pending:
+            key, future = pending.popleft()
+            yield key, future.result()
+    finally:
+        pool.shutdown(wait=True, cancel_futures=True)
+
+
+def _jobs(notes, store, progress, batch=BATCH):
+    """Пачки заметок с текстами; незагруженные тексты читаются из хранилища"""
+    for start in range(0, len(notes), batch):
+        if progress is not None:
+            progress.check()
+        chunk = notes[start:start + batch]
+        contents = store.read_contents([note for note in chunk if not note.loaded])
+        items = [(note.title, note.content if note.loaded else contents.get(note.id, ''),
+                  note.created, note.modified) for note in chunk]
+        yield chunk, items
+
+
+def _read_manifest(text, fmt):
+    try:
+        manifest = json.loads(text)
+    except ValueError:
+        return {}
+    if manifest.get('version') != MANIFEST_VERSION or manifest.get('format') != fmt:
+        return {}
+    return manifest.get('notes', {})
+
+
+def _manifest(fmt, notes, names):
+    return json.dumps({'version': MANIFEST_VERSION, 'format': fmt,
+                       'notes': {str(note.id): {'name': names[note.id], 'title': note.title,
+                                                'modified': note.modified}
+                                 for note in notes}},
+                      ensure_ascii=False, indent=2)
+
+
+def _unchanged(note, entry, name):
+    return (entry is not None and entry['name'] == name and
+            entry['modified'] == note.modified)
+
+
+def export_all(notes, store, target, fmt='md', progress=None, workers=None):
+    """Выгрузка всех заметок в папку или zip-архив (target с расширением .zip)
+
+    Рядом с файлами (или внутри архива) хранится манифест MANIFEST:
+    имя файла, заголовок и время изменения каждой заметки. При повторной
+    выгрузке в то же место заново отрисовываются только изменённые
+    заметки: в папке остальные файлы не трогаются, в архив их сжатые
+    данные копируются из прошлого архива без повторного сжатия. Файлы
+    удалённых заметок убираются.
+    Отрисовка идёт в пуле процессов (workers=None - по числу ядер).
+    Возвращает (записано, без изменений).
+    """
+    extension = FORMATS[fmt]
+    if workers is None:
+        workers = os.cpu_count() or 1
+    if progress is not None:
+        progress.total = len(notes)
+    if target.lower().endswith('.zip'):
+        return _export_zip(notes, store, target, fmt, extension, progress, workers)
+    return _export_dir(notes, store, target, fmt, extension, progress, workers)
+
+
+def _export_dir(notes, store, target, fmt, extension, progress, workers):
+    os.makedirs(target, exist_ok=True)
+    manifest_path = os.path.join(target, MANIFEST)
+    previous = {}
+    if os.path.exists(manifest_path):
+        with open(manifest_path, 'r', encoding='utf-8') as f:
+            previous = _read_manifest(f.read(), fmt)
+    names = assign_names(notes, extension, previous)
+
+    changed = [note for note in notes
+               if not (_unchanged(note, previous.get(str(note.id)), names[note.id]) and
+                       os.path.exists(os.path.join(target, names[note.id])))]
+    skipped = len(notes) - len(changed)
+    if progress is not None:
+        progress.advance(skipped)
+
+    # Файлы удалённых и переименованных заметок
+    current = {name.lower() for name in names.values()}
+    for entry in previous.values():
+        if entry['name'].lower() not in current:
+            try:
+                os.remove(os.path.join(target, entry['name']))
+            except OSError:
+                pass
+
+    written = []
+    try:
+        for chunk, texts in _rendered(_jobs(changed, store, progress), fmt, workers):
+            for note, text in zip(chunk, texts):
+                with open(os.path.join(target, names[note.id]), 'w', encoding='utf-8') as f:
+                    f.write(text)
+            written.extend(chunk)
+            if progress is not None:
+                progress.advance(len(chunk))
+    finally:
+        # Манифест и при отмене: записанное не придётся повторять
+        done = {note.id for note in written}
+        kept = [note for note in notes if note.id in done or
+                _unchanged(note, previous.get(str(note.id)), names[note.id])]
+        atomic_write(manifest_path, lambda f: f.write(_manifest(fmt, kept, names)))
+    return len(written), skipped
+
+
+def _copy_member(source, archive, name):
+    """Перенос записи из прошлого архива без распаковки и повторного сжатия
+
+    Открытого способа скопировать сжатые байты у zipfile нет: локальный
+    заголовок пишется так же, как это делает ZipFile.writestr, а данные
+    берутся из прошлого архива как есть.
+    """
+    info = source.getinfo(name)
+    source.fp.seek(info.header_offset)
+    header = struct.unpack(zipfile.structFileHeader, source.fp.read(zipfile.sizeFileHeader))
+    # За заголовком - имя и дополнительные поля (длины - два последних поля)
+    source.fp.seek(header[-2] + header[-1], os.SEEK_CUR)
+    data = source.fp.read(info.compress_size)
+    entry = copy.copy(info)
+    # Размеры и CRC известны: пишем их в заголовок, без дескриптора после данных
+    entry.flag_bits &= ~0x08
+    entry.header_offset = archive.fp.tell()
+    archive.fp.write(entry.FileHeader())
+    archive.fp.write(data)
+    archive.filelist.append(entry)
+    archive.NameToInfo[name] = entry
+    archive.start_dir = archive.fp.tell()
+    archive._didModify = True
+
+
+def _export_zip(notes, store, target, fmt, extension, progress, workers):
+    previous = {}
+    old = None
+    if os.path.exists(target):
+        try:
+            old = zipfile.ZipFile(target)
+            previous = _read_manifest(old.read(MANIFEST).decode('utf-8'), fmt)
+        except (zipfile.BadZipFile, KeyError, OSError):
+            previous = {}
+    try:
+        names = assign_names(notes, extension, previous)
+        old_names = set(old.namelist()) if old is not None else set()
+        copied = [note for note in notes
+                  if _unchanged(note, previous.get(str(note.id)), names[note.id]) and
+                  names[note.id] in old_names]
+        copied_ids = {note.id for note in copied}
+        changed = [note for note in notes if note.id not in copied_ids]
+
+        def write(f):
+            with zipfile.ZipFile(f, 'w', zipfile.ZIP_DEFLATED) as archive:
+                for note in copied:
+                    if progress is not None:
+                        progress.check()
+                    _copy_member(old, archive, names[note.id])
+                    if progress is not None:
+                        progress.advance(1)
+                for chunk, texts in _rendered(_jobs(changed, store, progress), fmt, workers):
+                    for note, text in zip(chunk, texts):
+                        archive.writestr(names[note.id], text)
+                    if progress is not None:
+                        progress.advance(len(chunk))
+                archive.writestr(MANIFEST, _manifest(fmt, notes, names))
+            if old is not None:
+                old.close()  # Иначе в Windows прошлый архив нельзя заменить
+
+        atomic_write(target, write, encoding=None)
+    finally:
+        if old is not None:
+            old.close()
+    return len(changed), len(copied)
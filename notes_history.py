@@ -0,0 +1,263 @@
+import time
+from collections import OrderedDict, namedtuple
+
+
+CHUNK = 4096  # символов, сравниваемых за раз при поиске общего начала и конца
+
+# Применение шага к тексту: участок [start, end) заменяется на text
+Splice = namedtuple('Splice', 'start end text')
+
+
+def _common_prefix(a, b):
+    """Длина общего начала строк: сравнение кусками, затем посимвольно"""
+    limit = min(len(a), len(b))
+    i = 0
+    while i + CHUNK <= limit and a[i:i + CHUNK] == b[i:i + CHUNK]:
+        i += CHUNK
+    while i < limit and a[i] == b[i]:
+        i += 1
+    return i
+
+
+def _common_suffix(a, b, limit):
+    """Длина общего конца строк, не больше limit"""
+    i = 0
+    while i + CHUNK <= limit and a[len(a) - i - CHUNK:len(a) - i] == b[len(b) - i - CHUNK:len(b) - i]:
+        i += CHUNK
+    while i < limit and a[len(a) - i - 1] == b[len(b) - i - 1]:
+        i += 1
+    return i
+
+
+def diff(old, new):
+    """Правка old -> new одним участком: (начало, удалённое, вставленное)"""
+    start = _common_prefix(old, new)
+    end = _common_suffix(old, new, min(len(old), len(new)) - start)
+    return start, old[start:len(old) - end], new[start:len(new) - end]
+
+
+class Step:
+    """Шаг истории: участок текста и, если менялся, заголовок до и после"""
+
+    __slots__ = ('start', 'removed', 'inserted', 'old_title', 'new_title', 'time')
+
+    def __init__(self, start, removed, inserted, old_title=None, new_title=None, when=None):
+        self.start = start
+        self.removed = removed
+        self.inserted = inserted
+        self.old_title = old_title
+        self.new_title = new_title
+        self.time = time.time() if when is None else when
+
+    @property
+    def size(self):
+        """Символов в шаге - для ограничения памяти"""
+        return (len(self.removed) + len(self.inserted) +
+                len(self.old_title or '') + len(self.new_title or ''))
+
+    def to_list(self):
+        return [self.start, self.removed, self.inserted, self.old_title, self.new_title,
+                self.time]
+
+    @classmethod
+    def from_list(cls, data):
+        return cls(*data)
+
+
+class NoteHistory:
+    """История правок одной заметки: стопки шагов отмены и повтора
+
+    Шаг хранит только изменённый участок, а не копию текста, и
+    применяется без пересчёта остальной истории. Если текст заметки
+    разошёлся с историей (правка в обход неё), шаг не применяется.
+    """
+
+    MAX_STEPS = 500
+    COALESCE_SECONDS = 2.0  # ввод подряд в пределах этой паузы - один шаг
+
+    def __init__(self, undo=(), redo=()):
+        self.undo_steps = list(undo)
+        self.redo_steps = list(redo)
+        self.size = sum(step.size for step in self.undo_steps + self.redo_steps)
+
+    def record(self, old_title, old_content, new_title, new_content, when=None):
+        """Запись правки; возвращает False, если ничего не изменилось"""
+        start, removed, inserted = diff(old_content, new_content)
+        title_changed = old_title != new_title
+        if not removed and not inserted and not title_changed:
+            return False
+        step = Step(start, removed, inserted,
+                    old_title if title_changed else None,
+                    new_title if title_changed else None, when)
+        for dropped in self.redo_steps:
+            self.size -= dropped.size
+        self.redo_steps = []
+        if not self._coalesce(step):
+            self.undo_steps.append(step)
+            self.size += step.size
+        while len(self.undo_steps) > self.MAX_STEPS:
+            self.size -= self.undo_steps.pop(0).size
+        return True
+
+    def _coalesce(self, step):
+        """Слияние с предыдущим шагом: продолжение ввода или удаления подряд"""
+        if not self.undo_steps or step.old_title is not None:
+            return False
+        last = self.undo_steps[-1]
+        if last.old_title is not None or step.time - last.time > self.COALESCE_SECONDS:
+            return False
+        if (not last.removed and not step.removed and
+                step.start == last.start + len(last.inserted)):
+            # Ввод продолжает предыдущий ввод
+            last.inserted += step.inserted
+        elif (not last.inserted and not step.inserted and
+                step.start + len(step.removed) == last.start):
+            # Удаление назад (Backspace) подряд
+            last.start = step.start
+            last.removed = step.removed + last.removed
+        else:
+            return False
+        last.time = step.time
+        self.size += step.size
+        return True
+
+    def drop_oldest(self):
+        """Удаление самого старого шага (при нехватке памяти); False, если шагов нет"""
+        steps = self.undo_steps or self.redo_steps
+        if not steps:
+            return False
+        self.size -= steps.pop(0).size
+        return True
+
+    def undo(self, title, content):
+        """(заголовок, Splice) для отмены шага или None
+
+        Проверяется только участок шага, текст целиком не пересобирается.
+        """
+        if not self.undo_steps:
+            return None
+        step = self.undo_steps[-1]
+        end = step.start + len(step.inserted)
+        if end > len(content) or content[step.start:end] != step.inserted:
+            self.clear()
+            return None
+        self.redo_steps.append(self.undo_steps.pop())
+        return (step.old_title if step.old_title is not None else title,
+                Splice(step.start, end, step.removed))
+
+    def redo(self, title, content):
+        """(заголовок, Splice) для повтора шага или None"""
+        if not self.redo_steps:
+            return None
+        step = self.redo_steps[-1]
+        end = step.start + len(step.removed)
+        if end > len(content) or content[step.start:end] != step.removed:
+            self.clear()
+            return None
+        self.undo_steps.append(self.redo_steps.pop())
+        return (step.new_title if step.new_title is not None else title,
+                Splice(step.start, end, step.inserted))
+
+    def clear(self):
+        self.undo_steps = []
+        self.redo_steps = []
+        self.size = 0
+
+    def to_dict(self):
+        return {'undo': [step.to_list() for step in self.undo_steps],
+                'redo': [step.to_list() for step in self.redo_steps]}
+
+    @classmethod
+    def from_dict(cls, data):
+        return cls([Step.from_list(item) for item in data.get('undo', ())],
+                   [Step.from_list(item) for item in data.get('redo', ())])
+
+
+class EditHistory:
+    """Истории правок заметок с ограничением памяти
+
+    Истории читаются из хранилища при первом обращении и держатся в
+    памяти в порядке использования; при превышении budget (символов в
+    шагах) вытесняются истории давно не редактированных заметок - они
+    остаются в хранилище. Изменённые истории отмечаются в change_tracker
+    и записываются вместе с заметками.
+    """
+
+    BUDGET = 2_000_000
+
+    def __init__(self, store, change_tracker, budget=BUDGET):
+        self.store = store
+        self.change_tracker = change_tracker
+        self.budget = budget
+        self.histories = OrderedDict()  # id -> NoteHistory, давно не используемые первыми
+        self.size = 0
+
+    def get(self, note_id):
+        history = self.histories.get(note_id)
+        if history is None:
+            data = self.store.load_history(note_id)
+            history = NoteHistory.from_dict(data) if data else NoteHistory()
+            self.histories[note_id] = history
+            self.size += history.size
+        else:
+            self.histories.move_to_end(note_id)
+        return history
+
+    def _changed(self, note_id, history, size_before):
+        self.size += history.size - size_before
+        self.change_tracker.mark_history(note_id, history)
+        self.trim(keep=note_id)
+
+    def record(self, note, old_title, old_content):
+        """Запись правки заметки (текущие заголовок и текст - уже новые)"""
+        history = self.get(note.id)
+        size_before = history.size
+        if history.record(old_title, old_content, note.title, note.content):
+            self._changed(note.id, history, size_before)
+
+    def undo(self, note):
+        """Отмена последней правки в заметке; применённый Splice или None"""
+        return self._step(note, NoteHistory.undo)
+
+    def redo(self, note):
+        """Повтор отменённой правки; применённый Splice или None"""
+        return self._step(note, NoteHistory.redo)
+
+    def _step(self, note, action):
+        history = self.get(note.id)
+        size_before = history.size
+        result = action(history, note.title, note.content)
+        if result is not None or history.size != size_before:
+            self._changed(note.id, history, size_before)
+        if result is None:
+            return None
+        note.title, splice = result
+        content = note.content
+        note.content = content[:splice.start] + splice.text + content[splice.end:]
+        return splice
+
+    def forget(self, note_id):
+        """Удаление истории вместе с заметкой"""
+        history = self.histories.pop(note_id, None)
+        if history is not None:
+            self.size -= history.size
+        self.change_tracker.mark_history(note_id, None)
+
+    def trim(self, keep=None):
+        """Вытеснение историй сверх бюджета, давно не использованные первыми
+
+        Незаписанные истории не вытесняются; история keep (текущей
+        заметки) при нехватке теряет самые старые шаги.
+        """
+        for note_id in list(self.histories):
+            if self.size <= self.budget:
+                return
+            if note_id == keep or self.change_tracker.history_pending(note_id):
+                continue
+            self.size -= self.histories.pop(note_id).size
+        history = self.histories.get(keep)
+        while self.size > self.budget and history is not None:
+            size_before = history.size
+            if not history.drop_oldest():
+                break
+            self.size -= size_before - history.size
@@ -0,0 +1,278 @@
+import heapq
+import math
+import re
+from collections import Counter, defaultdict
+
+
+TOKEN_RE = re.compile(r'\w+')
+
+# Ранжирование BM25: заголовок считается как TITLE_BOOST вхождений слова
+K1 = 1.2
+B = 0.75
+TITLE_BOOST = 3
+
+# Вес совпадения слова запроса со словом заметки
+EXACT_WEIGHT = 1.0
+PREFIX_WEIGHT = 0.8
+INFIX_WEIGHT = 0.5
+FUZZY_WEIGHT = 0.4
+FUZZY_MIN = 4          # слова запроса короче не ищутся с опечатками
+MAX_FUZZY = 50         # слов с опечаткой на одно слово запроса
+
+SNIPPET_WIDTH = 90
+
+
+def tokenize(text):
+    """Разбиение текста на слова в нижнем регистре"""
+    return TOKEN_RE.findall(text.lower())
+
+
+def trigrams(text):
+    """Множество триграмм строки (строка уже в нижнем регистре)"""
+    return {text[i:i + 3] for i in range(len(text) - 2)}
+
+
+def edit_distance(a, b, limit):
+    """Число правок (вставка, удаление, замена, перестановка соседних букв)
+
+    Если оно больше limit, возвращается limit + 1.
+    """
+    if abs(len(a) - len(b)) > limit:
+        return limit + 1
+    before, previous = None, list(range(len(b) + 1))
+    for i, char_a in enumerate(a, 1):
+        current = [i]
+        for j, char_b in enumerate(b, 1):
+            cost = min(previous[j] + 1, current[j - 1] + 1,
+                       previous[j - 1] + (char_a != char_b))
+            if i > 1 and j > 1 and char_a == b[j - 2] and a[i - 2] == char_b:
+                cost = min(cost, before[j - 2] + 1)
+            current.append(cost)
+        if min(current) > limit:
+            return limit + 1
+        before, previous = previous, current
+    return min(previous[-1], limit + 1)
+
+
+def snippet(text, words=(), terms=(), width=SNIPPET_WIDTH):
+    """Фрагмент текста вокруг первого совпадения и места подсветки в нём
+
+    Совпадением считается слово из words или слово, содержащее одно из
+    terms (всё в нижнем регистре). Возвращает (фрагмент, [(начало, конец)]).
+    """
+    spans = [match.span() for match in TOKEN_RE.finditer(text)
+             if match.group().lower() in words or
+             any(term in match.group().lower() for term in terms)]
+    if not spans:
+        return ' '.join(text[:width].split()), []
+    start = max(0, spans[0][0] - width // 3)
+    end = min(len(text), start + width)
+    prefix = '…' if start > 0 else ''
+    fragment = prefix + text[start:end].replace('\n', ' ') + ('…' if end < len(text) else '')
+    shift = len(prefix) - start
+    return fragment, [(a + shift, min(b, end) + shift) for a, b in spans if a < end]
+
+
+class SearchIndex:
+    """Инвертированный индекс заметок для поиска с ранжированием (rank)
+
+    tokens хранит слово -> {ключ заметки: вес вхождений}, grams -
+    триграмму -> слова словаря. Подстрока без пробелов и знаков всегда
+    лежит внутри одного слова, поэтому слова запроса находятся по
+    словарю, без чтения текстов. Вместе с постингами поддерживаются
+    длины заметок и их сумма, так что оценка BM25 не требует прохода по
+    текстам.
+    """
+
+    def __init__(self):
+        self.tokens = defaultdict(dict)  # слово -> {ключ: вхождения с учётом заголовка}
+        self.grams = defaultdict(set)    # триграмма -> слова словаря
+        self.docs = {}                   # ключ -> слова заметки
+        self.lengths = {}                # ключ -> длина заметки в словах (с учётом заголовка)
+        self.total_length = 0
+
+    def __len__(self):
+        return len(self.docs)
+
+    def __contains__(self, key):
+        return key in self.docs
+
+    def clear(self):
+        self.tokens.clear()
+        self.grams.clear()
+        self.docs.clear()
+        self.lengths.clear()
+        self.total_length = 0
+
+    def build(self, items):
+        """Построение индекса с нуля; items - тройки (ключ, заголовок, текст)"""
+        self.clear()
+        for key, title, content in items:
+            self.update(key, title, content)
+
+    def update(self, key, title, content):
+        """Добавление или переиндексация заметки
+
+        Слова, исчезнувшие из заметки, убираются из постингов, у
+        остальных обновляется число вхождений.
+        """
+        counts = Counter(tokenize(content))
+        for token in tokenize(title):
+            counts[token] += TITLE_BOOST
+        new_tokens = frozenset(counts)
+        old_tokens = self.docs.get(key, frozenset())
+
+        for token in old_tokens - new_tokens:
+            self._unlink(token, key)
+        for token, count in counts.items():
+            postings = self.tokens[token]
+            if not postings:
+                for gram in trigrams(token):
+                    self.grams[gram].add(token)
+            postings[key] = count
+
+        self.docs[key] = new_tokens
+        length = sum(counts.values())
+        self.total_length += length - self.lengths.get(key, 0)
+        self.lengths[key] = length
+
+    def remove(self, key):
+        """Удаление заметки из индекса"""
+        for token in self.docs.pop(key, ()):
+            self._unlink(token, key)
+        self.total_length -= self.lengths.pop(key, 0)
+
+    def _unlink(self, token, key):
+        postings = self.tokens.get(token)
+        if postings is None:
+            return
+        postings.pop(key, None)
+        if postings:
+            return
+        # Слово исчезло из всех заметок - убираем его из словаря
+        del self.tokens[token]
+        for gram in trigrams(token):
+            words = self.grams.get(gram)
+            if words is not None:
+                words.discard(token)
+                if not words:
+                    del self.grams[gram]
+
+    def matching_tokens(self, part):
+        """Слова словаря, содержащие part"""
+        if len(part) >= 3:
+            grams = sorted(trigrams(part), key=lambda g: len(self.grams.get(g, ())))
+            words = None
+            for gram in grams:
+                found = self.grams.get(gram)
+                if not found:
+                    return []
+                words = set(found) if words is None else words & found
+                if not words:
+                    return []
+        else:
+            words = self.tokens.keys()
+        return [word for word in words if part in word]
+
+    def fuzzy_tokens(self, term):
+        """Слова словаря, отличающиеся от term одной-двумя правками
+
+        Кандидаты берутся по общим триграммам (каждая правка портит не
+        больше трёх), расстояние проверяется только у них.
+        """
+        limit = 1 if len(term) < 8 else 2
+        grams = trigrams(term)
+        shared = Counter()
+        for gram in grams:
+            shared.update(self.grams.get(gram, ()))
+        need = max(1, len(grams) - 3 * limit)
+        return [word for word, count in shared.items()
+                if count >= need and word != term and
+                edit_distance(term, word, limit) <= limit]
+
+    def expand(self, term):
+        """Слова словаря, подходящие к слову запроса, с весами совпадения
+
+        Все слова, содержащие term (само слово, начинающиеся с него и
+        содержащие его внутри), - так находится всё, что нашёл бы поиск
+        подстроки. Слов с опечаткой добавляется не больше MAX_FUZZY
+        ближайших по длине.
+        """
+        found = {}
+        for word in self.matching_tokens(term):
+            if word == term:
+                found[word] = EXACT_WEIGHT
+            else:
+                found[word] = PREFIX_WEIGHT if word.startswith(term) else INFIX_WEIGHT
+        if len(term) >= FUZZY_MIN:
+            fuzzy = [word for word in self.fuzzy_tokens(term) if word not in found]
+            for word in heapq.nsmallest(MAX_FUZZY, fuzzy,
+                                        key=lambda word: abs(len(word) - len(term))):
+                found[word] = FUZZY_WEIGHT
+        return list(found.items())
+
+    def rank(self, query, limit=None):
+        """Заметки по релевантности BM25: список (оценка, ключ, совпавшие слова)
+
+        Каждое слово запроса должно найтись в заметке - целиком, как часть
+        слова или с опечаткой (с меньшим весом). Оценки слов запроса
+        складываются; при limit лучшие выбираются кучей, без сортировки
+        всех совпадений. None - в запросе нет ни одной буквы или цифры.
+        """
+        terms = tokenize(query)
+        if not terms:
+            return None
+        count = len(self.docs)
+        average = self.total_length / count if count else 1.0
+        lengths = self.lengths
+        # Знаменатель BM25: tf + K1 * (1 - B + B * длина / средняя длина)
+        base = K1 * (1 - B)
+        per_length = K1 * B / average
+        # Слова запроса с их вариантами; первым идёт самое редкое, и
+        # следующие слова оцениваются только у уцелевших заметок
+        expanded = []
+        matched = set()
+        for term in dict.fromkeys(terms):
+            variants = []
+            for word, weight in self.expand(term):
+                matched.add(word)
+                postings = self.tokens[word]
+                idf = math.log(1 + (count - len(postings) + 0.5) / (len(postings) + 0.5))
+                variants.append((postings, weight * idf * (K1 + 1)))
+            if not variants:
+                return []
+            expanded.append((sum(len(postings) for postings, _ in variants), variants))
+        expanded.sort(key=lambda item: item[0])
+
+        scores = None
+        for size, variants in expanded:
+            term_scores = {}
+            if scores is not None and len(scores) * len(variants) < size:
+                # Уцелевших заметок меньше, чем вхождений слова
+                for key in scores:
+                    for postings, factor in variants:
+                        tf = postings.get(key)
+                        if tf:
+                            score = factor * tf / (tf + base + per_length * lengths[key])
+                            if score > term_scores.get(key, 0.0):
+                                term_scores[key] = score
+            else:
+                for postings, factor in variants:
+                    for key, tf in postings.items():
+                        if scores is not None and key not in scores:
+                            continue
+                        score = factor * tf / (tf + base + per_length * lengths[key])
+                        if score > term_scores.get(key, 0.0):
+                            term_scores[key] = score
+            if scores is None:
+                scores = term_scores
+            else:
+                scores = {key: scores[key] + score for key, score in term_scores.items()}
+            if not scores:
+                return []
+
+        if limit:
+            best = heapq.nlargest(limit, scores.items(), key=lambda item: item[1])
+        else:
+            best = sorted(scores.items(), key=lambda item: item[1], reverse=True)
+        return [(score, key, matched & self.docs[key]) for key, score in best]
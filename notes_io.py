@@ -0,0 +1,165 @@
+import codecs
+import json
+import os
+import threading
+
+from notes_model import Note
+
+
+CHUNK_SIZE = 1024 * 1024  # байт, читаемых за раз
+
+
+class Cancelled(Exception):
+    """Операция отменена пользователем"""
+
+
+class Progress:
+    """Ход фоновой операции, общий для рабочего потока и интерфейса
+
+    done и total - в единицах операции (байты при импорте, заметки при
+    экспорте). Отмена проверяется рабочим потоком через check().
+    """
+
+    def __init__(self, total=0):
+        self.total = total
+        self.done = 0
+        self.cancelled = threading.Event()
+
+    def advance(self, amount):
+        self.done += amount
+
+    @property
+    def fraction(self):
+        return min(1.0, self.done / self.total) if self.total else 0.0
+
+    def cancel(self):
+        self.cancelled.set()
+
+    def check(self):
+        if self.cancelled.is_set():
+            raise Cancelled()
+
+
+def iter_records(f, progress=None, chunk_size=CHUNK_SIZE):
+    """Записи из JSON-массива или JSON Lines по мере чтения файла
+
+    f открыт в двоичном режиме. В памяти держится только текущий кусок
+    файла и одна недочитанная запись; записи должны быть объектами.
+    """
+    decoder = json.JSONDecoder()
+    text = codecs.getincrementaldecoder('utf-8-sig')()
+    buffer = ''
+    pos = 0
+    eof = False
+    array = None  # формат определяется по первому значащему символу
+
+    def fill(need=0):
+        """Дочитывание кусков, пока с pos не наберётся need символов (минимум один кусок)"""
+        nonlocal buffer, pos, eof
+        parts = [buffer[pos:]]
+        size = len(parts[0])
+        while not eof:
+            chunk = f.read(chunk_size)
+            if progress is not None:
+                progress.advance(len(chunk))
+            eof = not chunk
+            parts.append(text.decode(chunk, final=eof))
+            size += len(parts[-1])
+            if size >= need:
+                break
+        buffer = ''.join(parts)
+        pos = 0
+
+    while True:
+        # Пробелы, переводы строк и запятые между записями
+        while True:
+            while pos < len(buffer) and buffer[pos] in ' \t\r\n,':
+                pos += 1
+            if pos < len(buffer) or eof:
+                break
+            fill()
+        if pos >= len(buffer):
+            if array:
+                raise ValueError("Файл оборвался: нет закрывающей скобки массива")
+            return
+
+        if array is None:
+            array = buffer[pos] == '['
+            if array:
+                pos += 1
+                continue
+        if array and buffer[pos] == ']':
+            return
+
+        try:
+            record, end = decoder.raw_decode(buffer, pos)
+        except json.JSONDecodeError:
+            if eof:
+                raise
+            # Запись не поместилась в прочитанное: буфер растёт вдвое, чтобы
+            # длинная запись разбиралась заново O(log) раз, а не на каждом куске
+            fill(2 * (len(buffer) - pos))
+            continue
+        if not isinstance(record, dict):
+            raise ValueError(f"Ожидалась заметка (объект JSON), получено: {record!r:.40}")
+        pos = end
+        yield record
+
+
+def read_notes(path, progress, on_batch, batch_size=1000):
+    """Потоковое чтение заметок из файла; on_batch получает списки Note
+
+    Ход считается в байтах файла.
+    """
+    progress.total = os.path.getsize(path)
+    batch = []
+    with open(path, 'rb') as f:
+        for record in iter_records(f, progress):
+            progress.check()
+            batch.append(Note.from_dict(record))
+            if len(batch) >= batch_size:
+                on_batch(batch)
+                batch = []
+    if batch:
+        on_batch(batch)
+
+
+def export_records(notes, store, progress=None, batch_size=500):
+    """Словари заметок для записи; незагруженные тексты читаются пачками
+
+    Ход считается в заметках.
+    """
+    for start in range(0, len(notes), batch_size):
+        if progress is not None:
+            progress.check()
+        batch = notes[start:start + batch_size]
+        contents = store.read_contents(batch)
+        for note in batch:
+            record = note.to_dict()
+            if not note.loaded:
+                record['content'] = contents.get(note.id, '')
+            yield record
+        if progress is not None:
+            progress.advance(len(batch))
+
+
+def write_records(f, records, jsonl=False):
+    """Потоковая запись словарей в текстовый файл
+
+    По умолчанию - JSON-массив в том же виде, что json.dump(indent=2),
+    при jsonl=True - по записи на строку (JSON Lines).
+    """
+    if jsonl:
+        for record in records:
+            f.write(json.dumps(record, ensure_ascii=False))
+            f.write('\n')
+        return
+    f.write('[')
+    empty = True
+    for record in records:
+        f.write('\n  ' if empty else ',\n  ')
+        # Переводы строк внутри строк JSON экранированы, поэтому сдвигаются
+        # только строки самой разметки
+        f.write(json.dumps(record, ensure_ascii=False, indent=2).replace('\n', '\n  '))
+        empty = False
+    f.write(']' if empty else '\n]')
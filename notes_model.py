@@ -0,0 +1,148 @@
+import time
+
+
+# Формат времени в старых файлах заметок и при показе полной даты
+TIME_FORMAT = '%Y-%m-%d %H:%M:%S'
+
+
+def parse_time(value):
+    """Время в секундах эпохи из числа, строки с числом или строки TIME_FORMAT"""
+    if value is None or value == '':
+        return int(time.time())
+    if isinstance(value, (int, float)):
+        return int(value)
+    if value.isdigit():
+        return int(value)
+    return int(time.mktime(time.strptime(value, TIME_FORMAT)))
+
+
+def format_time(timestamp, fmt=TIME_FORMAT):
+    """Местное время заметки строкой"""
+    return time.strftime(fmt, time.localtime(timestamp))
+
+
+def make_preview(content):
+    """Превью текста для карточки заметки"""
+    return content[:60] + "..." if len(content) > 60 else content
+
+
+class Note:
+    """Заметка
+
+    Время создания и изменения - целые секунды эпохи. Текст может быть не
+    загружен (content is None): тогда превью и счётчики берутся из
+    хранилища. Производные поля (превью, число слов и символов, заголовок
+    в нижнем регистре, подпись времени) считаются при первом обращении и
+    сбрасываются при изменении заголовка или текста.
+    """
+
+    __slots__ = ('id', '_title', '_content', 'created', 'modified',
+                 '_title_lower', '_preview', '_words', '_chars', '_time_label')
+
+    def __init__(self, note_id, title='', content='', created=None, modified=None):
+        self.id = note_id
+        self._title = title
+        self._content = content
+        self.created = int(time.time()) if created is None else created
+        self.modified = self.created if modified is None else modified
+        self._title_lower = None
+        self._preview = None
+        self._words = None
+        self._chars = None
+        self._time_label = None
+
+    @classmethod
+    def from_dict(cls, data):
+        """Заметка из словаря JSON (время - число или строка старого формата)"""
+        return cls(data.get('id'), data.get('title', ''), data.get('content', ''),
+                   parse_time(data.get('created')), parse_time(data.get('modified')))
+
+    @classmethod
+    def unloaded(cls, note_id, title, preview, words, chars, created, modified):
+        """Заметка без текста: превью и счётчики известны из хранилища"""
+        note = cls(note_id, title, None, created, modified)
+        note._preview = preview
+        note._words = words
+        note._chars = chars
+        return note
+
+    def to_dict(self):
+        """Словарь для JSON; текст должен быть загружен"""
+        return {'id': self.id, 'title': self._title, 'content': self._content,
+                'created': self.created, 'modified': self.modified}
+
+    def copy(self):
+        """Поверхностная копия (строки неизменяемы)"""
+        note = Note.__new__(Note)
+        note.assign(self)
+        return note
+
+    def assign(self, other):
+        """Замена всех полей полями другой заметки"""
+        for slot in Note.__slots__:
+            setattr(self, slot, getattr(other, slot))
+
+    @property
+    def title(self):
+        return self._title
+
+    @title.setter
+    def title(self, value):
+        self._title = value
+        self._title_lower = None
+
+    @property
+    def content(self):
+        return self._content
+
+    @content.setter
+    def content(self, value):
+        self._content = value
+        self._preview = self._words = self._chars = None
+
+    @property
+    def loaded(self):
+        return self._content is not None
+
+    def unload(self):
+        """Выгрузка текста; превью и счётчики остаются"""
+        self._preview, self._words, self._chars = self.preview, self.words, self.chars
+        self._content = None
+
+    def touch(self):
+        """Отметка времени изменения"""
+        self.modified = int(time.time())
+
+    @property
+    def title_lower(self):
+        if self._title_lower is None:
+            self._title_lower = self._title.lower()
+        return self._title_lower
+
+    @property
+    def preview(self):
+        if self._preview is None:
+            self._preview = make_preview(self._content)
+        return self._preview
+
+    @property
+    def words(self):
+        if self._words is None:
+            self._words = len(self._content.split())
+        return self._words
+
+    @property
+    def chars(self):
+        if self._chars is None:
+            self._chars = len(self._content)
+        return self._chars
+
+    @property
+    def time_label(self):
+        """Время изменения «ЧЧ:ММ» для карточки и строки состояния"""
+        if self._time_label is None or self._time_label[0] != self.modified:
+            self._time_label = (self.modified, format_time(self.modified, '%H:%M'))
+        return self._time_label[1]
+
+    def __repr__(self):
+        return f"Note({self.id!r}, {self._title!r})"
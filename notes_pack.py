@@ -0,0 +1,93 @@
+import json
+import lzma
+import struct
+import zlib
+
+from notes_model import Note
+
+
+# Двоичный снимок заметок: MAGIC и записи подряд. Запись - кадр FRAME
+# (кодек и длина данных) и данные: поля RECORD и строки заголовка и
+# текста в UTF-8. Данные длиннее COMPRESS_MIN байт сжимаются, если это
+# даёт выигрыш. Каждая запись сжимается отдельно, поэтому текст одной
+# заметки читается по смещению без распаковки всего файла.
+MAGIC = b'NOTESPK1'
+FRAME = struct.Struct('<BI')     # кодек, длина данных
+RECORD = struct.Struct('<qqqII')  # id, создано, изменено, байт заголовка, байт текста
+COMPRESS_MIN = 256
+
+RAW = 0
+# Без заголовка и контрольной суммы xz: у коротких записей они съели бы выигрыш
+LZMA_FILTERS = [{'id': lzma.FILTER_LZMA2, 'preset': 6, 'dict_size': 1 << 16}]
+# Кодеки: имя -> (номер в кадре, сжатие, распаковка)
+CODECS = {
+    'none': (RAW, None, None),
+    'zlib': (1, lambda data: zlib.compress(data, 6), zlib.decompress),
+    'lzma': (2, lambda data: lzma.compress(data, lzma.FORMAT_RAW, filters=LZMA_FILTERS),
+             lambda data: lzma.decompress(data, lzma.FORMAT_RAW, filters=LZMA_FILTERS)),
+}
+
+try:
+    from compression import zstd  # Python 3.14+
+    CODECS['zstd'] = (3, zstd.compress, zstd.decompress)
+except ImportError:
+    pass
+
+DECOMPRESS = {code: decompress for code, _, decompress in CODECS.values()}
+
+
+def encode_record(note_id, title, content, created, modified, compression='zlib'):
+    """Кадр одной заметки"""
+    title_bytes = title.encode('utf-8')
+    content_bytes = content.encode('utf-8')
+    data = (RECORD.pack(note_id, created, modified, len(title_bytes), len(content_bytes)) +
+            title_bytes + content_bytes)
+    code, compress, _ = CODECS[compression]
+    if compress is not None and len(data) > COMPRESS_MIN:
+        packed = compress(data)
+        if len(packed) < len(data):
+            return FRAME.pack(code, len(packed)) + packed
+    return FRAME.pack(RAW, len(data)) + data
+
+
+def decode_record(frame):
+    """(id, заголовок, текст, создано, изменено) из кадра"""
+    try:
+        code, length = FRAME.unpack_from(frame)
+        data = frame[FRAME.size:FRAME.size + length]
+        if code != RAW:
+            data = DECOMPRESS[code](data)
+        note_id, created, modified, title_size, content_size = RECORD.unpack_from(data)
+        start = RECORD.size
+        title = str(data[start:start + title_size], 'utf-8')
+        start += title_size
+        content = str(data[start:start + content_size], 'utf-8')
+    except (struct.error, KeyError, zlib.error, lzma.LZMAError) as e:
+        raise ValueError(f"Повреждённая запись заметки: {e}") from e
+    return note_id, title, content, created, modified
+
+
+def read_snapshot(f):
+    """Заметки из снимка: формат определяется по началу файла
+
+    f открыт в двоичном режиме. Снимок без MAGIC читается как JSON-массив
+    (прежний формат notes_data.json).
+    """
+    head = f.read(len(MAGIC))
+    if head != MAGIC:
+        data = json.loads(head + f.read())
+        return [Note.from_dict(record) for record in data or ()]
+    view = memoryview(f.read())
+    notes = []
+    position = 0
+    while position < len(view):
+        if position + FRAME.size > len(view):
+            raise ValueError("Снимок заметок обрывается посреди записи")
+        _, length = FRAME.unpack_from(view, position)
+        end = position + FRAME.size + length
+        if end > len(view):
+            raise ValueError("Снимок заметок обрывается посреди записи")
+        note_id, title, content, created, modified = decode_record(view[position:end])
+        notes.append(Note(note_id, title, content, created, modified))
+        position = end
+    return notes
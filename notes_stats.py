@@ -0,0 +1,34 @@
+class NoteStats:
+    """Суммы слов и символов по заметкам
+
+    Для каждой заметки хранятся её счётчики (их считает модель заметки
+    или хранилище). Общие суммы поддерживаются по разнице, поэтому
+    правка одной заметки не требует пересчёта всего хранилища.
+    """
+
+    def __init__(self):
+        self.entries = {}  # ключ -> (слова, символы)
+        self.total_words = 0
+        self.total_chars = 0
+
+    def __len__(self):
+        return len(self.entries)
+
+    def clear(self):
+        self.entries.clear()
+        self.total_words = 0
+        self.total_chars = 0
+
+    def set(self, key, words, chars):
+        """Счётчики заметки (новой или изменённой)"""
+        self.remove(key)
+        self.entries[key] = (words, chars)
+        self.total_words += words
+        self.total_chars += chars
+
+    def remove(self, key):
+        """Исключение заметки из статистики"""
+        entry = self.entries.pop(key, None)
+        if entry is not None:
+            self.total_words -= entry[0]
+            self.total_chars -= entry[1]
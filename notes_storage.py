@@ -0,0 +1,1482 @@
+import contextlib
+import json
+import mmap
+import os
+import queue
+import shutil
+import sqlite3
+import threading
+from collections import Counter, OrderedDict, namedtuple
+
+from notes_model import Note, make_preview, parse_time
+from notes_pack import CODECS, FRAME, MAGIC, decode_record, encode_record, read_snapshot
+
+
+def _fsync_dir(path):
+    """Сброс на диск записи каталога (переименования); на Windows недоступен"""
+    try:
+        fd = os.open(os.path.dirname(os.path.abspath(path)), os.O_RDONLY)
+    except OSError:
+        return
+    try:
+        os.fsync(fd)
+    except OSError:
+        pass
+    finally:
+        os.close(fd)
+
+
+def generation_path(path, number):
+    """Имя предыдущего поколения файла: notes_data.json.1, .2, ..."""
+    return f"{path}.{number}"
+
+
+def _keep_generation(path, generations):
+    """Сдвиг поколений и сохранение текущего файла как .1
+
+    Текущий файл не переименовывается, а получает жёсткую ссылку, так
+    что по основному имени всегда лежит целый файл.
+    """
+    for number in range(generations - 1, 0, -1):
+        older = generation_path(path, number)
+        if os.path.exists(older):
+            os.replace(older, generation_path(path, number + 1))
+    first = generation_path(path, 1)
+    if os.path.exists(first):
+        os.remove(first)
+    try:
+        os.link(path, first)
+    except OSError:
+        shutil.copy2(path, first)
+
+
+def atomic_write(path, write, generations=0, encoding='utf-8', lock=None, commit=None):
+    """Надёжная запись файла: временный файл, fsync и атомарная замена
+
+    write(f) пишет содержимое в открытый временный файл (при encoding=None
+    файл открывается в двоичном режиме). При сбое во время записи старый
+    файл остаётся нетронутым. generations - сколько предыдущих версий
+    хранить рядом (path.1 - самая свежая). Если передан lock, замена
+    выполняется под ним, и там же сразу после замены вызывается commit():
+    читатели под тем же замком видят файл и связанные с ним данные
+    согласованными.
+    """
+    tmp_path = path + '.tmp'
+    try:
+        with open(tmp_path, 'w' if encoding else 'wb', encoding=encoding) as f:
+            write(f)
+            f.flush()
+            os.fsync(f.fileno())
+        with lock or contextlib.nullcontext():
+            if generations and os.path.exists(path):
+                _keep_generation(path, generations)
+            os.replace(tmp_path, path)
+            if commit is not None:
+                commit()
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+    _fsync_dir(path)
+
+
+def read_with_fallback(path, read, generations=0, encoding='utf-8'):
+    """Чтение файла с откатом на предыдущие поколения
+
+    Возвращает (результат, путь прочитанного файла) или (None, None),
+    если файлов нет. Если повреждены все версии, пробрасывается ошибка
+    чтения основного файла. При encoding=None файл открывается в
+    двоичном режиме.
+    """
+    candidates = [path] + [generation_path(path, n) for n in range(1, generations + 1)]
+    first_error = None
+    for candidate in candidates:
+        if not os.path.exists(candidate):
+            continue
+        try:
+            with open(candidate, 'r' if encoding else 'rb', encoding=encoding) as f:
+                return read(f), candidate
+        except (OSError, ValueError) as e:
+            first_error = first_error or e
+    if first_error is not None:
+        raise first_error
+    return None, None
+
+
+def ensure_unique_ids(notes, start=0):
+    """Перенумерация заметок с повторяющимися id; возвращает True, если были правки
+
+    Новые id выдаются начиная с start, но не меньше максимального id + 1.
+    """
+    seen = set()
+    next_id = max(start, max((note.id for note in notes if note.id is not None),
+                             default=-1) + 1)
+    changed = False
+    for note in notes:
+        if note.id is None or note.id in seen:
+            note.id = next_id
+            next_id += 1
+            changed = True
+        seen.add(note.id)
+    return changed
+
+
+def fingerprint(note):
+    """Отпечаток сохранённого состояния заметки
+
+    Хранятся ссылки на сами строки: сравнение неизменённой заметки
+    сводится к сравнению указателей и не зависит от длины текста.
+    Для заметки с незагруженным текстом вместо него стоит None.
+    """
+    return (note.title, note.content, note.modified)
+
+
+def same_version(old, new):
+    """Совпадают ли отпечатки записанной и текущей версии заметки
+
+    Если у одной из версий текст не загружен (None), сравниваются только
+    заголовок и время изменения: без загрузки текст измениться не мог,
+    а любая правка обновляет время изменения.
+    """
+    if old is None:
+        return False
+    if old[1] is None or new[1] is None:
+        return old[0] == new[0] and old[2] == new[2]
+    return old == new
+
+
+class NoteStore:
+    """Общая часть хранилищ: поиск изменений относительно записанного состояния"""
+
+    # Умеет ли хранилище само искать по тексту (иначе нужен SearchIndex)
+    full_text_search = False
+    # Только просмотр: сохранение недоступно, окно запрещает правку
+    read_only = False
+
+    def __init__(self):
+        self.written = {}  # id -> отпечаток последней записанной версии
+        self.lock = threading.Lock()
+        self.next_id = 0   # следующий свободный id, только растёт
+
+    def allocate_id(self):
+        """Новый id заметки
+
+        Счётчик хранится вместе с заметками и не уменьшается после
+        удалений, поэтому id удалённой заметки никогда не достанется
+        другой.
+        """
+        note_id = self.next_id
+        self.next_id += 1
+        return note_id
+
+    def reserve_ids(self, notes):
+        """Сдвиг счётчика за id уже существующих заметок"""
+        self.next_id = max(self.next_id, max((note.id for note in notes), default=-1) + 1)
+
+    def changes(self, notes=None, dirty=None, deleted=None, order=()):
+        """Изменения с момента последней записи: (изменённые, удалённые id, lead)
+
+        Изменённые - пары (позиция, заметка), lead - число новых заметок
+        в начале списка. Если переданы dirty (id -> заметка) и deleted,
+        проверяются только они, а вместо всего списка достаточно order -
+        id заметок из его начала. Иначе сравнивается весь список notes.
+        """
+        if dirty is None:
+            lead = self.lead_count(note.id for note in notes)
+            changed = []
+            current = set()
+            for position, note in enumerate(notes):
+                current.add(note.id)
+                if not same_version(self.written.get(note.id), fingerprint(note)):
+                    changed.append((position, note))
+            deleted = [note_id for note_id in self.written if note_id not in current]
+            return changed, deleted, lead
+
+        # Позиция важна только для новых заметок в начале списка
+        lead = self.lead_count(order)
+        lead_positions = {note_id: i for i, note_id in enumerate(order[:lead])}
+        deleted = set(deleted or ())
+        changed = []
+        for note_id, note in dirty.items():
+            if note_id not in deleted and not same_version(self.written.get(note_id),
+                                                           fingerprint(note)):
+                changed.append((lead_positions.get(note_id, lead + len(changed)), note))
+        changed.sort(key=lambda item: item[0])
+        return changed, [note_id for note_id in deleted if note_id in self.written], lead
+
+    def lead_count(self, ids):
+        """Число новых (ещё не записанных) заметок в начале последовательности id"""
+        lead = 0
+        for note_id in ids:
+            if note_id in self.written:
+                break
+            lead += 1
+        return lead
+
+    def needs_compaction(self):
+        return False
+
+    def load_content(self, note):
+        """Подгрузка текста заметки, если он ещё не в памяти
+
+        Если заметка не менялась после записи, в её отпечаток попадает
+        загруженный текст: иначе правка текста, сделанная в ту же секунду,
+        что и прежнее изменение, не была бы замечена (same_version сравнил
+        бы только заголовок и время).
+        """
+        if not note.loaded:
+            note.content = self.read_contents([note]).get(note.id, '')
+            written = self.written.get(note.id)
+            if written is not None and written[1] is None and same_version(written,
+                                                                            fingerprint(note)):
+                self.written[note.id] = fingerprint(note)
+        return note
+
+    def read_contents(self, notes):
+        """Тексты незагруженных заметок из notes: словарь id -> текст
+
+        Тексты в память заметок не записываются - это решает вызывающий.
+        """
+        return {}
+
+    def can_reload(self, note):
+        """Можно ли выгрузить текст заметки и потом прочитать его снова"""
+        return False
+
+    def evict(self, note):
+        """Выгрузка текста заметки из памяти; False, если это небезопасно
+
+        Вместо текста в заметке остаются превью и счётчики для карточки.
+        """
+        if not note.loaded or not self.can_reload(note):
+            return False
+        note.unload()
+        return True
+
+    def materialize(self, notes):
+        """Словари заметок для экспорта; недостающие тексты читаются из хранилища"""
+        contents = self.read_contents(notes)
+        result = []
+        for note in notes:
+            full = note.to_dict()
+            if not note.loaded:
+                full['content'] = contents.get(note.id, '')
+            result.append(full)
+        return result
+
+    def search(self, query, progress=None):
+        """{id: оценка} заметок с подстрокой query или None, если поиск не поддерживается
+
+        progress (notes_io.Progress) позволяет отменить долгий поиск из
+        другого потока.
+        """
+        return None
+
+    def load_history(self, note_id):
+        """Сохранённая история правок заметки (словарь) или None"""
+        return None
+
+    def save_histories(self, histories):
+        """Запись историй правок: id -> словарь или None (удалить)"""
+        pass
+
+    def background_errors(self):
+        """Ошибки фоновой работы хранилища (сжатия), накопившиеся с прошлого вызова"""
+        return []
+
+    def compact(self, notes, background=True):
+        pass
+
+    def close(self):
+        pass
+
+
+class JournalStore(NoteStore):
+    """Хранилище заметок: снимок notes_data.json и журнал изменений
+
+    Автосохранение дописывает в журнал только изменённые и удалённые
+    заметки. Когда журнал вырастает относительно снимка, он
+    «поворачивается» (переименовывается в .old), а новый снимок пишется
+    в фоновом потоке. При запуске читаются снимок, .old и журнал.
+
+    Снимок пишется атомарно с хранением GENERATIONS предыдущих версий;
+    если основной файл повреждён, загрузка берёт последнюю целую версию
+    и записывает в recovered_from её имя.
+
+    Снимок хранит по заметке на строку, а рядом пишется оглавление
+    notes_data.index.json: заголовок, превью, счётчики и смещение записи
+    каждой заметки. В ленивом режиме (lazy) при запуске читается только
+    оглавление, а тексты подгружаются из снимка по смещениям.
+
+    С packed=True снимок пишется в двоичном формате notes_pack
+    (notes_data.pack) со сжатием записей кодеком compression. Формат
+    снимка при чтении определяется по его содержимому; если снимка в
+    выбранном формате ещё нет, а в другом есть, заметки читаются из
+    него и сразу переписываются в выбранный, а прежний файл
+    переименовывается в *.migrated.
+    """
+
+    COMPACT_MIN_BYTES = 1024 * 1024
+    COMPACT_RATIO = 0.5
+    HISTORY_COMPACT_BYTES = 1024 * 1024
+    GENERATIONS = 3
+    INDEX_VERSION = 2
+    READ_BATCH = 500  # заметок, тексты которых держатся в памяти при сжатии
+
+    def __init__(self, path=None, lazy=True, packed=False, compression='zlib'):
+        super().__init__()
+        if path is None:
+            path = 'notes_data.pack' if packed else 'notes_data.json'
+        self.path = path
+        self.lazy = lazy
+        self.packed = packed
+        self.compression = compression
+        self.format = f'pack-{compression}' if packed else 'json'
+        # Снимок в другом формате: из него переносятся заметки при переходе
+        self.other_path = os.path.splitext(path)[0] + ('.json' if packed else '.pack')
+        self.journal_path = os.path.splitext(path)[0] + '.journal'
+        self.old_journal_path = self.journal_path + '.old'
+        self.index_path = os.path.splitext(path)[0] + '.index.json'
+        self.snapshot_bytes = 0
+        self.journal_bytes = 0
+        self.compactor = None
+        self.compactor_errors = queue.Queue()
+        self.recovered_from = None
+        # Смещения записей в текущем снимке: id -> (смещение, длина).
+        # Заметки, переписанные в журнале, отсюда убираются - в снимке
+        # лежит их устаревшая версия
+        self.offsets = {}
+        self.journaled = set()  # id, записанные в журнал с начала сжатия
+        self.file_lock = threading.Lock()  # снимок и offsets меняются вместе
+        # Истории правок: notes_data.history, по записи на строку, действует
+        # последняя запись заметки. Смещения собираются при первом обращении
+        self.history_path = os.path.splitext(path)[0] + '.history'
+        self.history_offsets = None  # id -> (смещение, длина)
+        self.history_bytes = 0
+        self.history_tail_ok = True  # файл кончается целой строкой
+        self.history_lock = threading.Lock()
+
+    def load(self):
+        """Чтение снимка и проигрывание журнала
+
+        В ленивом режиме вместо снимка читается оглавление: заметки
+        загружаются без текстов (с превью и счётчиками).
+        """
+        notes = self._load_index()
+        fixed = False
+        migrate = not os.path.exists(self.path) and os.path.exists(self.other_path)
+        if migrate:
+            notes, _ = self._load_snapshot(self.other_path)
+            fixed = True
+        elif notes is None or not self.lazy:
+            notes, fixed = self._load_snapshot()
+            # Без оглавления ленивая загрузка невозможна - сжатие запишет его;
+            # пустому снимку оглавление не нужно
+            fixed = fixed or (self.lazy and bool(notes) and not self.offsets)
+
+        by_id = {note.id: note for note in notes}
+        front = []
+        for path in (self.old_journal_path, self.journal_path):
+            if not self._replay(path, notes, by_id, front):
+                fixed = True
+        self.journal_bytes = self._size(self.journal_path)
+
+        # Удалённые заметки остались в списках, но пропали из by_id
+        notes = [note for note in front[::-1] + notes if by_id.get(note.id) is note]
+        fixed = ensure_unique_ids(notes, self.next_id) or fixed
+        self.reserve_ids(notes)
+        self.written = {note.id: fingerprint(note) for note in notes}
+        if fixed or os.path.exists(self.old_journal_path):
+            # Повторяющиеся id, повреждённый хвост журнала, прерванное
+            # сжатие, нет оглавления или смена формата: сразу записываем
+            # чистый снимок
+            self.compact(notes, background=False)
+        if migrate:
+            self._retire(self.other_path)
+        return notes
+
+    def _retire(self, path):
+        """Снимок прежнего формата после переноса: копия *.migrated, без поколений"""
+        os.replace(path, path + '.migrated')
+        for number in range(1, self.GENERATIONS + 1):
+            if os.path.exists(generation_path(path, number)):
+                os.remove(generation_path(path, number))
+
+    def _load_snapshot(self, path=None):
+        """Полное чтение снимка (любого формата): (заметки, нужна ли перезапись)"""
+        path = path or self.path
+        try:
+            notes, source = read_with_fallback(path, read_snapshot, self.GENERATIONS,
+                                               encoding=None)
+        except (OSError, ValueError):
+            # Ни одна версия не читается: откладываем копию, чтобы следующие
+            # сохранения не вытеснили её из поколений
+            shutil.copy2(path, path + '.damaged')
+            raise
+        notes = notes or []
+        if source is not None:
+            self.snapshot_bytes = os.path.getsize(source)
+        fixed = ensure_unique_ids(notes, self.next_id)
+        if fixed:
+            self.offsets = {}
+        if source is not None and source != path:
+            # Основной снимок повреждён - восстановились из предыдущего поколения
+            self.recovered_from = source
+            self.offsets = {}
+            fixed = True
+        return notes, fixed
+
+    def _load_index(self):
+        """Заметки без текстов из оглавления; None, если оно не соответствует снимку"""
+        try:
+            with open(self.index_path, 'r', encoding='utf-8') as f:
+                index = json.load(f)
+            # Счётчик id остаётся верной нижней границей даже в устаревшем оглавлении
+            self.next_id = max(self.next_id, index.get('next_id', 0))
+            stat = os.stat(self.path)
+            if (index.get('version') != self.INDEX_VERSION or
+                    not self._accepts_format(index.get('format', 'json')) or
+                    index.get('snapshot') != [stat.st_size, stat.st_mtime_ns]):
+                return None
+            notes = []
+            offsets = {}
+            for (note_id, title, preview, words, chars, created, modified,
+                 offset, length) in index['notes']:
+                notes.append(Note.unloaded(note_id, title, preview, words, chars,
+                                           created, modified))
+                offsets[note_id] = (offset, length)
+        except (OSError, ValueError, KeyError, TypeError):
+            return None
+        self.offsets = offsets
+        self.snapshot_bytes = stat.st_size
+        return notes
+
+    def _accepts_format(self, snapshot_format):
+        """Подходит ли оглавление снимка формата snapshot_format"""
+        return snapshot_format == self.format
+
+    def _replay(self, path, notes, by_id, front):
+        """Применение записей журнала; False, если встретились повреждённые строки"""
+        if not os.path.exists(path):
+            return True
+        intact = True
+        with open(path, 'r', encoding='utf-8') as f:
+            for line in f:
+                try:
+                    record = json.loads(line)
+                except ValueError:
+                    # Недописанная последняя запись после аварийного завершения
+                    intact = False
+                    continue
+                if record.get('op') == 'put':
+                    note = Note.from_dict(record['note'])
+                    self.next_id = max(self.next_id, note.id + 1)
+                    self.offsets.pop(note.id, None)
+                    old = by_id.get(note.id)
+                    if old is not None:
+                        old.assign(note)
+                        continue
+                    by_id[note.id] = note
+                    if record.get('at') == 'front':
+                        front.append(note)
+                    else:
+                        notes.append(note)
+                elif record.get('op') == 'del':
+                    # id удалённой заметки тоже занят навсегда
+                    self.next_id = max(self.next_id, record['id'] + 1)
+                    by_id.pop(record['id'], None)
+                    self.offsets.pop(record['id'], None)
+        return intact
+
+    @staticmethod
+    def _size(path):
+        return os.path.getsize(path) if os.path.exists(path) else 0
+
+    def read_contents(self, notes):
+        """Тексты незагруженных заметок из снимка
+
+        Записи читаются в порядке расположения в файле за одно открытие.
+        """
+        with self.file_lock:
+            return self._read_records(self.path, self._record_offsets(notes))
+
+    def _record_offsets(self, notes):
+        """Смещения записей незагруженных заметок из notes: id -> (смещение, длина)"""
+        offsets = {}
+        for note in notes:
+            if note.loaded:
+                continue
+            if note.id not in self.offsets:
+                raise ValueError(f"Текст заметки {note.id} не найден в {self.path}")
+            offsets[note.id] = self.offsets[note.id]
+        return offsets
+
+    def _read_records(self, path, offsets):
+        """Тексты записей снимка path по смещениям (id -> (смещение, длина))"""
+        if not offsets:
+            return {}
+        contents = {}
+        with open(path, 'rb') as f:
+            for note_id, (offset, length) in sorted(offsets.items(), key=lambda item: item[1]):
+                f.seek(offset)
+                if self.packed:
+                    record_id, _, content, _, _ = decode_record(f.read(length))
+                else:
+                    record = json.loads(f.read(length))
+                    record_id, content = record.get('id'), record['content']
+                if record_id != note_id:
+                    raise ValueError(f"Оглавление не соответствует {path}")
+                contents[note_id] = content
+        return contents
+
+    def can_reload(self, note):
+        """Текст совпадает с записью в снимке и не содержит несохранённых правок"""
+        return (note.id in self.offsets and
+                same_version(self.written.get(note.id), fingerprint(note)))
+
+    def save(self, notes=None, dirty=None, deleted=None, order=()):
+        """Дописывание изменений в журнал; возвращает число записей"""
+        with self.lock:
+            written = self._append_changes(notes, dirty, deleted, order)
+            # Сжатие по ходу дела возможно только при полном списке заметок
+            if written and notes is not None and self.needs_compaction():
+                self._start_compaction(notes)
+            return written
+
+    def _append_changes(self, notes=None, dirty=None, deleted=None, order=()):
+        changed, deleted, lead = self.changes(notes, dirty, deleted, order)
+        if not changed and not deleted:
+            return 0
+
+        # Новые заметки, стоящие в начале списка, помечаются как «в начало»
+        # и пишутся в обратном порядке, чтобы при чтении порядок совпал
+        records = [{'op': 'del', 'id': note_id} for note_id in deleted]
+        for position, note in reversed(changed):
+            if position < lead:
+                records.append({'op': 'put', 'at': 'front', 'note': note.to_dict()})
+        for position, note in changed:
+            if position >= lead:
+                records.append({'op': 'put', 'note': note.to_dict()})
+
+        data = ''.join(json.dumps(record, ensure_ascii=False) + '\n' for record in records)
+        with open(self.journal_path, 'a', encoding='utf-8') as f:
+            f.write(data)
+            f.flush()
+            os.fsync(f.fileno())
+        self.journal_bytes += len(data.encode('utf-8'))
+
+        with self.file_lock:
+            for note_id in deleted:
+                self.offsets.pop(note_id, None)
+                self.journaled.add(note_id)
+            for _, note in changed:
+                self.offsets.pop(note.id, None)
+                self.journaled.add(note.id)
+        for note_id in deleted:
+            del self.written[note_id]
+        for _, note in changed:
+            self.written[note.id] = fingerprint(note)
+        return len(records)
+
+    def needs_compaction(self):
+        return (self.journal_bytes > self.COMPACT_MIN_BYTES and
+                self.journal_bytes > self.snapshot_bytes * self.COMPACT_RATIO)
+
+    def _start_compaction(self, notes, background=True):
+        if self.compactor is not None and self.compactor.is_alive():
+            return
+        # Поворот журнала: новые записи пойдут в свежий файл, а снимок
+        # фиксирует ровно то состояние, что уже записано в .old
+        if os.path.exists(self.journal_path):
+            if os.path.exists(self.old_journal_path):
+                # .old от прерванного сжатия: дописываем к нему хвост
+                with open(self.journal_path, 'r', encoding='utf-8') as src, \
+                        open(self.old_journal_path, 'a', encoding='utf-8') as dst:
+                    dst.write(src.read())
+                os.remove(self.journal_path)
+            else:
+                os.replace(self.journal_path, self.old_journal_path)
+        self.journal_bytes = 0
+        snapshot = [note.copy() for note in notes]
+        with self.file_lock:
+            self.journaled = set()
+            # Смещения незагруженных текстов - на момент начала: журнал,
+            # дописываемый во время сжатия, убирает их из self.offsets
+            source = self._record_offsets(snapshot)
+
+        if background:
+            self.compactor = threading.Thread(target=self._compact_in_background,
+                                              args=(snapshot, source), daemon=True)
+            self.compactor.start()
+        else:
+            self._write_snapshot(snapshot, source)
+
+    def _compact_in_background(self, notes, source):
+        try:
+            self._write_snapshot(notes, source)
+        except Exception as e:
+            # .old остаётся: следующее сжатие или запуск допишут его в снимок
+            self.compactor_errors.put(e)
+
+    def background_errors(self):
+        errors = []
+        while True:
+            try:
+                errors.append(self.compactor_errors.get_nowait())
+            except queue.Empty:
+                return errors
+
+    def _encode(self, note, content):
+        """Запись заметки в снимке и разделитель после неё"""
+        if self.packed:
+            return encode_record(note.id, note.title, content, note.created, note.modified,
+                                 self.compression), b''
+        record = note.to_dict()
+        record['content'] = content
+        return json.dumps(record, ensure_ascii=False).encode('utf-8'), b',\n'
+
+    def _write_snapshot(self, notes, source):
+        """Запись снимка (по заметке на строку или двоичного) и его оглавления
+
+        Незагруженные тексты читаются из старого снимка по смещениям
+        source (id -> (смещение, длина), сняты в начале сжатия) пачками по
+        READ_BATCH, так что в памяти не оказывается всё хранилище сразу.
+        Старый снимок заменяется только в конце, поэтому смещения верны
+        всё время записи.
+        """
+        entries = []
+        offsets = {}
+
+        def write(f):
+            header = MAGIC if self.packed else b'[\n'
+            f.write(header)
+            position = len(header)
+            for start in range(0, len(notes), self.READ_BATCH):
+                batch = notes[start:start + self.READ_BATCH]
+                contents = self._read_records(self.path, {note.id: source[note.id]
+                                                         for note in batch if not note.loaded})
+                for i, note in enumerate(batch, start):
+                    content = note.content if note.loaded else contents[note.id]
+                    data, separator = self._encode(note, content)
+                    if i + 1 == len(notes) and separator:
+                        separator = b'\n'
+                    f.write(data + separator)
+                    offsets[note.id] = (position, len(data))
+                    # Превью и счётчики у незагруженных заметок уже есть
+                    entries.append([note.id, note.title, note.preview, note.words, note.chars,
+                                    note.created, note.modified, position, len(data)])
+                    position += len(data) + len(separator)
+            if not self.packed:
+                f.write(b']\n')
+
+        def commit():
+            # Заметки, переписанные в журнале во время сжатия, в новом
+            # снимке устарели
+            for note_id in self.journaled:
+                offsets.pop(note_id, None)
+            self.offsets = offsets
+            stat = os.stat(self.path)
+            self.snapshot_bytes = stat.st_size
+            index['snapshot'] = [stat.st_size, stat.st_mtime_ns]
+
+        index = {'version': self.INDEX_VERSION, 'format': self.format, 'next_id': self.next_id}
+        atomic_write(self.path, write, generations=self.GENERATIONS, encoding=None,
+                     lock=self.file_lock, commit=commit)
+        index['notes'] = entries
+        atomic_write(self.index_path,
+                     lambda f: json.dump(index, f, ensure_ascii=False, separators=(',', ':')))
+        if os.path.exists(self.old_journal_path):
+            os.remove(self.old_journal_path)
+
+    def compact(self, notes, background=True):
+        """Запись полного снимка и очистка журнала"""
+        with self.lock:
+            if self.compactor is not None:
+                self.compactor.join()
+            self._append_changes(notes)
+            self._start_compaction(notes, background)
+
+    def _history_index(self):
+        """Смещения последних записей историй (читаются один раз)"""
+        if self.history_offsets is not None:
+            return self.history_offsets
+        offsets = {}
+        position = 0
+        line = b'\n'
+        if os.path.exists(self.history_path):
+            with open(self.history_path, 'rb') as f:
+                for line in f:
+                    try:
+                        record = json.loads(line)
+                    except ValueError:
+                        # Недописанная строка после аварийного завершения
+                        record = None
+                    if record is not None:
+                        if record.get('history') is None:
+                            offsets.pop(record['id'], None)
+                        else:
+                            offsets[record['id']] = (position, len(line))
+                    position += len(line)
+        self.history_offsets = offsets
+        self.history_bytes = position
+        self.history_tail_ok = line.endswith(b'\n')
+        return offsets
+
+    def load_history(self, note_id):
+        with self.history_lock:
+            entry = self._history_index().get(note_id)
+            if entry is None:
+                return None
+            with open(self.history_path, 'rb') as f:
+                f.seek(entry[0])
+                return json.loads(f.read(entry[1]))['history']
+
+    def save_histories(self, histories):
+        """Дописывание историй в notes_data.history; файл сжимается, когда в нём
+        больше половины устаревших записей"""
+        with self.history_lock:
+            offsets = self._history_index()
+            records = [(note_id, json.dumps({'id': note_id, 'history': data},
+                                            ensure_ascii=False).encode('utf-8') + b'\n')
+                       for note_id, data in histories.items()
+                       if data is not None or note_id in offsets]
+            if not records:
+                return
+            with open(self.history_path, 'ab') as f:
+                position = f.tell()
+                if not self.history_tail_ok:
+                    f.write(b'\n')
+                    position += 1
+                for note_id, line in records:
+                    f.write(line)
+                    if histories[note_id] is None:
+                        offsets.pop(note_id, None)
+                    else:
+                        offsets[note_id] = (position, len(line))
+                    position += len(line)
+                f.flush()
+                os.fsync(f.fileno())
+            self.history_bytes = position
+            self.history_tail_ok = True
+            live = sum(length for _, length in offsets.values())
+            if self.history_bytes > self.HISTORY_COMPACT_BYTES and live * 2 < self.history_bytes:
+                self._compact_history()
+
+    def _compact_history(self):
+        """Перезапись файла историй только с действующими записями"""
+        offsets = {}
+
+        def write(f):
+            position = 0
+            with open(self.history_path, 'rb') as src:
+                for note_id, (offset, length) in sorted(self.history_offsets.items(),
+                                                        key=lambda item: item[1]):
+                    src.seek(offset)
+                    f.write(src.read(length))
+                    offsets[note_id] = (position, length)
+                    position += length
+            self.history_bytes = position
+
+        atomic_write(self.history_path, write, encoding=None)
+        self.history_offsets = offsets
+
+    def close(self):
+        """Ожидание завершения фонового сжатия"""
+        if self.compactor is not None:
+            self.compactor.join()
+
+
+class MappedStore(JournalStore):
+    """Хранилище journal только для чтения поверх mmap
+
+    Для просмотра и поиска по очень большим архивам. Снимок (JSON или
+    двоичный - определяется по содержимому) отображается в память, и
+    тексты берутся срезами по смещениям из оглавления, без чтения файла
+    целиком. Если оглавление устарело, смещения собираются одним
+    проходом по снимку; записи разбираются по одной и не задерживаются
+    в памяти. Поиск тоже просматривает отображённый файл (индекс в
+    памяти не строится). Журнал учитывается, но сохранение и сжатие
+    недоступны.
+    """
+
+    full_text_search = True
+    read_only = True
+    TITLE_WEIGHT = 3.0
+    SEARCH_CHECK = 256  # записей между проверками отмены поиска
+    # Прочитав столько байт, отпускаем страницы файла (MADV_DONTNEED), чтобы
+    # проход по всему снимку не держал его целиком в памяти процесса
+    RELEASE_BYTES = 32 * 1024 * 1024
+
+    def __init__(self, path=None, packed=False):
+        super().__init__(path, lazy=True, packed=packed)
+        self.file = None
+        self.map = None
+        self.touched = 0  # байт прочитано с последнего освобождения страниц
+
+    def load(self):
+        """Оглавление (или проход по снимку) и журнал; файлы не меняются"""
+        if not os.path.exists(self.path) and os.path.exists(self.other_path):
+            # Снимок есть только в другом формате - читаем его как есть
+            self.path, self.other_path = self.other_path, self.path
+        self._open_map()
+        notes = self._load_index()
+        if notes is None:
+            notes = self._scan()
+
+        by_id = {note.id: note for note in notes}
+        front = []
+        for path in (self.old_journal_path, self.journal_path):
+            self._replay(path, notes, by_id, front)
+        notes = [note for note in front[::-1] + notes if by_id.get(note.id) is note]
+        if len(by_id) != len(notes):
+            raise ValueError(f"В {self.path} повторяются id заметок: "
+                             f"откройте хранилище один раз в обычном режиме")
+        self.reserve_ids(notes)
+        self.written = {note.id: fingerprint(note) for note in notes}
+        return notes
+
+    def _open_map(self):
+        self.close()
+        if not os.path.exists(self.path) or os.path.getsize(self.path) == 0:
+            return
+        self.file = open(self.path, 'rb')
+        self.map = mmap.mmap(self.file.fileno(), 0, access=mmap.ACCESS_READ)
+        self.packed = self.map[:len(MAGIC)] == MAGIC
+
+    def _accepts_format(self, snapshot_format):
+        # Кодек указан в каждой записи, важен только вид снимка
+        return snapshot_format.startswith('pack') == self.packed
+
+    def _records(self):
+        """Записи снимка по порядку: (смещение, длина)"""
+        data = self.map
+        if data is None:
+            return
+        if self.packed:
+            position = len(MAGIC)
+            while position < len(data):
+                if position + FRAME.size > len(data):
+                    raise ValueError(f"Снимок {self.path} обрывается посреди записи")
+                _, length = FRAME.unpack_from(data, position)
+                yield position, FRAME.size + length
+                position += FRAME.size + length
+            return
+        # JSON: по записи на строку между '[' и ']'
+        position = data.find(b'\n') + 1
+        while position < len(data):
+            end = data.find(b'\n', position)
+            if end < 0:
+                end = len(data)
+            length = end - position
+            if data[end - 1:end] == b',':
+                length -= 1
+            if length > 0 and data[position:position + 1] == b'{':
+                yield position, length
+            position = end + 1
+
+    def _decode(self, offset, length):
+        """(id, заголовок, текст, создано, изменено) записи по смещению"""
+        data = self.map[offset:offset + length]
+        self.touched += length
+        if self.touched > self.RELEASE_BYTES and hasattr(mmap, 'MADV_DONTNEED'):
+            self.map.madvise(mmap.MADV_DONTNEED)
+            self.touched = 0
+        if self.packed:
+            return decode_record(data)
+        try:
+            record = json.loads(data)
+        except ValueError:
+            raise ValueError(f"Снимок {self.path} в старом формате: "
+                             f"откройте хранилище один раз в обычном режиме")
+        return (record['id'], record.get('title', ''), record.get('content', ''),
+                parse_time(record.get('created')), parse_time(record.get('modified')))
+
+    def _scan(self):
+        """Заметки без текстов и смещения - проходом по снимку"""
+        notes = []
+        self.offsets = {}
+        for offset, length in self._records():
+            note_id, title, content, created, modified = self._decode(offset, length)
+            notes.append(Note.unloaded(note_id, title, make_preview(content),
+                                       len(content.split()), len(content), created, modified))
+            self.offsets[note_id] = (offset, length)
+        return notes
+
+    def read_contents(self, notes):
+        """Тексты незагруженных заметок - срезами отображённого снимка"""
+        contents = {}
+        for note in notes:
+            if note.loaded:
+                continue
+            if note.id not in self.offsets:
+                raise ValueError(f"Текст заметки {note.id} не найден в {self.path}")
+            note_id, _, content, _, _ = self._decode(*self.offsets[note.id])
+            if note_id != note.id:
+                raise ValueError(f"Оглавление не соответствует {self.path}")
+            contents[note.id] = content
+        return contents
+
+    def search(self, query, progress=None):
+        """{id: оценка} заметок снимка, содержащих каждое слово query (без учёта регистра)
+
+        Оценка - число вхождений слов, в заголовке с весом TITLE_WEIGHT.
+        Заметки из журнала уже в памяти, их проверяет вызывающий. Поиск
+        проходит весь снимок, поэтому окно выполняет его в пуле потоков и
+        отменяет через progress, когда запрос меняется.
+        """
+        terms = list(dict.fromkeys(query.lower().split()))
+        found = {}
+        if not terms:
+            return found
+        records = sorted(self.offsets.items(), key=lambda item: item[1])
+        if progress is not None:
+            progress.total = len(records)
+        for i, (note_id, (offset, length)) in enumerate(records):
+            if progress is not None and i % self.SEARCH_CHECK == 0:
+                progress.check()
+                progress.done = i
+            _, title, content, _, _ = self._decode(offset, length)
+            title, content = title.lower(), content.lower()
+            score = 0
+            for term in terms:
+                count = self.TITLE_WEIGHT * title.count(term) + content.count(term)
+                if not count:
+                    break
+                score += count
+            else:
+                found[note_id] = float(score)
+        return found
+
+    def save(self, notes=None, dirty=None, deleted=None, order=()):
+        raise PermissionError(f"Хранилище {self.path} открыто только для чтения")
+
+    def needs_compaction(self):
+        return False
+
+    def compact(self, notes, background=True):
+        self.save()
+
+    def close(self):
+        if self.map is not None:
+            self.map.close()
+            self.file.close()
+            self.map = self.file = None
+
+
+class SqliteStore(NoteStore):
+    """Хранилище заметок в SQLite с полнотекстовым поиском FTS5
+
+    В память загружаются только заголовки, превью и счётчики; текст
+    заметки читается при открытии (load_content). Поиск подстроки
+    выполняет FTS5 с токенизатором trigram. При первом запуске заметки
+    однократно переносятся из notes_data.json (или notes_data.pack).
+    """
+
+    full_text_search = True
+
+    SCHEMA = '''
+        CREATE TABLE IF NOT EXISTS notes (
+            id INTEGER PRIMARY KEY,
+            position INTEGER NOT NULL,
+            title TEXT NOT NULL,
+            content TEXT NOT NULL,
+            preview TEXT NOT NULL,
+            words INTEGER NOT NULL,
+            chars INTEGER NOT NULL,
+            created TEXT NOT NULL,
+            modified TEXT NOT NULL
+        );
+        CREATE INDEX IF NOT EXISTS notes_position ON notes(position);
+        CREATE INDEX IF NOT EXISTS notes_modified ON notes(modified);
+        CREATE INDEX IF NOT EXISTS notes_created ON notes(created);
+        CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT);
+        CREATE TABLE IF NOT EXISTS note_history (id INTEGER PRIMARY KEY, data TEXT NOT NULL);
+
+        CREATE VIRTUAL TABLE IF NOT EXISTS notes_fts USING fts5(
+            title, content, content='notes', content_rowid='id', tokenize='trigram');
+        CREATE TRIGGER IF NOT EXISTS notes_ai AFTER INSERT ON notes BEGIN
+            INSERT INTO notes_fts(rowid, title, content) VALUES (new.id, new.title, new.content);
+        END;
+        CREATE TRIGGER IF NOT EXISTS notes_ad AFTER DELETE ON notes BEGIN
+            INSERT INTO notes_fts(notes_fts, rowid, title, content)
+                VALUES ('delete', old.id, old.title, old.content);
+        END;
+        CREATE TRIGGER IF NOT EXISTS notes_au AFTER UPDATE OF title, content ON notes BEGIN
+            INSERT INTO notes_fts(notes_fts, rowid, title, content)
+                VALUES ('delete', old.id, old.title, old.content);
+            INSERT INTO notes_fts(rowid, title, content) VALUES (new.id, new.title, new.content);
+        END;
+    '''
+
+    TITLE_WEIGHT = 3.0
+
+    def __init__(self, path='notes.db', legacy_path='notes_data.json'):
+        super().__init__()
+        self.path = path
+        self.legacy_path = legacy_path
+        # Соединение используется и потоком интерфейса, и потоком автосохранения
+        self.conn = sqlite3.connect(path, check_same_thread=False)
+        self.conn.create_function('py_lower', 1, str.lower, deterministic=True)
+        self.conn.create_function('py_epoch', 1, parse_time, deterministic=True)
+        self.conn.executescript(self.SCHEMA)
+        self._upgrade()
+
+    def _upgrade(self):
+        """Перевод времени заметок из строк старого формата в секунды эпохи"""
+        if self.conn.execute("SELECT 1 FROM meta WHERE key = 'epoch_times'").fetchone():
+            return
+        with self.conn:
+            self.conn.execute('UPDATE notes SET created = py_epoch(created), '
+                              'modified = py_epoch(modified)')
+            self.conn.execute("INSERT INTO meta (key, value) VALUES ('epoch_times', '1')")
+
+    def load(self):
+        """Чтение заголовков и превью; тексты остаются в базе"""
+        with self.lock:
+            self._migrate()
+            rows = self.conn.execute(
+                'SELECT id, title, preview, words, chars, created, modified '
+                'FROM notes ORDER BY position').fetchall()
+            counter = self.conn.execute("SELECT value FROM meta WHERE key = 'next_id'").fetchone()
+        notes = [Note.unloaded(row[0], row[1], row[2], row[3], row[4],
+                               parse_time(row[5]), parse_time(row[6])) for row in rows]
+        self.next_id = int(counter[0]) if counter else 0
+        self.reserve_ids(notes)
+        self.written = {note.id: fingerprint(note) for note in notes}
+        return notes
+
+    def _migrate(self):
+        """Однократный перенос заметок из JSON-хранилища"""
+        if self.conn.execute("SELECT 1 FROM meta WHERE key = 'migrated'").fetchone():
+            return
+        notes = []
+        # Снимок хранилища journal - JSON или двоичный (snapshot_format: packed)
+        packed_path = os.path.splitext(self.legacy_path or '')[0] + '.pack'
+        source = next((path for path in (self.legacy_path, packed_path)
+                       if self.legacy_path and os.path.exists(path)), None)
+        if source is not None:
+            if not self.conn.execute('SELECT 1 FROM notes LIMIT 1').fetchone():
+                legacy = JournalStore(source, lazy=False, packed=source == packed_path)
+                notes = legacy.load()
+                self.next_id = legacy.next_id
+        with self.conn:
+            self.conn.executemany(
+                'INSERT INTO notes (id, position, title, content, preview, words, chars, '
+                'created, modified) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)',
+                (self._row(note, position) for position, note in enumerate(notes)))
+            self.conn.execute("INSERT INTO meta (key, value) VALUES ('migrated', ?)",
+                              (self.legacy_path or '',))
+            self._store_next_id()
+
+    def _store_next_id(self):
+        self.conn.execute("INSERT OR REPLACE INTO meta (key, value) VALUES ('next_id', ?)",
+                          (str(self.next_id),))
+
+    @staticmethod
+    def _row(note, position):
+        return (note.id, position, note.title, note.content, note.preview,
+                note.words, note.chars, note.created, note.modified)
+
+    def save(self, notes=None, dirty=None, deleted=None, order=()):
+        """Запись изменённых заметок одной транзакцией; возвращает число записей"""
+        with self.lock:
+            changed, deleted, lead = self.changes(notes, dirty, deleted, order)
+            if not changed and not deleted:
+                return 0
+
+            with self.conn:
+                self.conn.executemany('DELETE FROM notes WHERE id = ?',
+                                      [(note_id,) for note_id in deleted])
+                low, high = self.conn.execute(
+                    'SELECT min(position), max(position) FROM notes').fetchone()
+                low = 0 if low is None else low
+                high = -1 if high is None else high
+
+                # Новые заметки в начале списка получают позиции перед остальными
+                for position, note in reversed(changed):
+                    if position < lead:
+                        low -= 1
+                        self._insert(note, low)
+                for position, note in changed:
+                    if position < lead:
+                        continue
+                    if note.id not in self.written:
+                        high += 1
+                        self._insert(note, high)
+                    elif note.loaded:
+                        self.conn.execute(
+                            'UPDATE notes SET title = ?, content = ?, preview = ?, words = ?, '
+                            'chars = ?, modified = ? WHERE id = ?',
+                            (note.title, note.content, note.preview, note.words,
+                             note.chars, note.modified, note.id))
+                    else:
+                        self.conn.execute('UPDATE notes SET title = ?, modified = ? WHERE id = ?',
+                                          (note.title, note.modified, note.id))
+                self._store_next_id()
+
+            for note_id in deleted:
+                del self.written[note_id]
+            for _, note in changed:
+                self.written[note.id] = fingerprint(note)
+            return len(changed) + len(deleted)
+
+    def _insert(self, note, position):
+        self.conn.execute(
+            'INSERT INTO notes (id, position, title, content, preview, words, chars, '
+            'created, modified) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)', self._row(note, position))
+
+    def read_contents(self, notes):
+        """Тексты незагруженных заметок из базы (пачками)"""
+        missing = [note.id for note in notes if not note.loaded]
+        contents = {}
+        with self.lock:
+            for start in range(0, len(missing), 500):
+                chunk = missing[start:start + 500]
+                contents.update(self.conn.execute(
+                    'SELECT id, content FROM notes WHERE id IN (%s)' % ','.join('?' * len(chunk)),
+                    chunk).fetchall())
+        return contents
+
+    def can_reload(self, note):
+        """Заметка записана в базу и с тех пор не менялась"""
+        return same_version(self.written.get(note.id), fingerprint(note))
+
+    def search(self, query, progress=None):
+        """{id: оценка} заметок, содержащих каждое слово query как подстроку
+
+        Слова запроса - части через пробел, без учёта регистра. Оценка -
+        bm25 из FTS5 с заголовком, весящим как TITLE_WEIGHT текстов
+        (больше - лучше). Слова короче трёх символов триграммы не ищут:
+        они проверяются через instr, а если длинных слов нет, оценка
+        только считает слова, совпавшие в заголовке.
+        """
+        terms = list(dict.fromkeys(query.lower().split()))
+        if not terms:
+            return {}
+        long_terms = [term for term in terms if len(term) >= 3]
+        short_terms = [term for term in terms if len(term) < 3]
+        short_filter = ''.join(' AND (instr(py_lower(title), ?) OR instr(py_lower(content), ?))'
+                               for _ in short_terms)
+        short_args = [term for term in short_terms for _ in range(2)]
+        with self.lock:
+            if long_terms:
+                # Триграммный токенизатор ищет фразу в кавычках как подстроку;
+                # каждое слово - отдельная фраза, все обязательны
+                match = ' AND '.join('"%s"' % term.replace('"', '""') for term in long_terms)
+                rows = self.conn.execute(
+                    'SELECT rowid, -bm25(notes_fts, ?, 1.0) FROM notes_fts '
+                    'WHERE notes_fts MATCH ?' + short_filter,
+                    [self.TITLE_WEIGHT, match] + short_args)
+            else:
+                title_score = ' + '.join('(instr(py_lower(title), ?) > 0)' for _ in short_terms)
+                rows = self.conn.execute(
+                    'SELECT id, ' + title_score + ' FROM notes WHERE 1' + short_filter,
+                    short_terms + short_args)
+            return {row[0]: float(row[1]) for row in rows}
+
+    def load_history(self, note_id):
+        with self.lock:
+            row = self.conn.execute('SELECT data FROM note_history WHERE id = ?',
+                                    (note_id,)).fetchone()
+        return json.loads(row[0]) if row else None
+
+    def save_histories(self, histories):
+        """Запись историй правок одной транзакцией"""
+        with self.lock, self.conn:
+            self.conn.executemany('DELETE FROM note_history WHERE id = ?',
+                                  [(note_id,) for note_id, data in histories.items()
+                                   if data is None])
+            self.conn.executemany(
+                'INSERT OR REPLACE INTO note_history (id, data) VALUES (?, ?)',
+                [(note_id, json.dumps(data, ensure_ascii=False))
+                 for note_id, data in histories.items() if data is not None])
+
+    def compact(self, notes, background=True):
+        """Запись изменений и оптимизация полнотекстового индекса"""
+        self.save(notes)
+        with self.lock:
+            with self.conn:
+                self.conn.execute("INSERT INTO notes_fts(notes_fts) VALUES ('optimize')")
+            self.conn.execute('VACUUM')
+
+    def close(self):
+        with self.lock:
+            self.conn.close()
+
+
+class ChangeTracker:
+    """Учёт изменённых и удалённых заметок между автосохранениями
+
+    Обработчики интерфейса отмечают конкретные заметки, и автосохранение
+    передаёт хранилищу только их. Если ничего не отмечено, запись на
+    диск не выполняется вовсе.
+    """
+
+    def __init__(self):
+        self.dirty = {}       # id -> изменённая заметка
+        self.deleted = set()  # id удалённых заметок
+        self.full = False     # набор заметок заменён целиком
+        self.histories = {}   # id -> изменённая история правок (NoteHistory) или None
+        self.failed_histories = {}  # id -> словарь истории, не записанный из-за ошибки
+        # id -> число снимков с историей заметки, ещё не записанных потоком записи
+        self.histories_in_flight = Counter()
+        self.lock = threading.Lock()
+        self.counters = {
+            'autosaves': 0,       # циклов автосохранения
+            'idle_skips': 0,      # циклов без изменений и без записи на диск
+            'notes_marked': 0,    # отметок «изменено»/«удалено»
+            'notes_written': 0,   # записей, реально отправленных в хранилище
+            'writes_avoided': 0,  # пропущенные циклы + отметки без фактических изменений
+        }
+
+    def __bool__(self):
+        return bool(self.dirty or self.deleted or self.full or
+                    self.histories or self.failed_histories)
+
+    def mark(self, note):
+        """Заметка изменена или создана"""
+        with self.lock:
+            self.dirty[note.id] = note
+            self.deleted.discard(note.id)
+            self.counters['notes_marked'] += 1
+
+    def mark_deleted(self, note):
+        """Заметка удалена"""
+        with self.lock:
+            self.dirty.pop(note.id, None)
+            self.deleted.add(note.id)
+            self.counters['notes_marked'] += 1
+
+    def mark_history(self, note_id, history):
+        """История правок заметки изменена (None - удалена вместе с заметкой)"""
+        with self.lock:
+            self.histories[note_id] = history
+
+    def history_pending(self, note_id):
+        """Есть ли у заметки незаписанные изменения истории
+
+        Учитываются и истории, уже взятые в снимок, пока поток записи их
+        не записал: вытесненная из памяти история читалась бы из хранилища
+        устаревшей.
+        """
+        with self.lock:
+            return (note_id in self.histories or note_id in self.failed_histories or
+                    note_id in self.histories_in_flight)
+
+    def mark_all(self):
+        """Набор заметок заменён целиком - при сохранении нужна полная сверка"""
+        with self.lock:
+            self.full = True
+
+    def take(self):
+        """Забрать накопленные изменения: (dirty, deleted, full)"""
+        with self.lock:
+            changes = (self.dirty, self.deleted, self.full)
+            self.dirty, self.deleted, self.full = {}, set(), False
+            return changes
+
+    def restore(self, dirty, deleted, full, histories=None):
+        """Вернуть изменения после неудачной записи
+
+        Более поздние отметки (и удаления) того же id важнее возвращаемых.
+        """
+        with self.lock:
+            for note_id, data in (histories or {}).items():
+                if note_id not in self.histories:
+                    self.failed_histories.setdefault(note_id, data)
+            for note_id, note in dirty.items():
+                if note_id not in self.deleted:
+                    self.dirty.setdefault(note_id, note)
+            self.deleted |= set(deleted) - self.dirty.keys()
+            self.full = self.full or full
+
+    def snapshot(self, notes, compact=False):
+        """Неизменяемый снимок накопленных изменений для потока записи
+
+        Вызывается в потоке интерфейса. Копируются только отмеченные
+        заметки (строки неизменяемы, достаточно поверхностной копии);
+        весь список копируется лишь при полной замене или сжатии.
+        Возвращает None, если записывать нечего.
+        """
+        with self.lock:
+            self.counters['autosaves'] += 1
+            if not self and not compact:
+                self.counters['idle_skips'] += 1
+                self.counters['writes_avoided'] += 1
+                return None
+        dirty, deleted, full = self.take()
+        with self.lock:
+            histories, self.histories = self.histories, {}
+            failed, self.failed_histories = self.failed_histories, {}
+            self.histories_in_flight.update(histories.keys() | failed.keys())
+        # Истории сериализуются здесь, в потоке интерфейса, который их меняет
+        failed.update((note_id, history.to_dict() if history is not None else None)
+                      for note_id, history in histories.items())
+        copies = {note_id: note.copy() for note_id, note in dirty.items()}
+        # Новые заметки стоят в начале списка и все отмечены, поэтому
+        # для их порядка хватает len(dirty) + 1 первых id
+        order = tuple(note.id for note in notes[:len(dirty) + 1])
+        snapshot_notes = tuple(note.copy() for note in notes) if full or compact else None
+        return SaveSnapshot(copies, frozenset(deleted), order, full, snapshot_notes, compact,
+                            failed)
+
+    def apply(self, store, snapshot):
+        """Запись снимка в хранилище (в потоке записи); возвращает число записей"""
+        try:
+            if snapshot.full:
+                written = store.save(snapshot.notes)
+            else:
+                written = store.save(dirty=snapshot.dirty, deleted=snapshot.deleted,
+                                     order=snapshot.order)
+            if snapshot.histories:
+                store.save_histories(snapshot.histories)
+            if snapshot.compact:
+                store.compact(snapshot.notes, background=False)
+        except Exception:
+            self.restore(snapshot.dirty, snapshot.deleted, snapshot.full, snapshot.histories)
+            raise
+        finally:
+            # Записанные (или возвращённые в failed_histories) истории можно вытеснять
+            with self.lock:
+                self.histories_in_flight.subtract(snapshot.histories.keys())
+                for note_id in snapshot.histories:
+                    if self.histories_in_flight[note_id] <= 0:
+                        del self.histories_in_flight[note_id]
+
+        with self.lock:
+            self.counters['notes_written'] += written
+            if not snapshot.full:
+                avoided = len(snapshot.dirty) + len(snapshot.deleted) - written
+                self.counters['writes_avoided'] += max(0, avoided)
+        return written
+
+    def flush(self, store, notes):
+        """Синхронная запись накопленных изменений; возвращает число записей"""
+        snapshot = self.snapshot(notes)
+        return self.apply(store, snapshot) if snapshot is not None else 0
+
+
+# Снимок изменений, передаваемый из потока интерфейса в поток записи
+SaveSnapshot = namedtuple('SaveSnapshot', 'dirty deleted order full notes compact histories')
+
+
+class StoreWriter:
+    """Поток записи в хранилище
+
+    Поток интерфейса кладёт в очередь готовые снимки (SaveSnapshot) и
+    сразу продолжает работу; сериализация и запись на диск идут здесь.
+    Снимки обрабатываются строго по очереди, поэтому порядок записей
+    совпадает с порядком правок. Ошибки не глотаются, а сохраняются в
+    errors, откуда их забирает интерфейс.
+    """
+
+    def __init__(self, store, tracker):
+        self.store = store
+        self.tracker = tracker
+        self.queue = queue.Queue()
+        self.errors = queue.Queue()
+        self.thread = threading.Thread(target=self._run, name='store-writer', daemon=True)
+        self.thread.start()
+
+    def submit(self, snapshot):
+        self.queue.put(snapshot)
+
+    def _run(self):
+        while True:
+            snapshot = self.queue.get()
+            if snapshot is None:
+                break
+            try:
+                self.tracker.apply(self.store, snapshot)
+            except Exception as e:
+                # Отметки уже возвращены трекеру - запись повторится в следующем цикле
+                self.errors.put(e)
+
+    def pending_errors(self):
+        """Ошибки записи (и фонового сжатия хранилища), накопившиеся с прошлого вызова"""
+        errors = []
+        while True:
+            try:
+                errors.append(self.errors.get_nowait())
+            except queue.Empty:
+                return errors + self.store.background_errors()
+
+    def close(self):
+        """Дождаться записи всех снимков и остановить поток"""
+        self.queue.put(None)
+        self.thread.join()
+
+
+class ContentCache:
+    """Выгрузка текстов заметок, к которым давно не обращались
+
+    Учитываются заметки, текст которых хранилище может прочитать снова.
+    Пока суммарный размер текстов больше budget символов, выгружаются
+    тексты заметок, открытых раньше всех; в памяти остаются заголовок,
+    превью и счётчики. Несохранённые правки не выгружаются - это
+    проверяет хранилище (can_reload).
+    """
+
+    BUDGET = 4 * 1024 * 1024  # символов
+
+    def __init__(self, store, budget=BUDGET):
+        self.store = store
+        self.budget = budget
+        self.recent = OrderedDict()  # id -> (заметка, размер текста), старые в начале
+        self.size = 0
+
+    def touch(self, note):
+        """Обращение к тексту заметки: она становится самой свежей"""
+        self.forget(note)
+        if not note.loaded or not self.store.can_reload(note):
+            return
+        size = note.chars
+        self.recent[note.id] = (note, size)
+        self.size += size
+        self.trim()
+
+    def forget(self, note):
+        """Заметка удалена или заменена"""
+        entry = self.recent.pop(note.id, None)
+        if entry is not None:
+            self.size -= entry[1]
+
+    def clear(self):
+        self.recent.clear()
+        self.size = 0
+
+    def trim(self):
+        """Выгрузка самых старых текстов сверх бюджета; самая свежая заметка остаётся
+
+        Заметку, которую выгрузить нельзя, кэш просто перестаёт учитывать:
+        при следующем открытии она будет учтена заново.
+        """
+        while self.size > self.budget and len(self.recent) > 1:
+            _, (note, size) = self.recent.popitem(last=False)
+            self.size -= size
+            self.store.evict(note)
+
+
+STORES = {
+    'journal': JournalStore,
+    'sqlite': SqliteStore,
+    'mmap': MappedStore,
+}
+
+
+def open_store(kind='journal', lazy=True, snapshot_format='json', compression='zlib'):
+    """Хранилище заметок по имени из настроек ('journal' или 'sqlite')
+
+    lazy - загружать при запуске только заголовки и превью (для 'journal';
+    SQLite всегда подгружает тексты по требованию). snapshot_format -
+    формат снимка 'journal': 'json' или 'packed' (двоичный, записи
+    сжимаются кодеком compression: 'zlib', 'lzma', 'none'). 'mmap' -
+    те же файлы, что у 'journal', только для чтения.
+    """
+    store_class = STORES.get(kind, JournalStore)
+    if store_class is MappedStore:
+        return MappedStore(packed=snapshot_format == 'packed')
+    if store_class is JournalStore:
+        return JournalStore(lazy=lazy, packed=snapshot_format == 'packed',
+                            compression=compression if compression in CODECS else 'zlib')
+    return store_class()
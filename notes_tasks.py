@@ -0,0 +1,107 @@
+import queue
+import sys
+from concurrent.futures import ThreadPoolExecutor
+
+
+class TaskExecutor:
+    """Пул потоков для файловых операций с доставкой результатов в поток Tk
+
+    Работа выполняется в пуле, а обратные вызовы (результат, ошибка,
+    промежуточные сообщения) складываются в очередь, которую поток
+    интерфейса разбирает через root.after, пока есть незавершённые
+    задачи. Виджеты трогает только поток Tk. Название и ход выполняемых
+    задач передаются в строку состояния функцией on_status (None - задач
+    нет), ошибки без своего обработчика - функции on_error(title, error).
+    """
+
+    WORKERS = 2
+    POLL_MS = 50
+
+    def __init__(self, root, on_status=None, on_error=None, workers=WORKERS):
+        self.root = root
+        self.pool = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='notes-io')
+        self.completions = queue.Queue()  # (future или None, функция для потока Tk)
+        self.running = {}  # future -> (название, Progress или None)
+        self.on_status = on_status
+        self.on_error = on_error
+        self.status = None
+        self.poll_job = None
+
+    def submit(self, title, fn, *args, on_done=None, on_error=None, progress=None):
+        """Запуск fn(*args) в пуле; возвращает Future
+
+        on_done(result) или on_error(exception) вызываются в потоке Tk.
+        progress (notes_io.Progress) нужен для процентов в строке состояния.
+        """
+        future = self.pool.submit(fn, *args)
+        self.running[future] = (title, progress)
+
+        def finished(future):
+            # Поток пула: результат разбирается уже в потоке Tk
+            self.completions.put((future, lambda: self._deliver(future, title, on_done, on_error)))
+
+        future.add_done_callback(finished)
+        self._schedule()
+        return future
+
+    def call_soon(self, callback, *args):
+        """Вызов callback(*args) в потоке Tk; можно вызывать из задачи пула"""
+        self.completions.put((None, lambda: callback(*args)))
+
+    def _deliver(self, future, title, on_done, on_error):
+        if future.cancelled():
+            return
+        error = future.exception()
+        if error is None:
+            if on_done is not None:
+                on_done(future.result())
+        elif on_error is not None:
+            on_error(error)
+        elif self.on_error is not None:
+            self.on_error(title, error)
+
+    def _schedule(self):
+        if self.poll_job is None:
+            self.poll_job = self.root.after(self.POLL_MS, self._poll)
+
+    def _poll(self):
+        self.poll_job = None
+        callbacks = []
+        while True:
+            try:
+                future, callback = self.completions.get_nowait()
+            except queue.Empty:
+                break
+            self.running.pop(future, None)
+            callbacks.append(callback)
+        # Строка состояния обновляется до обратных вызовов, чтобы их
+        # сообщения не затирались
+        self._update_status()
+        for callback in callbacks:
+            try:
+                callback()
+            except Exception:
+                self.root.report_callback_exception(*sys.exc_info())
+        if self.running or not self.completions.empty():
+            self._schedule()
+
+    def _update_status(self):
+        status = None
+        if self.running:
+            title, progress = next(iter(self.running.values()))
+            status = title
+            if progress is not None and progress.total:
+                status += f" {int(progress.fraction * 100)}%"
+            if len(self.running) > 1:
+                status += f" (+{len(self.running) - 1})"
+        if status != self.status:
+            self.status = status
+            if self.on_status is not None:
+                self.on_status(status)
+
+    def shutdown(self, wait=True):
+        """Остановка пула; незапущенные задачи отменяются"""
+        if self.poll_job is not None:
+            self.root.after_cancel(self.poll_job)
+            self.poll_job = None
+        self.pool.shutdown(wait=wait, cancel_futures=True)
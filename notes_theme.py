@@ -0,0 +1,128 @@
+import time
+import tkinter as tk
+
+
+class ThemeRegistry:
+    """Реестр цветовых ролей виджетов для смены темы на лету
+
+    Виджет регистрируется вместе с отображением «опция -> роль»
+    (например, bg='bg_card', fg='accent'). При смене темы все
+    зарегистрированные виджеты перекрашиваются за один проход, без
+    пересоздания интерфейса. То, что не описывается ролями (стили ttk,
+    карточки списка), обновляют функции из listeners.
+    """
+
+    def __init__(self, colors):
+        self.colors = colors
+        self.widgets = []    # (виджет, {опция: роль})
+        self.listeners = []  # функции без аргументов, вызываемые после перекраски
+
+    def register(self, widget, **roles):
+        """Регистрация виджета и раскраска его по текущей теме; возвращает виджет"""
+        widget.configure(**{option: self.colors[role] for option, role in roles.items()})
+        self.widgets.append((widget, roles))
+        return widget
+
+    def on_change(self, listener):
+        self.listeners.append(listener)
+
+    def apply(self, colors):
+        """Перекраска всех виджетов в цвета новой темы"""
+        self.colors = colors
+        alive = []
+        for widget, roles in self.widgets:
+            try:
+                widget.configure(**{option: colors[role] for option, role in roles.items()})
+            except tk.TclError:
+                continue  # Виджет уже уничтожен - забываем его
+            alive.append((widget, roles))
+        self.widgets = alive
+        for listener in self.listeners:
+            listener()
+
+
+def blend(start, end, steps):
+    """Таблица из steps + 1 цветов от start до end включительно ('#rrggbb')"""
+    start_rgb = [int(start[i:i + 2], 16) for i in (1, 3, 5)]
+    end_rgb = [int(end[i:i + 2], 16) for i in (1, 3, 5)]
+    table = []
+    for step in range(steps + 1):
+        r, g, b = (int(a + (b - a) * step / steps) for a, b in zip(start_rgb, end_rgb))
+        table.append(f"#{r:02x}{g:02x}{b:02x}")
+    return table
+
+
+class HoverAnimator:
+    """Плавная смена цвета виджетов без блокировки цикла событий
+
+    Кадры планируются через root.after не чаще одного за FRAME_MS, а
+    номер кадра считается по прошедшему времени: если интерфейс занят,
+    анимация пропускает кадры, а не растягивается. Таблицы промежуточных
+    цветов считаются один раз для пары цветов темы. Новая анимация
+    виджета отменяет незавершённую и продолжает с её текущего кадра,
+    поэтому быстрое наведение и уход курсора не дают рывков.
+    """
+
+    FRAME_MS = 16       # не больше ~60 кадров в секунду
+    DURATION_MS = 160   # полный переход
+    STEPS = DURATION_MS // FRAME_MS
+
+    def __init__(self, root, theme):
+        self.root = root
+        self.theme = theme
+        self.tables = {}  # (цвет от, цвет до) -> таблица цветов
+        self.jobs = {}    # виджет -> id запланированного кадра
+        self.frames = {}  # виджет -> показанный кадр
+        theme.on_change(self.reset)
+
+    def table(self, start_role, end_role):
+        key = (self.theme.colors[start_role], self.theme.colors[end_role])
+        table = self.tables.get(key)
+        if table is None:
+            table = self.tables[key] = blend(key[0], key[1], self.STEPS)
+        return table
+
+    def animate(self, widget, start_role, end_role, forward=True):
+        """Переход bg виджета к цвету end_role (forward) или обратно к start_role"""
+        self.cancel(widget)
+        table = self.table(start_role, end_role)
+        first = self.frames.get(widget, 0)
+        target = self.STEPS if forward else 0
+        if first == target:
+            return
+        started = time.perf_counter()
+        duration = self.DURATION_MS * abs(target - first) / self.STEPS / 1000
+
+        def frame():
+            progress = min(1.0, (time.perf_counter() - started) / duration)
+            current = round(first + (target - first) * progress)
+            try:
+                widget.configure(bg=table[current])
+            except tk.TclError:
+                # Виджет уничтожен во время анимации
+                self.jobs.pop(widget, None)
+                self.frames.pop(widget, None)
+                return
+            self.frames[widget] = current
+            if current == target:
+                del self.jobs[widget]
+            else:
+                self.jobs[widget] = self.root.after(self.FRAME_MS, frame)
+
+        self.jobs[widget] = self.root.after_idle(frame)
+
+    def cancel(self, widget):
+        """Остановка анимации виджета на текущем кадре"""
+        job = self.jobs.pop(widget, None)
+        if job is not None:
+            self.root.after_cancel(job)
+
+    def reset(self):
+        """Смена темы: анимации прерываются, таблицы старых цветов не нужны
+
+        Исходные цвета виджетам уже вернул реестр тем.
+        """
+        for widget in list(self.jobs):
+            self.cancel(widget)
+        self.frames.clear()
+        self.tables.clear()
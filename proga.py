@@ -1,14 +1,296 @@
 import tkinter as tk
-from tkinter import ttk, messagebox, filedialog, font
+from tkinter import ttk, messagebox, font
 import json
-import os
 from datetime import datetime
-import threading
-import time
 import random
 
+from notes_theme import ThemeRegistry, HoverAnimator
+from notes_model import Note
+from notes_index import tokenize, snippet
+from notes_storage import (open_store, StoreWriter, ContentCache,
+                           atomic_write, read_with_fallback)
+from notes_core import NotesLibrary
+from notes_io import Progress, Cancelled, read_notes
+from notes_tasks import TaskExecutor
+from notes_history import EditHistory
+from notes_diag import Diagnostics, traced, write_snapshot
+
+class NoteCard:
+    """Карточка заметки, переиспользуемая виртуальным списком"""
+
+    def __init__(self, view):
+        self.view = view
+        self.note = None
+        self.selected = False
+
+        canvas = view.canvas
+        self.frame = tk.Frame(canvas, cursor='hand2', height=view.ROW_HEIGHT - view.ROW_GAP)
+        self.frame.pack_propagate(False)
+
+        self.title_label = tk.Label(self.frame, font=('Segoe UI', 11, 'bold'), anchor='w')
+        self.title_label.pack(fill='x', padx=18, pady=(12, 0))
+
+        # Text, а не Label: при поиске в превью подсвечиваются совпадения
+        self.preview_text = tk.Text(self.frame, font=('Segoe UI', 9), height=2, wrap='word',
+                                    bd=0, highlightthickness=0, padx=0, pady=0, cursor='hand2')
+        self.preview_text.pack(fill='x', padx=18, pady=(3, 0))
+
+        self.info_frame = tk.Frame(self.frame)
+        self.info_frame.pack(fill='x', side='bottom', padx=18, pady=(5, 12))
+
+        self.date_label = tk.Label(self.info_frame, font=('Segoe UI', 8), anchor='w')
+        self.date_label.pack(side='left')
+
+        self.words_label = tk.Label(self.info_frame, font=('Segoe UI', 8), anchor='e')
+        self.words_label.pack(side='right')
+
+        self.window = canvas.create_window(0, 0, window=self.frame, anchor='nw',
+                                           width=view.width, state='hidden')
+
+        # Обработчик клика привязывается один раз: карточка знает свою текущую заметку
+        for widget in (self.frame, self.title_label, self.preview_text,
+                       self.info_frame, self.date_label, self.words_label):
+            widget.bind('<Button-1>', self.on_click)
+
+    def on_click(self, event):
+        if self.note is not None:
+            self.view.app.select_note(self.note)
+
+    def bind_note(self, note, selected):
+        """Привязка карточки к заметке и перерисовка содержимого"""
+        self.note = note
+        self.selected = selected
+        colors = self.view.app.colors
+
+        card_bg = colors['accent'] if selected else colors['bg_card']
+        text_color = colors['text_primary']
+        secondary = text_color if selected else colors['text_secondary']
+
+        self.frame.configure(bg=card_bg,
+                             relief='solid' if selected else 'flat',
+                             bd=1 if selected else 0)
+        self.info_frame.configure(bg=card_bg)
+
+        # Заголовок заметки
+        title = note.title[:35] + "..." if len(note.title) > 35 else note.title
+        self.title_label.configure(text=f"📄 {title}", bg=card_bg, fg=text_color)
+
+        # Превью содержимого или фрагмент с совпадениями поиска
+        preview, spans = self.view.preview_of(note)
+        text = self.preview_text
+        text.configure(state='normal', bg=card_bg, fg=secondary)
+        text.delete('1.0', 'end')
+        text.insert('1.0', preview if preview.strip() else "")
+        text.tag_configure('match', background=colors['warning'], foreground=colors['bg_primary'])
+        for start, end in spans:
+            text.tag_add('match', f'1.0+{start}c', f'1.0+{end}c')
+        text.configure(state='disabled')
+
+        # Дата модификации
+        date_str = note.time_label  # Только время
+        self.date_label.configure(text=f"🕒 {date_str}", bg=card_bg, fg=secondary)
+
+        # Количество слов
+        word_count = note.words
+        self.words_label.configure(text=f"📊 {word_count} слов" if word_count > 0 else "",
+                                   bg=card_bg, fg=secondary)
+
+    def place(self, y):
+        self.view.canvas.coords(self.window, 0, y)
+        self.view.canvas.itemconfigure(self.window, state='normal')
+
+    def hide(self):
+        self.view.canvas.itemconfigure(self.window, state='hidden')
+        self.note = None
+
+
+class VirtualNotesList:
+    """Виртуализированный список заметок: рисуются только видимые карточки"""
+
+    ROW_HEIGHT = 104
+    ROW_GAP = 6
+    OVERSCAN = 2  # Запас карточек сверху и снизу видимой области
+
+    def __init__(self, app, canvas, scrollbar):
+        self.app = app
+        self.canvas = canvas
+        self.scrollbar = scrollbar
+        self.width = 1
+        self.items = []
+        self.visible = {}  # индекс в items -> карточка
+        self.free_cards = []
+        self.empty_item = None
+        self.highlight = None  # (слова запроса, {id: совпавшие слова}) при поиске
+        self.snippets = {}     # id -> (фрагмент, места подсветки)
+
+        canvas.configure(yscrollcommand=self.on_yview)
+        canvas.bind('<Configure>', self.on_configure)
+
+    def on_yview(self, first, last):
+        """Вызывается канвасом при прокрутке"""
+        self.scrollbar.set(first, last)
+        self.render()
+
+    def on_configure(self, event):
+        """Подгонка ширины карточек под ширину канваса"""
+        if event.width != self.width:
+            self.width = event.width
+            for card in list(self.visible.values()) + self.free_cards:
+                self.canvas.itemconfigure(card.window, width=self.width)
+        self.render()
+
+    def set_items(self, notes, empty_text=None, highlight=None):
+        """Замена отображаемого набора заметок
+
+        highlight - (слова запроса, {id: совпавшие слова заметки}): вместо
+        превью показываются фрагменты текста с подсветкой совпадений.
+        """
+        self.items = list(notes)
+        self.highlight = highlight
+        self.snippets = {}
+        for card in self.visible.values():
+            card.hide()
+            self.free_cards.append(card)
+        self.visible.clear()
+
+        if self.empty_item is not None:
+            self.canvas.delete(self.empty_item)
+            self.empty_item = None
+        if not self.items and empty_text:
+            self.empty_item = self.canvas.create_text(
+                self.width // 2, 30, text=empty_text, width=max(self.width - 20, 100),
+                font=('Segoe UI', 10), fill=self.app.colors['text_secondary'])
+
+        total_height = len(self.items) * self.ROW_HEIGHT
+        self.canvas.configure(scrollregion=(0, 0, self.width, total_height))
+        if self.canvas.canvasy(0) > total_height:
+            self.canvas.yview_moveto(0)
+        self.render()
+
+    def render(self):
+        """Привязка карточек из пула к заметкам, попавшим в видимую область"""
+        top = max(0, int(self.canvas.canvasy(0)))
+        height = max(self.canvas.winfo_height(), self.ROW_HEIGHT)
+        first = max(0, top // self.ROW_HEIGHT - self.OVERSCAN)
+        last = min(len(self.items), (top + height) // self.ROW_HEIGHT + 1 + self.OVERSCAN)
+
+        # Освобождаем карточки, ушедшие из видимой области
+        for index in [i for i in self.visible if i < first or i >= last]:
+            card = self.visible.pop(index)
+            card.hide()
+            self.free_cards.append(card)
+
+        current = self.app.current_note
+        for index in range(first, last):
+            note = self.items[index]
+            card = self.visible.get(index)
+            if card is None:
+                card = self.free_cards.pop() if self.free_cards else NoteCard(self)
+                self.visible[index] = card
+            if card.note is not note or card.selected != (note is current):
+                card.bind_note(note, note is current)
+            card.place(index * self.ROW_HEIGHT)
+
+    def preview_of(self, note):
+        """Текст под заголовком карточки и места подсветки в нём
+
+        Фрагменты считаются только для видимых карточек; незагруженный
+        текст читается из хранилища без кэширования.
+        """
+        if self.highlight is None:
+            return note.preview, []
+        cached = self.snippets.get(note.id)
+        if cached is None:
+            terms, words = self.highlight
+            content = note.content if note.loaded else self.app.store.read_contents([note])[note.id]
+            cached = self.snippets[note.id] = snippet(content, words.get(note.id, ()), terms)
+        return cached
+
+    def update_note(self, note):
+        """Перерисовка только карточки изменённой заметки"""
+        self.snippets.pop(note.id, None)
+        for card in self.visible.values():
+            if card.note is note:
+                card.bind_note(note, note is self.app.current_note)
+
+    def update_selection(self):
+        """Обновление подсветки выбранной заметки без перестройки списка"""
+        current = self.app.current_note
+        for card in self.visible.values():
+            if card.selected != (card.note is current):
+                card.bind_note(card.note, card.note is current)
+
+    def redraw(self):
+        """Полная перерисовка видимых карточек (например, после смены цветов)"""
+        for card in self.visible.values():
+            card.bind_note(card.note, card.note is self.app.current_note)
+        if self.empty_item is not None:
+            self.canvas.itemconfigure(self.empty_item, fill=self.app.colors['text_secondary'])
+
+
+class ProgressDialog:
+    """Окно хода фоновой операции с кнопкой отмены
+
+    Неотменяемая операция (загрузка при запуске) перехватывает ввод
+    главного окна, пока не закончится.
+    """
+
+    TICK_MS = 100
+
+    def __init__(self, app, title, progress, cancellable=True):
+        self.progress = progress
+        self.window = tk.Toplevel(app.root)
+        self.window.title(title)
+        self.window.transient(app.root)
+        self.window.resizable(False, False)
+        self.window.protocol("WM_DELETE_WINDOW", progress.cancel if cancellable else lambda: None)
+        app.theme.register(self.window, bg='bg_secondary')
+
+        self.label = app.theme.register(tk.Label(self.window, text=title, font=('Segoe UI', 10),
+                                                 anchor='w', width=40),
+                                        bg='bg_secondary', fg='text_primary')
+        self.label.pack(fill='x', padx=15, pady=(15, 5))
+        self.bar = ttk.Progressbar(self.window, maximum=1000, length=320)
+        self.bar.pack(padx=15, pady=5)
+        if cancellable:
+            cancel = app.theme.register(tk.Button(self.window, text="Отмена", font=('Segoe UI', 9),
+                                                  relief='flat', cursor='hand2',
+                                                  command=progress.cancel),
+                                        bg='bg_card', fg='text_primary')
+            cancel.pack(pady=(5, 15))
+        else:
+            self.bar.pack_configure(pady=(5, 15))
+            self.window.after_idle(self.grab)
+        self.job = self.window.after(self.TICK_MS, self.tick)
+
+    def grab(self):
+        """Перехват ввода; окно может быть ещё не показано - тогда позже"""
+        try:
+            self.window.grab_set()
+        except tk.TclError:
+            self.window.after(50, self.grab)
+
+    def tick(self):
+        self.update()
+        self.job = self.window.after(self.TICK_MS, self.tick)
+
+    def update(self, text=None):
+        self.bar['value'] = int(self.progress.fraction * 1000)
+        if self.progress.cancelled.is_set():
+            text = "Отмена..."
+        if text is not None:
+            self.label.configure(text=text)
+
+    def close(self):
+        self.window.after_cancel(self.job)
+        self.window.destroy()
+
 
 class ModernNotesApp:
+    EDIT_DEBOUNCE_MS = 300  # Пауза в наборе, после которой обрабатываются правки
+    SEARCH_LIMIT = 500      # Лучших результатов поиска в списке
+    SEARCH_DEBOUNCE_MS = 250  # Пауза в наборе запроса перед поиском
+    
     def __init__(self):
         self.root = tk.Tk()
         self.root.title("AldiyarZ Pro")
@@ -96,11 +378,38 @@ class ModernNotesApp:
         self.settings = self.load_settings()
         self.current_theme = self.settings.get('theme', 'dark')
         self.colors = self.themes[self.current_theme]
+        self.theme = ThemeRegistry(self.colors)
+        self.hover = HoverAnimator(self.root, self.theme)
         
-        self.notes = []
         self.current_note = None
+        self.edit_job = None  # отложенная обработка правок (after)
+        # Замеры обработчиков и задержки цикла событий (Ctrl+Shift+D)
+        self.diag = Diagnostics(self.root, self.settings.get('diagnostics', False))
+        self.diag_job = None
+        # Список заметок, поиск и статистика - без интерфейса, в notes_core
+        self.library = NotesLibrary(open_store(self.settings.get('storage', 'journal'),
+                                               lazy=self.settings.get('lazy_load', True),
+                                               snapshot_format=self.settings.get('snapshot_format', 'json'),
+                                               compression=self.settings.get('compression', 'zlib')),
+                                    self.settings.get('content_cache_chars', ContentCache.BUDGET),
+                                    self.settings.get('history_chars', EditHistory.BUDGET))
+        self.store = self.library.store
+        self.read_only = self.store.read_only  # "storage": "mmap" - только просмотр
+        self.change_tracker = self.library.change_tracker
+        self.content_cache = self.library.content_cache
+        self.note_stats = self.library.note_stats
+        self.store_writer = StoreWriter(self.store, self.change_tracker)
+        # Файловые операции - в пуле потоков, результаты - в потоке Tk
+        self.tasks = TaskExecutor(self.root, on_status=self.show_task_status,
+                                  on_error=self.report_task_error)
+        self.closing = False
+        self.loaded = False  # заметки прочитаны и первый экран показан
+        self.load_task = None  # чтение хранилища при запуске, пока не обработано
         self.search_var = tk.StringVar()
-        self.search_var.trace('w', self.search_notes)
+        self.search_job = None       # отложенный поиск (after)
+        self.search_progress = None  # поиск в хранилище, идущий в пуле
+        self.partial_search = False  # показаны результаты по недостроенному индексу
+        self.search_var.trace('w', self.on_search_change)
         
         # Статистика
         self.stats = {
@@ -111,13 +420,19 @@ class ModernNotesApp:
         
         self.setup_styles()
         self.create_ui()
+        self.theme.on_change(self.restyle)
         self.load_notes()
-        self.start_autosave()
-        self.start_motivational_quotes()
+        # Таймеры - после первой отрисовки окна
+        self.root.after_idle(self.start_timers)
         
         # Горячие клавиши
         self.setup_hotkeys()
         
+    @property
+    def notes(self):
+        """Заметки в порядке списка (хранятся в self.library)"""
+        return self.library.notes
+
     def center_window(self):
         """Центрирование окна на экране"""
         self.root.update_idletasks()
@@ -139,19 +454,44 @@ class ModernNotesApp:
         
     def create_ui(self):
         """Создание современного пользовательского интерфейса"""
-        self.root.configure(bg=self.colors['bg_primary'])
+        self.theme.register(self.root, bg='bg_primary')
         
         # Главный контейнер
         main_frame = ttk.Frame(self.root, style='Modern.TFrame')
         main_frame.pack(fill='both', expand=True, padx=2, pady=2)
         
+        # Кнопки, меняющие заметки: в режиме только для чтения отключаются
+        self.edit_buttons = []
+        
         # Создание панелей
         self.create_sidebar(main_frame)
         self.create_main_area(main_frame)
+        if self.read_only:
+            self.set_read_only()
+        
+    def set_read_only(self):
+        """Режим только для чтения: заметки можно смотреть, искать и выгружать
+
+        Поля редактора блокируются, кнопки создания, загрузки, удаления и
+        очистки отключаются.
+        """
+        for btn in self.edit_buttons:
+            btn.configure(state='disabled')
+        self.title_entry.configure(state='readonly')
+        self.text_area.configure(state='disabled')
+        self.root.title(f"{self.root.title()} — только чтение")
+        
+    def check_writable(self):
+        """False (с подсказкой в информационной метке), если хранилище только для чтения"""
+        if self.read_only:
+            self.info_label.configure(text="🔒 Хранилище открыто только для чтения")
+            return False
+        return True
         
     def create_sidebar(self, parent):
         """Создание боковой панели с заметками"""
-        sidebar = tk.Frame(parent, bg=self.colors['bg_secondary'], width=380)
+        sidebar = tk.Frame(parent, width=380)
+        self.theme.register(sidebar, bg='bg_secondary')
         sidebar.pack(side='left', fill='y', padx=(0, 2))
         sidebar.pack_propagate(False)
         
@@ -161,6 +501,9 @@ class ModernNotesApp:
         # Статистика
         self.create_stats_panel(sidebar)
         
+        # Диагностика (показывается по Ctrl+Shift+D)
+        self.create_diagnostics_panel(sidebar)
+        
         # Кнопки действий
         self.create_action_buttons(sidebar)
         
@@ -172,27 +515,27 @@ class ModernNotesApp:
         
     def create_header(self, parent):
         """Создание заголовка"""
-        header_frame = tk.Frame(parent, bg=self.colors['bg_secondary'], height=100)
+        header_frame = tk.Frame(parent, height=100)
+        self.theme.register(header_frame, bg='bg_secondary')
         header_frame.pack(fill='x', pady=(20, 10), padx=20)
         header_frame.pack_propagate(False)
         
         # Анимированный заголовок
         title_label = tk.Label(header_frame, text="✨ ZametkaAldiyara Pro", 
-                              font=('Segoe UI', 20, 'bold'),
-                              bg=self.colors['bg_secondary'],
-                              fg=self.colors['accent'])
+                              font=('Segoe UI', 20, 'bold'))
+        self.theme.register(title_label, bg='bg_secondary', fg='accent')
         title_label.pack(pady=(15, 10))
         
         # Поле поиска с иконкой
-        search_frame = tk.Frame(header_frame, bg=self.colors['bg_secondary'])
+        search_frame = tk.Frame(header_frame)
+        self.theme.register(search_frame, bg='bg_secondary')
         search_frame.pack(fill='x')
         
         self.search_entry = tk.Entry(search_frame, textvariable=self.search_var,
                                     font=('Segoe UI', 11),
-                                    bg=self.colors['bg_card'],
-                                    fg=self.colors['text_primary'],
-                                    insertbackground=self.colors['text_primary'],
                                     relief='flat', bd=10)
+        self.theme.register(self.search_entry, bg='bg_card', fg='text_primary',
+                            insertbackground='text_primary')
         self.search_entry.pack(fill='x', ipady=10)
         self.search_entry.insert(0, "🔍 Найти заметку...")
         self.search_entry.bind('<FocusIn>', self.on_search_focus_in)
@@ -202,63 +545,94 @@ class ModernNotesApp:
         
     def create_stats_panel(self, parent):
         """Создание панели статистики"""
-        stats_frame = tk.Frame(parent, bg=self.colors['bg_card'], height=80)
-        stats_frame.pack(fill='x', pady=10, padx=20)
-        stats_frame.pack_propagate(False)
+        self.stats_frame = tk.Frame(parent, height=80)
+        self.theme.register(self.stats_frame, bg='bg_card')
+        self.stats_frame.pack(fill='x', pady=10, padx=20)
+        self.stats_frame.pack_propagate(False)
         
         # Статистика в строку
-        stats_container = tk.Frame(stats_frame, bg=self.colors['bg_card'])
+        stats_container = tk.Frame(self.stats_frame)
+        self.theme.register(stats_container, bg='bg_card')
         stats_container.pack(expand=True, fill='both', pady=15)
         
         # Количество заметок
-        notes_frame = tk.Frame(stats_container, bg=self.colors['bg_card'])
+        notes_frame = tk.Frame(stats_container)
+        self.theme.register(notes_frame, bg='bg_card')
         notes_frame.pack(side='left', expand=True, fill='x')
         
         self.notes_count_label = tk.Label(notes_frame, text="0", 
-                                         font=('Segoe UI', 16, 'bold'),
-                                         bg=self.colors['bg_card'],
-                                         fg=self.colors['accent'])
+                                         font=('Segoe UI', 16, 'bold'))
+        self.theme.register(self.notes_count_label, bg='bg_card', fg='accent')
         self.notes_count_label.pack()
         
-        tk.Label(notes_frame, text="Заметок", 
-                font=('Segoe UI', 9),
-                bg=self.colors['bg_card'],
-                fg=self.colors['text_secondary']).pack()
+        self.theme.register(tk.Label(notes_frame, text="Заметок",
+                                     font=('Segoe UI', 9)),
+                            bg='bg_card', fg='text_secondary').pack()
         
         # Количество слов
-        words_frame = tk.Frame(stats_container, bg=self.colors['bg_card'])
+        words_frame = tk.Frame(stats_container)
+        self.theme.register(words_frame, bg='bg_card')
         words_frame.pack(side='left', expand=True, fill='x')
         
         self.words_count_label = tk.Label(words_frame, text="0", 
-                                         font=('Segoe UI', 16, 'bold'),
-                                         bg=self.colors['bg_card'],
-                                         fg=self.colors['success'])
+                                         font=('Segoe UI', 16, 'bold'))
+        self.theme.register(self.words_count_label, bg='bg_card', fg='success')
         self.words_count_label.pack()
         
-        tk.Label(words_frame, text="Слов", 
-                font=('Segoe UI', 9),
-                bg=self.colors['bg_card'],
-                fg=self.colors['text_secondary']).pack()
+        self.theme.register(tk.Label(words_frame, text="Слов",
+                                     font=('Segoe UI', 9)),
+                            bg='bg_card', fg='text_secondary').pack()
+        
+    def create_diagnostics_panel(self, parent):
+        """Создание панели диагностики: гистограммы времени обработчиков"""
+        self.diag_frame = tk.Frame(parent)
+        self.theme.register(self.diag_frame, bg='bg_card')
+        
+        self.diag_label = tk.Label(self.diag_frame, text="", justify='left', anchor='w',
+                                   font=('Consolas', 8))
+        self.theme.register(self.diag_label, bg='bg_card', fg='text_secondary')
+        self.diag_label.pack(fill='x', padx=10, pady=(8, 4))
+        
+        buttons = tk.Frame(self.diag_frame)
+        self.theme.register(buttons, bg='bg_card')
+        buttons.pack(fill='x', padx=10, pady=(0, 8))
+        
+        self.profile_btn = tk.Button(buttons, text="⏺ Профиль", font=('Segoe UI', 9),
+                                     relief='flat', bd=0, cursor='hand2',
+                                     command=self.toggle_profile)
+        self.theme.register(self.profile_btn, bg='bg_secondary', fg='text_primary')
+        self.profile_btn.pack(side='left', fill='x', expand=True, padx=(0, 5), ipady=3)
+        
+        dump_btn = tk.Button(buttons, text="💾 JSON", font=('Segoe UI', 9),
+                             relief='flat', bd=0, cursor='hand2',
+                             command=self.dump_diagnostics)
+        self.theme.register(dump_btn, bg='bg_secondary', fg='text_primary')
+        dump_btn.pack(side='right', fill='x', expand=True, padx=(5, 0), ipady=3)
+        
+        if self.diag.enabled:
+            self.show_diagnostics()
         
     def create_action_buttons(self, parent):
         """Создание кнопок действий"""
-        buttons_frame = tk.Frame(parent, bg=self.colors['bg_secondary'])
+        buttons_frame = tk.Frame(parent)
+        self.theme.register(buttons_frame, bg='bg_secondary')
         buttons_frame.pack(fill='x', pady=10, padx=20)
         
         # Главная кнопка создания заметки
         self.new_note_btn = tk.Button(buttons_frame, text="🖊 Новая заметка",
                                      font=('Segoe UI', 12, 'bold'),
-                                     bg=self.colors['accent'],
-                                     fg=self.colors['text_primary'],
                                      relief='flat', bd=0,
                                      cursor='hand2',
                                      command=self.create_new_note)
+        self.theme.register(self.new_note_btn, bg='accent', fg='text_primary')
         self.new_note_btn.pack(fill='x', ipady=15)
+        self.edit_buttons.append(self.new_note_btn)
         self.new_note_btn.bind('<Enter>', lambda e: self.button_hover(e, True))
         self.new_note_btn.bind('<Leave>', lambda e: self.button_hover(e, False))
         
         # Дополнительные кнопки
-        extra_buttons_frame = tk.Frame(buttons_frame, bg=self.colors['bg_secondary'])
+        extra_buttons_frame = tk.Frame(buttons_frame)
+        self.theme.register(extra_buttons_frame, bg='bg_secondary')
         extra_buttons_frame.pack(fill='x', pady=(10, 0))
         
         extra_buttons = [
@@ -269,11 +643,12 @@ class ModernNotesApp:
         for i, (text, command) in enumerate(extra_buttons):
             btn = tk.Button(extra_buttons_frame, text=text,
                            font=('Segoe UI', 10),
-                           bg=self.colors['bg_card'],
-                           fg=self.colors['text_primary'],
                            relief='flat', bd=0,
                            cursor='hand2',
                            command=command)
+            self.theme.register(btn, bg='bg_card', fg='text_primary')
+            if command == self.create_template_note:
+                self.edit_buttons.append(btn)
             btn.pack(side='left' if i == 0 else 'right', 
                     fill='x', expand=True,
                     padx=(0, 5) if i == 0 else (5, 0),
@@ -283,74 +658,64 @@ class ModernNotesApp:
             
     def create_notes_list(self, parent):
         """Создание списка заметок с горизонтальным и вертикальным скроллбаром"""
-        notes_frame = tk.Frame(parent, bg=self.colors['bg_secondary'])
+        notes_frame = tk.Frame(parent)
+        self.theme.register(notes_frame, bg='bg_secondary')
         notes_frame.pack(fill='both', expand=True, padx=20, pady=(10, 0))
         
         # Заголовок списка
-        list_header = tk.Frame(notes_frame, bg=self.colors['bg_secondary'], height=30)
+        list_header = tk.Frame(notes_frame, height=30)
+        self.theme.register(list_header, bg='bg_secondary')
         list_header.pack(fill='x', pady=(0, 10))
         list_header.pack_propagate(False)
         
-        tk.Label(list_header, text="📝 Мои заметки",
-                font=('Segoe UI', 12, 'bold'),
-                bg=self.colors['bg_secondary'],
-                fg=self.colors['text_primary']).pack(side='left', pady=5)
+        self.theme.register(tk.Label(list_header, text="📝 Мои заметки",
+                                     font=('Segoe UI', 12, 'bold')),
+                            bg='bg_secondary', fg='text_primary').pack(side='left', pady=5)
         
-        # Контейнер для канваса с двумя скроллбарами
-        canvas_frame = tk.Frame(notes_frame, bg=self.colors['bg_secondary'])
+        # Контейнер для канваса со скроллбаром
+        canvas_frame = tk.Frame(notes_frame)
+        self.theme.register(canvas_frame, bg='bg_secondary')
         canvas_frame.pack(fill='both', expand=True)
 
         # Создаём канвас
-        canvas = tk.Canvas(canvas_frame, bg=self.colors['bg_secondary'], highlightthickness=0)
+        canvas = tk.Canvas(canvas_frame, highlightthickness=0)
+        self.theme.register(canvas, bg='bg_secondary')
         
         # Вертикальный скроллбар
         v_scrollbar = ttk.Scrollbar(canvas_frame, orient="vertical", command=canvas.yview)
         v_scrollbar.pack(side="right", fill="y")
         
-        # Контейнер для заметок
-        self.scrollable_frame = tk.Frame(canvas, bg=self.colors['bg_secondary'])
-        
-        # Привязываем обновление области прокрутки
-        self.scrollable_frame.bind(
-            "<Configure>",
-            lambda e: canvas.configure(scrollregion=canvas.bbox("all"))
-        )
-        
-        # Создаём окно на канвасе
-        canvas.create_window((0, 0), window=self.scrollable_frame, anchor="nw")
-        
-        # Настраиваем команды прокрутки
-        canvas.configure(yscrollcommand=v_scrollbar.set)
-        
         # Упаковываем канвас
         canvas.pack(side="left", fill="both", expand=True)
         
-        # Привязываем события прокрутки для мыши (опционально)
+        # Виртуальный список: карточки создаются только для видимых заметок
+        self.notes_view = VirtualNotesList(self, canvas, v_scrollbar)
+        
+        # Привязываем события прокрутки для мыши
         canvas.bind_all("<MouseWheel>", lambda event: canvas.yview_scroll(int(-1 * (event.delta / 120)), "units"))
-        canvas.bind_all("<Shift-MouseWheel>", lambda event: canvas.xview_scroll(int(-1 * (event.delta / 120)), "units"))
 
         self.notes_canvas = canvas
         
     def create_settings_panel(self, parent):
         """Создание панели настроек"""
-        settings_frame = tk.Frame(parent, bg=self.colors['bg_card'], height=120)
+        settings_frame = tk.Frame(parent, height=120)
+        self.theme.register(settings_frame, bg='bg_card')
         settings_frame.pack(fill='x', side='bottom', padx=20, pady=(10, 20))
         settings_frame.pack_propagate(False)
         
         # Заголовок настроек
-        tk.Label(settings_frame, text="⚙️ Настройки",
-                font=('Segoe UI', 11, 'bold'),
-                bg=self.colors['bg_card'],
-                fg=self.colors['text_primary']).pack(pady=(10, 5))
+        self.theme.register(tk.Label(settings_frame, text="⚙️ Настройки",
+                                     font=('Segoe UI', 11, 'bold')),
+                            bg='bg_card', fg='text_primary').pack(pady=(10, 5))
         
         # Выбор темы
-        theme_frame = tk.Frame(settings_frame, bg=self.colors['bg_card'])
+        theme_frame = tk.Frame(settings_frame)
+        self.theme.register(theme_frame, bg='bg_card')
         theme_frame.pack(fill='x', padx=15)
         
-        tk.Label(theme_frame, text="🎨 Тема:",
-                font=('Segoe UI', 9),
-                bg=self.colors['bg_card'],
-                fg=self.colors['text_secondary']).pack(side='left')
+        self.theme.register(tk.Label(theme_frame, text="🎨 Тема:",
+                                     font=('Segoe UI', 9)),
+                            bg='bg_card', fg='text_secondary').pack(side='left')
         
         self.theme_var = tk.StringVar(value=self.current_theme)
         theme_menu = ttk.Combobox(theme_frame, textvariable=self.theme_var,
@@ -362,14 +727,14 @@ class ModernNotesApp:
         # Мотивационная цитата
         self.quote_label = tk.Label(settings_frame, text="",
                                    font=('Segoe UI', 9, 'italic'),
-                                   bg=self.colors['bg_card'],
-                                   fg=self.colors['text_secondary'],
                                    wraplength=300)
+        self.theme.register(self.quote_label, bg='bg_card', fg='text_secondary')
         self.quote_label.pack(pady=(10, 5))
         
     def create_main_area(self, parent):
         """Создание основной области редактирования"""
-        main_area = tk.Frame(parent, bg=self.colors['bg_primary'])
+        main_area = tk.Frame(parent)
+        self.theme.register(main_area, bg='bg_primary')
         main_area.pack(side='right', fill='both', expand=True)
         
         # Панель инструментов
@@ -380,12 +745,14 @@ class ModernNotesApp:
         
     def create_toolbar(self, parent):
         """Создание панели инструментов с улучшенными кнопками"""
-        toolbar = tk.Frame(parent, bg=self.colors['bg_secondary'], height=70)
+        toolbar = tk.Frame(parent, height=70)
+        self.theme.register(toolbar, bg='bg_secondary')
         toolbar.pack(fill='x', pady=(0, 2))
         toolbar.pack_propagate(False)
         
         # Левая группа кнопок
-        left_tools = tk.Frame(toolbar, bg=self.colors['bg_secondary'])
+        left_tools = tk.Frame(toolbar)
+        self.theme.register(left_tools, bg='bg_secondary')
         left_tools.pack(side='left', padx=20, pady=10)
         
         tools_data = [
@@ -393,6 +760,7 @@ class ModernNotesApp:
             ("📁 Открыть", self.load_notes_file),
             ("❌ Удалить", self.delete_note),
             ("📄 Экспорт", self.export_note),
+            ("📦 Выгрузка", self.export_all_notes),
             ("🔄 Очистить", self.clear_editor)
         ]
         
@@ -400,8 +768,6 @@ class ModernNotesApp:
             btn = tk.Button(left_tools,
                            text=text,
                            font=('Segoe UI', 11, 'bold'),
-                           bg=self.colors['bg_card'],
-                           fg=self.colors['text_primary'],
                            relief='flat',
                            bd=0,
                            cursor='hand2',
@@ -410,62 +776,63 @@ class ModernNotesApp:
                            pady=8,
                            width=10)
             # Добавляем закруглённые углы и тень через highlight
-            btn.configure(highlightbackground=self.colors['border'], highlightthickness=2)
+            btn.configure(highlightthickness=2)
+            self.theme.register(btn, bg='bg_card', fg='text_primary', highlightbackground='border')
+            if command in (self.load_notes_file, self.delete_note, self.clear_editor):
+                self.edit_buttons.append(btn)
             btn.pack(side='left', padx=5)
             btn.bind('<Enter>', lambda e, b=btn: self.tool_button_hover(e, True, b))
             btn.bind('<Leave>', lambda e, b=btn: self.tool_button_hover(e, False, b))
             
         # Правая группа - информация
-        right_info = tk.Frame(toolbar, bg=self.colors['bg_secondary'])
+        right_info = tk.Frame(toolbar)
+        self.theme.register(right_info, bg='bg_secondary')
         right_info.pack(side='right', padx=20, pady=15)
         
         self.info_label = tk.Label(right_info, text="Добро пожаловать! 👋",
-                                  font=('Segoe UI', 11),
-                                  bg=self.colors['bg_secondary'],
-                                  fg=self.colors['text_secondary'])
+                                  font=('Segoe UI', 11))
+        self.theme.register(self.info_label, bg='bg_secondary', fg='text_secondary')
         self.info_label.pack()
         
         # Часы
         self.clock_label = tk.Label(right_info, text="",
-                                   font=('Segoe UI', 10),
-                                   bg=self.colors['bg_secondary'],
-                                   fg=self.colors['accent'])
+                                   font=('Segoe UI', 10))
+        self.theme.register(self.clock_label, bg='bg_secondary', fg='accent')
         self.clock_label.pack()
-        self.update_clock()
         
     def create_editor(self, parent):
         """Создание области редактирования"""
-        editor_frame = tk.Frame(parent, bg=self.colors['bg_primary'])
+        editor_frame = tk.Frame(parent)
+        self.theme.register(editor_frame, bg='bg_primary')
         editor_frame.pack(fill='both', expand=True, padx=25, pady=(0, 25))
         
         # Поле заголовка с плейсхолдером
-        title_frame = tk.Frame(editor_frame, bg=self.colors['bg_primary'])
+        title_frame = tk.Frame(editor_frame)
+        self.theme.register(title_frame, bg='bg_primary')
         title_frame.pack(fill='x', pady=(0, 20))
         
         self.title_entry = tk.Entry(title_frame,
                                    font=('Segoe UI', 18, 'bold'),
-                                   bg=self.colors['bg_card'],
-                                   fg=self.colors['text_primary'],
-                                   insertbackground=self.colors['text_primary'],
                                    relief='flat', bd=15)
+        self.theme.register(self.title_entry, bg='bg_card', fg='text_primary',
+                            readonlybackground='bg_card', insertbackground='text_primary')
         self.title_entry.pack(fill='x', ipady=15)
         self.title_entry.bind('<KeyRelease>', self.on_title_change)
         self.title_entry.bind('<FocusIn>', self.on_title_focus_in)
         self.title_entry.bind('<FocusOut>', self.on_title_focus_out)
         
         # Текстовое поле
-        text_frame = tk.Frame(editor_frame, bg=self.colors['bg_primary'])
+        text_frame = tk.Frame(editor_frame)
+        self.theme.register(text_frame, bg='bg_primary')
         text_frame.pack(fill='both', expand=True)
         
         self.text_area = tk.Text(text_frame,
                                 font=('Segoe UI', 13),
-                                bg=self.colors['bg_card'],
-                                fg=self.colors['text_primary'],
-                                insertbackground=self.colors['text_primary'],
-                                selectbackground=self.colors['accent'],
                                 relief='flat', bd=20,
                                 wrap='word',
-                                undo=True)
+                                undo=False)  # Отмену ведёт история правок (undo_edit)
+        self.theme.register(self.text_area, bg='bg_card', fg='text_primary',
+                            insertbackground='text_primary', selectbackground='accent')
         
         text_scrollbar = ttk.Scrollbar(text_frame, orient="vertical",
                                       command=self.text_area.yview)
@@ -475,6 +842,7 @@ class ModernNotesApp:
         text_scrollbar.pack(side="right", fill="y")
         
         self.text_area.bind('<KeyRelease>', self.on_text_change)
+        self.text_area.bind('<<Modified>>', self.on_text_change)
         self.text_area.bind('<FocusIn>', self.on_text_focus_in)
         
         # Заглушка для пустого состояния
@@ -482,39 +850,36 @@ class ModernNotesApp:
         
     def create_empty_state(self, parent):
         """Создание заглушки для пустого состояния"""
-        self.empty_frame = tk.Frame(parent, bg=self.colors['bg_primary'])
+        self.empty_frame = tk.Frame(parent)
+        self.theme.register(self.empty_frame, bg='bg_primary')
         
         # Большая иконка
         empty_icon = tk.Label(self.empty_frame, text="📝",
-                             font=('Segoe UI', 64),
-                             bg=self.colors['bg_primary'],
-                             fg=self.colors['text_secondary'])
+                             font=('Segoe UI', 64))
+        self.theme.register(empty_icon, bg='bg_primary', fg='text_secondary')
         empty_icon.pack(pady=(120, 30))
         
         # Приветственный текст
         welcome_text = tk.Label(self.empty_frame,
                                text="Добро пожаловать в ZametkaAldiyara Pro!",
-                               font=('Segoe UI', 20, 'bold'),
-                               bg=self.colors['bg_primary'],
-                               fg=self.colors['text_primary'])
+                               font=('Segoe UI', 20, 'bold'))
+        self.theme.register(welcome_text, bg='bg_primary', fg='text_primary')
         welcome_text.pack(pady=(0, 10))
         
         # Инструкция
         instruction_text = tk.Label(self.empty_frame,
                                    text="Создайте новую заметку или выберите существующую\nдля начала работы",
                                    font=('Segoe UI', 14),
-                                   bg=self.colors['bg_primary'],
-                                   fg=self.colors['text_secondary'],
                                    justify='center')
+        self.theme.register(instruction_text, bg='bg_primary', fg='text_secondary')
         instruction_text.pack(pady=(0, 30))
         
         # Горячие клавиши
         hotkeys_text = tk.Label(self.empty_frame,
-                               text="💡 Горячие клавиши:\nCtrl+N - Новая заметка\nCtrl+S - Сохранить\nCtrl+F - Найти",
+                               text="💡 Горячие клавиши:\nCtrl+N - Новая заметка\nCtrl+S - Сохранить\nCtrl+F - Найти\nCtrl+Z / Ctrl+Y - Отменить / Повторить",
                                font=('Segoe UI', 11),
-                               bg=self.colors['bg_primary'],
-                               fg=self.colors['accent'],
                                justify='center')
+        self.theme.register(hotkeys_text, bg='bg_primary', fg='accent')
         hotkeys_text.pack()
         
         self.show_empty_state()
@@ -538,6 +903,10 @@ class ModernNotesApp:
         self.root.bind('<Control-f>', lambda e: self.search_entry.focus_set())
         self.root.bind('<Control-d>', lambda e: self.delete_note())
         self.root.bind('<F5>', lambda e: self.refresh_notes_list())
+        self.root.bind('<Control-Shift-D>', lambda e: self.toggle_diagnostics())
+        self.root.bind('<Control-z>', lambda e: self.undo_edit())
+        self.root.bind('<Control-y>', lambda e: self.undo_edit(redo=True))
+        self.root.bind('<Control-Shift-Z>', lambda e: self.undo_edit(redo=True))
         
     def change_theme(self, event=None):
         """Смена темы приложения"""
@@ -549,10 +918,18 @@ class ModernNotesApp:
             self.apply_theme()
             
     def apply_theme(self):
-        """Применение новой темы"""
-        # Перезапуск интерфейса с новой темой
-        self.root.destroy()
-        self.__init__()
+        """Применение новой темы без пересоздания интерфейса"""
+        self.theme.apply(self.colors)
+        
+    def restyle(self):
+        """Обновление того, что не описывается ролями виджетов"""
+        self.setup_styles()
+        self.notes_view.redraw()
+        # Подсказки в пустых полях рисуются второстепенным цветом
+        if self.search_entry.get() == "🔍 Найти заметку...":
+            self.search_entry.configure(fg=self.colors['text_secondary'])
+        if self.title_entry.get() == "Введите заголовок заметки...":
+            self.title_entry.configure(fg=self.colors['text_secondary'])
         
     def on_title_focus_in(self, event):
         """Обработка фокуса заголовка"""
@@ -574,6 +951,8 @@ class ModernNotesApp:
             
     def create_template_note(self):
         """Создание заметки по шаблону"""
+        if not self.check_writable():
+            return
         templates = [
             {
                 'title': 'Ежедневный план',
@@ -643,15 +1022,11 @@ class ModernNotesApp:
         # Выбор случайного шаблона
         template = random.choice(templates)
         
-        note = {
-            'id': len(self.notes),
-            'title': template['title'],
-            'content': template['content'],
-            'created': datetime.now().strftime('%Y-%m-%d %H:%M:%S'),
-            'modified': datetime.now().strftime('%Y-%m-%d %H:%M:%S')
-        }
+        note = Note(self.store.allocate_id(), template['title'], template['content'])
         
-        self.notes.insert(0, note)
+        self.library.add_note(note)
+        self.library.reindex_note(note)
+        self.change_tracker.mark(note)
         self.refresh_notes_list()
         self.select_note(note)
         
@@ -665,39 +1040,111 @@ class ModernNotesApp:
             
     def export_note(self):
         """Экспорт текущей заметки"""
+        self.flush_edits()
         if not self.current_note:
             messagebox.showwarning("Предупреждение", "Выберите заметку для экспорта")
             return
             
+        # Редко нужные модули загружаются при первом обращении, а не при запуске
+        from tkinter import filedialog
+        from notes_export import render_note
+
         filename = filedialog.asksaveasfilename(
             defaultextension=".txt",
-            filetypes=[("Text files", "*.txt"), ("Markdown files", "*.md")],
-            initialvalue=f"{self.current_note['title']}.txt"
+            filetypes=[("Text files", "*.txt"), ("Markdown files", "*.md"), ("HTML files", "*.html")],
+            initialfile=f"{self.current_note.title}.txt"
         )
         
         if filename:
-            try:
+            # Текст собирается сразу: заметку могут изменить, пока идёт запись
+            note = self.current_note
+            fmt = 'html' if filename.lower().endswith(('.html', '.htm')) else 'txt'
+            text = render_note(note.title, note.content, note.created, note.modified, fmt)
+
+            def write():
                 with open(filename, 'w', encoding='utf-8') as f:
-                    f.write(f"# {self.current_note['title']}\n\n")
-                    f.write(f"Создано: {self.current_note['created']}\n")
-                    f.write(f"Изменено: {self.current_note['modified']}\n\n")
-                    f.write("---\n\n")
-                    f.write(self.current_note['content'])
-                messagebox.showinfo("Успех", "Заметка экспортирована!")
-            except Exception as e:
-                messagebox.showerror("Ошибка", f"Ошибка экспорта: {str(e)}")
+                    f.write(text)
+
+            self.tasks.submit("Экспорт заметки", write,
+                              on_done=lambda result: messagebox.showinfo("Успех", "Заметка экспортирована!"),
+                              on_error=lambda e: messagebox.showerror("Ошибка", f"Ошибка экспорта: {str(e)}"))
+                
+    def export_all_notes(self):
+        """Выгрузка всех заметок файлами в папку или zip-архив
+
+        Повторная выгрузка в то же место переписывает только изменённые
+        заметки (см. notes_export.export_all).
+        """
+        from tkinter import filedialog, simpledialog
+        from notes_export import FORMATS, export_all
+
+        self.flush_edits()
+        if not self.notes:
+            messagebox.showinfo("Информация", "Нет заметок для выгрузки")
+            return
+        fmt = simpledialog.askstring("Выгрузка", "Формат файлов: md, txt или html",
+                                     initialvalue=self.settings.get('export_format', 'md'),
+                                     parent=self.root)
+        if fmt is None:
+            return
+        fmt = fmt.strip().lower().lstrip('.')
+        if fmt not in FORMATS:
+            messagebox.showwarning("Предупреждение", f"Неизвестный формат: {fmt}")
+            return
+        self.settings['export_format'] = fmt
+        to_zip = messagebox.askyesnocancel("Выгрузка",
+                                           "Упаковать в zip-архив?\n«Нет» — файлы в папку")
+        if to_zip is None:
+            return
+        if to_zip:
+            target = filedialog.asksaveasfilename(defaultextension=".zip",
+                                                  filetypes=[("ZIP archives", "*.zip")],
+                                                  initialfile="notes.zip")
+        else:
+            target = filedialog.askdirectory(mustexist=False)
+        if not target:
+            return
+        # Копии: заметки можно редактировать, пока идёт выгрузка
+        notes = [note.copy() for note in self.notes]
+
+        def work(progress, put):
+            return export_all(notes, self.store, target, fmt, progress)
+
+        def done(error):
+            if isinstance(error, Cancelled):
+                self.info_label.configure(text="Выгрузка отменена")
+            elif error is not None:
+                messagebox.showerror("Ошибка", f"❌ Ошибка выгрузки: {str(error)}")
+            else:
+                messagebox.showinfo("Успех", f"✅ Заметки выгружены в {target}")
+
+        self.run_in_background("Выгрузка заметок", work, done)
                 
     def clear_editor(self):
         """Очистка редактора"""
+        if not self.check_writable():
+            return
+        self.flush_edits()
         if messagebox.askyesno("Подтверждение", "Очистить текущую заметку?"):
             self.title_entry.delete(0, tk.END)
             self.text_area.delete(1.0, tk.END)
+            self.text_area.edit_modified(False)
             if self.current_note:
-                self.current_note['title'] = ''
-                self.current_note['content'] = ''
-                self.current_note['modified'] = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
-                self.refresh_notes_list()
+                # Очистку можно отменить (Ctrl+Z): она попадает в историю правок
+                note = self.current_note
+                old_title, old_content = note.title, note.content
+                note.title = ''
+                note.content = ''
+                self.library.record_edit(note, old_title, old_content)
+                self.notes_view.update_note(note)
+                self.update_stats()
                 
+    def start_timers(self):
+        """Часы, цитаты и автосохранение"""
+        self.update_clock()
+        self.start_motivational_quotes()
+        self.start_autosave()
+
     def update_clock(self):
         """Обновление часов"""
         current_time = datetime.now().strftime('%H:%M:%S')
@@ -726,20 +1173,8 @@ class ModernNotesApp:
         update_quote()
         
     def button_hover(self, event, enter):
-        widget = event.widget
-        start_color = self.colors['accent']
-        end_color = self.colors['accent_hover'] if enter else self.colors['accent']
-        start_rgb = tuple(int(start_color[i:i+2], 16) for i in (1, 3, 5))
-        end_rgb = tuple(int(end_color[i:i+2], 16) for i in (1, 3, 5))
-        steps = 10
-        for step in range(steps):
-            r = int(start_rgb[0] + (end_rgb[0] - start_rgb[0]) * step / steps)
-            g = int(start_rgb[1] + (end_rgb[1] - start_rgb[1]) * step / steps)
-            b = int(start_rgb[2] + (end_rgb[2] - start_rgb[2]) * step / steps)
-            color = f"#{r:02x}{g:02x}{b:02x}"
-            widget.configure(bg=color)
-            self.root.update()
-            time.sleep(0.02)
+        """Плавная подсветка главной кнопки при наведении (без блокировки интерфейса)"""
+        self.hover.animate(event.widget, 'accent', 'accent_hover', forward=enter)
 
     def tool_button_hover(self, event, enter, btn=None):
         """Эффект наведения для кнопок инструментов"""
@@ -761,299 +1196,549 @@ class ModernNotesApp:
             self.search_entry.insert(0, "🔍 Найти заметку...")
             self.search_entry.configure(fg=self.colors['text_secondary'])
             
+    def toggle_diagnostics(self):
+        """Включение и выключение замеров вместе с панелью диагностики"""
+        if self.diag.enabled:
+            self.diag.disable()
+            if self.diag.profiling:
+                self.toggle_profile()
+            self.diag_frame.pack_forget()
+            if self.diag_job is not None:
+                self.root.after_cancel(self.diag_job)
+                self.diag_job = None
+        else:
+            self.diag.enable()
+            self.show_diagnostics()
+        self.save_settings()
+        
+    def show_diagnostics(self):
+        """Показ панели диагностики под статистикой"""
+        self.diag_frame.pack(fill='x', padx=20, pady=(0, 10), after=self.stats_frame)
+        self.update_diagnostics()
+        
+    def update_diagnostics(self):
+        """Обновление гистограмм на панели диагностики (раз в секунду)"""
+        lines = [f"{'':<16}{'p50':>6}{'p95':>7}{'max':>7}  <1мс … >1с"]
+        for name, histogram in sorted(self.diag.spans.items()):
+            summary = histogram.summary()
+            lines.append(f"{name[:16]:<16}{summary['median_ms']:>6.1f}{summary['p95_ms']:>7.1f}"
+                         f"{summary['max_ms']:>7.0f}  {histogram.bars()}")
+        if len(lines) == 1:
+            lines.append("Пока нет замеров")
+        self.diag_label.configure(text="\n".join(lines))
+        self.diag_job = self.root.after(1000, self.update_diagnostics)
+        
+    def toggle_profile(self):
+        """Запуск и остановка cProfile для потока интерфейса"""
+        if self.diag.profiling:
+            self.diag.stop_profile()
+            self.profile_btn.configure(text="⏺ Профиль")
+            self.info_label.configure(text="Профиль снят, его можно выгрузить в JSON")
+        else:
+            self.diag.start_profile()
+            self.profile_btn.configure(text="⏹ Стоп")
+        
+    def dump_diagnostics(self):
+        """Выгрузка замеров (и профиля, если снят) в JSON для разбора"""
+        from tkinter import filedialog
+
+        if self.diag.profiling:
+            self.toggle_profile()
+        filename = filedialog.asksaveasfilename(
+            defaultextension=".json",
+            filetypes=[("JSON files", "*.json"), ("All files", "*.*")],
+            initialfile=f"diagnostics_{datetime.now().strftime('%Y%m%d_%H%M%S')}.json"
+        )
+        if not filename:
+            return
+        self.tasks.submit("Выгрузка диагностики", write_snapshot, filename, self.diag.snapshot(),
+                          on_done=lambda result: self.info_label.configure(
+                              text=f"Диагностика сохранена в {filename}"))
+        
     def create_new_note(self):
         """Создание новой заметки"""
-        note = {
-            'id': len(self.notes),
-            'title': 'Новая заметка',
-            'content': '',
-            'created': datetime.now().strftime('%Y-%m-%d %H:%M:%S'),
-            'modified': datetime.now().strftime('%Y-%m-%d %H:%M:%S')
-        }
+        if not self.check_writable():
+            return
+        note = Note(self.store.allocate_id(), 'Новая заметка', '')
         
-        self.notes.insert(0, note)
+        self.library.add_note(note)
+        self.library.reindex_note(note)
+        self.change_tracker.mark(note)
         self.refresh_notes_list()
         self.select_note(note)
         self.title_entry.focus_set()
         self.title_entry.select_range(0, tk.END)
         self.update_stats()
         
+    @traced
     def select_note(self, note):
         """Выбор заметки для редактирования"""
-        self.current_note = note
+        self.flush_edits()  # Несохранённые правки относятся к предыдущей заметке
+        self.current_note = self.store.load_content(note)
+        self.content_cache.touch(note)  # Давно не открытые тексты выгружаются
         self.hide_empty_state()
         
-        # Заполнение полей
+        # Заполнение полей (заблокированные только для чтения - временно открываем)
+        if self.read_only:
+            self.title_entry.configure(state='normal')
+            self.text_area.configure(state='normal')
         self.title_entry.delete(0, tk.END)
-        self.title_entry.insert(0, note['title'])
+        self.title_entry.insert(0, note.title)
         self.title_entry.configure(fg=self.colors['text_primary'])
         
         self.text_area.delete(1.0, tk.END)
-        self.text_area.insert(1.0, note['content'])
+        self.text_area.insert(1.0, note.content)
+        self.text_area.edit_modified(False)  # Загрузка текста - не правка
         self.text_area.configure(fg=self.colors['text_primary'])
+        if self.read_only:
+            self.title_entry.configure(state='readonly')
+            self.text_area.configure(state='disabled')
         
         # Обновление информации
         self.update_info_label()
-        self.refresh_notes_list()  # Обновляем список для подсветки выбранной заметки
+        self.notes_view.update_selection()  # Подсветка выбранной заметки без перестройки списка
         
+    @traced
     def on_title_change(self, event=None):
         """Обработка изменения заголовка"""
-        if self.current_note:
-            new_title = self.title_entry.get()
-            if new_title != "Введите заголовок заметки...":
-                self.current_note['title'] = new_title
-                self.current_note['modified'] = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
-                self.refresh_notes_list()
-                self.update_info_label()
+        # Стрелки, Shift и прочие клавиши без правки заголовка пропускаем
+        if self.current_note and self.title_entry.get() != self.current_note.title:
+            self.schedule_edit_flush()
             
+    @traced
     def on_text_change(self, event=None):
-        """Обработка изменения текста"""
-        if self.current_note:
+        """Обработка изменения текста (<KeyRelease> и <<Modified>>)"""
+        # Флаг modified выставляет сам Text при любой правке; если он сброшен,
+        # событие ничего не изменило и копировать буфер не нужно
+        if self.current_note and self.text_area.edit_modified():
+            self.schedule_edit_flush()
+            
+    def schedule_edit_flush(self):
+        """Отложенная обработка правок: серия нажатий сливается в одну"""
+        if self.edit_job is not None:
+            self.root.after_cancel(self.edit_job)
+        self.edit_job = self.root.after(self.EDIT_DEBOUNCE_MS, self.on_edit_pause)
+        
+    def on_edit_pause(self):
+        """Пауза в наборе - обработка в ближайший момент простоя интерфейса"""
+        self.edit_job = self.root.after_idle(self.flush_edits)
+        
+    @traced
+    def flush_edits(self):
+        """Применение накопленных правок заголовка и текста за один проход"""
+        if self.edit_job is not None:
+            self.root.after_cancel(self.edit_job)
+            self.edit_job = None
+        note = self.current_note
+        if not note:
+            return
+            
+        changed = False
+        old_title, old_content = note.title, note.content
+        new_title = self.title_entry.get()
+        if new_title != note.title and new_title != "Введите заголовок заметки...":
+            note.title = new_title
+            changed = True
+            
+        if self.text_area.edit_modified():
             content = self.text_area.get(1.0, tk.END + '-1c')
-            if content != "Начните писать здесь...":
-                self.current_note['content'] = content
-                self.current_note['modified'] = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
-                self.update_info_label()
-                self.update_stats()
+            self.text_area.edit_modified(False)
+            if content != note.content and content != "Начните писать здесь...":
+                note.content = content
+                changed = True
+                
+        if changed:
+            self.library.record_edit(note, old_title, old_content)
+            self.notes_view.update_note(note)
+            self.update_info_label()
+            self.update_stats()
+            
+    def undo_edit(self, redo=False):
+        """Отмена (или повтор) правки текущей заметки по её истории"""
+        if not self.check_writable():
+            return 'break'
+        self.flush_edits()
+        note = self.current_note
+        if not note:
+            return 'break'
+        splice = self.library.redo(note) if redo else self.library.undo(note)
+        if splice is None:
+            self.info_label.configure(text="Нечего повторять" if redo else "Нечего отменять")
+            return 'break'
+        if self.title_entry.get() != note.title:
+            self.title_entry.delete(0, tk.END)
+            self.title_entry.insert(0, note.title)
+        # В поле меняется только участок шага, а не весь текст
+        start = f"1.0 + {splice.start} chars"
+        self.text_area.delete(start, f"1.0 + {splice.end} chars")
+        self.text_area.insert(start, splice.text)
+        self.text_area.edit_modified(False)  # Текст из истории - не новая правка
+        self.text_area.mark_set(tk.INSERT, f"1.0 + {splice.start + len(splice.text)} chars")
+        self.text_area.see(tk.INSERT)
+        self.notes_view.update_note(note)
+        self.update_info_label()
+        self.update_stats()
+        return 'break'
             
     def update_info_label(self):
         """Обновление информационной метки"""
         if self.current_note:
-            modified = self.current_note['modified']
-            content = self.current_note['content']
-            word_count = len(content.split()) if content.strip() else 0
-            char_count = len(content)
-            
+            note = self.current_note
             self.info_label.configure(
-                text=f" Изменено: {modified.split()[1][:5]} | "
-                     f"Слов: {word_count} | Символов: {char_count}"
+                text=f" Изменено: {note.time_label} | "
+                     f"Слов: {note.words} | Символов: {note.chars}"
             )
         else:
             self.info_label.configure(text="Добро пожаловать! 👋")
             
+    @traced
     def update_stats(self):
         """Обновление статистики"""
         total_notes = len(self.notes)
-        total_words = sum(len(note['content'].split()) for note in self.notes if note['content'].strip())
+        total_words = self.note_stats.total_words
         
         self.notes_count_label.configure(text=str(total_notes))
         self.words_count_label.configure(text=str(total_words))
         
+    @traced
     def refresh_notes_list(self):
         """Обновление списка заметок"""
-        # Очистка старых виджетов
-        for widget in self.scrollable_frame.winfo_children():
-            widget.destroy()
-            
-        # Отображение заметок
-        for note in self.notes:
-            self.create_note_card(note)
-            
+        self.notes_view.set_items(self.notes)
         self.update_stats()
             
-    def create_note_card(self, note):
-        """Создание карточки заметки"""
-        # Определяем, выбрана ли заметка
-        is_selected = self.current_note and self.current_note['id'] == note['id']
-        
-        card_bg = self.colors['accent'] if is_selected else self.colors['bg_card']
-        text_color = self.colors['text_primary']
-        
-        card = tk.Frame(self.scrollable_frame,
-                       bg=card_bg,
-                       cursor='hand2',
-                       relief='solid' if is_selected else 'flat',
-                       bd=1 if is_selected else 0)
-        card.pack(fill='x', pady=3, ipady=12, ipadx=18)
-        
-        # Заголовок заметки
-        title = note['title'][:35] + "..." if len(note['title']) > 35 else note['title']
-        title_label = tk.Label(card, text=f"📄 {title}",
-                              font=('Segoe UI', 11, 'bold'),
-                              bg=card_bg,
-                              fg=text_color,
-                              anchor='w')
-        title_label.pack(fill='x')
-        
-        # Превью содержимого
-        preview = note['content'][:60] + "..." if len(note['content']) > 60 else note['content']
-        if preview.strip():
-            preview_label = tk.Label(card, text=preview,
-                                   font=('Segoe UI', 9),
-                                   bg=card_bg,
-                                   fg=self.colors['text_secondary'] if not is_selected else text_color,
-                                   anchor='w',
-                                   wraplength=280)
-            preview_label.pack(fill='x', pady=(3, 0))
-            
-        # Нижняя информация
-        info_frame = tk.Frame(card, bg=card_bg)
-        info_frame.pack(fill='x', pady=(5, 0))
-        
-        # Дата модификации
-        date_str = note['modified'].split()[1][:5]  # Только время
-        date_label = tk.Label(info_frame, text=f"🕒 {date_str}",
-                            font=('Segoe UI', 8),
-                            bg=card_bg,
-                            fg=self.colors['text_secondary'] if not is_selected else text_color,
-                            anchor='w')
-        date_label.pack(side='left')
-        
-        # Количество слов
-        word_count = len(note['content'].split()) if note['content'].strip() else 0
-        if word_count > 0:
-            words_label = tk.Label(info_frame, text=f"📊 {word_count} слов",
-                                 font=('Segoe UI', 8),
-                                 bg=card_bg,
-                                 fg=self.colors['text_secondary'] if not is_selected else text_color,
-                                 anchor='e')
-            words_label.pack(side='right')
-                
-        # Обработчики событий
-        def select_this_note(event):
-            self.select_note(note)
-            
-        card.bind('<Button-1>', select_this_note)
-        for child in card.winfo_children():
-            child.bind('<Button-1>', select_this_note)
-            if hasattr(child, 'winfo_children'):
-                for grandchild in child.winfo_children():
-                    grandchild.bind('<Button-1>', select_this_note)
+    def on_search_change(self, *args):
+        """Изменение запроса: поиск - после паузы в наборе, а не на каждую клавишу"""
+        if self.search_job is not None:
+            self.root.after_cancel(self.search_job)
+        self.search_job = self.root.after(self.SEARCH_DEBOUNCE_MS, self.search_notes)
             
+    @traced
     def search_notes(self, *args):
-        """Поиск по заметкам"""
+        """Поиск по заметкам
+
+        Поиск в хранилище (SQLite, mmap) выполняется в пуле потоков:
+        просмотр большого снимка не задерживает окно. Незавершённый поиск
+        по прежнему запросу отменяется.
+        """
+        if self.search_job is not None:
+            self.root.after_cancel(self.search_job)
+            self.search_job = None
+        if self.search_progress is not None:
+            self.search_progress.cancel()
+            self.search_progress = None
+        self.flush_edits()
         query = self.search_var.get().lower()
         if query == "🔍 найти заметку..." or not query:
+            self.partial_search = False
             self.refresh_notes_list()
             return
             
-        # Очистка старых результатов
-        for widget in self.scrollable_frame.winfo_children():
-            widget.destroy()
-            
-        # Фильтрация заметок
-        filtered_notes = []
-        for note in self.notes:
-            if (query in note['title'].lower() or 
-                query in note['content'].lower()):
-                filtered_notes.append(note)
-                
-        # Отображение результатов
-        for note in filtered_notes:
-            self.create_note_card(note)
+        if not self.store.full_text_search:
+            self.show_search_results(query, self.library.search(query, self.SEARCH_LIMIT),
+                                     partial=self.library.search_partial)
+            return
+        progress = self.search_progress = Progress()
+
+        def done(found):
+            if self.search_progress is progress:
+                self.search_progress = None
+                self.show_search_results(query, self.library.store_hits(query, found,
+                                                                        self.SEARCH_LIMIT))
+
+        def failed(error):
+            if self.search_progress is progress:
+                self.search_progress = None
+            if not isinstance(error, Cancelled):
+                self.report_task_error("Поиск", error)
+
+        self.tasks.submit("Поиск", self.store.search, query, progress,
+                          on_done=done, on_error=failed, progress=progress)
             
-        # Показать количество результатов
-        if not filtered_notes:
-            no_results = tk.Label(self.scrollable_frame,
-                                text=f"🔍 Не найдено заметок по запросу '{query}'",
-                                font=('Segoe UI', 10),
-                                bg=self.colors['bg_secondary'],
-                                fg=self.colors['text_secondary'])
-            no_results.pack(pady=20)
+    def show_search_results(self, query, hits, partial=False):
+        """Лучшие совпадения первыми, с подсветкой в превью
+
+        partial - индекс ещё строится: поиск повторится, когда он будет готов.
+        """
+        self.partial_search = partial
+        empty_text = f"🔍 Не найдено заметок по запросу '{query}'"
+        if partial:
+            empty_text += " (индекс поиска ещё строится)"
+            self.info_label.configure(text="⏳ Индекс поиска строится: найдены не все заметки")
+        self.notes_view.set_items([hit.note for hit in hits], empty_text=empty_text,
+                                  highlight=(tuple(tokenize(query)),
+                                             {hit.note.id: hit.words for hit in hits}))
             
     def delete_note(self):
         """Удаление текущей заметки"""
+        if not self.check_writable():
+            return
+        self.flush_edits()
         if not self.current_note:
             messagebox.showwarning("Предупреждение", "Выберите заметку для удаления")
             return
             
         if messagebox.askyesno("Подтверждение", 
-                              f"Удалить заметку '{self.current_note['title']}'?"):
-            self.notes.remove(self.current_note)
+                              f"Удалить заметку '{self.current_note.title}'?"):
+            self.library.delete(self.current_note)
             self.current_note = None
             self.refresh_notes_list()
             self.show_empty_state()
             self.update_stats()
             
     def save_notes(self):
-        """Сохранение заметок в файл"""
-        try:
-            filename = filedialog.asksaveasfilename(
-                defaultextension=".json",
-                filetypes=[("JSON files", "*.json"), ("All files", "*.*")],
-                initialvalue="my_notes.json"
-            )
-            if filename:
-                with open(filename, 'w', encoding='utf-8') as f:
-                    json.dump(self.notes, f, ensure_ascii=False, indent=2)
+        """Сохранение заметок в файл (JSON или JSON Lines) в фоновом потоке"""
+        from tkinter import filedialog
+
+        self.flush_edits()
+        filename = filedialog.asksaveasfilename(
+            defaultextension=".json",
+            filetypes=[("JSON files", "*.json"), ("JSON Lines", "*.jsonl"), ("All files", "*.*")],
+            initialfile="my_notes.json"
+        )
+        if not filename:
+            return
+        # Копии: заметки можно редактировать, пока идёт запись
+        notes = [note.copy() for note in self.notes]
+
+        def work(progress, put):
+            self.library.export_file(filename, notes, progress)
+
+        def done(error):
+            if isinstance(error, Cancelled):
+                self.info_label.configure(text="Сохранение отменено")
+            elif error is not None:
+                messagebox.showerror("Ошибка", f"❌ Ошибка сохранения: {str(error)}")
+            else:
                 messagebox.showinfo("Успех", f"✅ Заметки сохранены в {filename}!")
-        except Exception as e:
-            messagebox.showerror("Ошибка", f"❌ Ошибка сохранения: {str(e)}")
+
+        self.run_in_background("Сохранение заметок", work, done)
             
     def load_notes_file(self):
-        """Загрузка заметок из файла"""
-        try:
-            filename = filedialog.askopenfilename(
-                filetypes=[("JSON files", "*.json"), ("All files", "*.*")]
-            )
-            if filename:
-                with open(filename, 'r', encoding='utf-8') as f:
-                    loaded_notes = json.load(f)
-                    
-                if messagebox.askyesno("Подтверждение", 
-                                      "Заменить текущие заметки загруженными?"):
-                    self.notes = loaded_notes
-                else:
-                    # Добавить к существующим
-                    for note in loaded_notes:
-                        note['id'] = len(self.notes)
-                        self.notes.append(note)
-                        
+        """Загрузка заметок из файла (JSON или JSON Lines) в фоновом потоке
+
+        Файл разбирается потоково, и каждая пачка заметок сразу уходит
+        потоку записи, поэтому весь файл в памяти не копится. Прежние
+        заметки при замене удаляются только в конце; при отмене или
+        ошибке уже добавленное убирается.
+        """
+        from tkinter import filedialog
+
+        if not self.check_writable():
+            return
+        self.flush_edits()
+        filename = filedialog.askopenfilename(
+            filetypes=[("JSON files", "*.json"), ("JSON Lines", "*.jsonl"), ("All files", "*.*")]
+        )
+        if not filename:
+            return
+        replace = messagebox.askyesno("Подтверждение",
+                                      "Заменить текущие заметки загруженными?")
+        previous = list(self.notes)
+        imported = []
+
+        def work(progress, put):
+            read_notes(filename, progress, put)
+
+        def on_batch(batch):
+            self.library.import_notes(batch)
+            imported.extend(batch)
+            self.auto_save()
+            return f"Загружено заметок: {len(imported)}"
+
+        def done(error):
+            self.flush_edits()
+            if error is not None:
+                self.library.drop_notes(imported)
+                self.auto_save()
                 self.refresh_notes_list()
-                self.show_empty_state()
-                messagebox.showinfo("Успех", f"✅ Заметки загружены из {filename}!")
-        except Exception as e:
-            messagebox.showerror("Ошибка", f"❌ Ошибка загрузки: {str(e)}")
+                if isinstance(error, Cancelled):
+                    self.info_label.configure(text="Загрузка отменена")
+                else:
+                    messagebox.showerror("Ошибка", f"❌ Ошибка загрузки: {str(error)}")
+                return
+            if replace:
+                self.current_note = None
+                self.library.drop_notes(previous)
+            self.auto_save()
+            self.refresh_notes_list()
+            self.show_empty_state()
+            messagebox.showinfo("Успех", f"✅ Заметки загружены из {filename}!")
+
+        self.run_in_background("Загрузка заметок", work, done, on_batch)
+
+    def run_in_background(self, title, work, done, on_item=None, cancellable=True):
+        """Выполнение work(progress, put) в пуле потоков с окном хода
+
+        put(item) передаёт промежуточные результаты в поток интерфейса:
+        там их получает on_item, а возвращённая им строка показывается в
+        окне. По завершении вызывается done(error) - None при успехе,
+        Cancelled при отмене или исключение.
+        """
+        progress = Progress()
+        dialog = ProgressDialog(self, title, progress, cancellable)
+
+        def put(item):
+            self.tasks.call_soon(lambda: dialog.update(on_item(item) if on_item else None))
+
+        def finished(error):
+            dialog.close()
+            done(error)
+
+        return self.tasks.submit(title, work, progress, put, progress=progress,
+                                 on_done=lambda result: finished(None), on_error=finished)
+
+    def show_task_status(self, status):
+        """Строка состояния: выполняемые фоновые задачи"""
+        if status:
+            self.info_label.configure(text=f"⏳ {status}...")
+        else:
+            self.update_info_label()
+
+    def report_task_error(self, title, error):
+        """Ошибка фоновой задачи без своего обработчика"""
+        messagebox.showerror("Ошибка", f"❌ {title}: {str(error)}")
             
     def load_notes(self):
-        """Загрузка заметок при запуске"""
-        if os.path.exists('notes_data.json'):
-            try:
-                with open('notes_data.json', 'r', encoding='utf-8') as f:
-                    self.notes = json.load(f)
-                self.refresh_notes_list()
-            except:
-                pass
-                
+        """Загрузка заметок при запуске (снимок + журнал изменений)
+
+        Хранилище читается в пуле потоков; окно при этом отвечает, а ввод
+        до конца загрузки перехватывает окно хода. Сразу рисуется только
+        первый экран карточек, индексы и статистика строятся потом, в
+        свободное время цикла событий (warm_up).
+        """
+        loaded = []
+
+        def work(progress, put):
+            loaded.extend(self.store.load())
+
+        def done(error):
+            self.load_task = None
+            if error is not None:
+                messagebox.showerror("Ошибка", f"❌ Не удалось загрузить заметки: {str(error)}")
+                return
+            self.library.use_loaded(loaded, deferred=True)
+            self.refresh_notes_list()
+            self.loaded = True
+            self.root.after_idle(self.warm_up)
+            if getattr(self.store, 'recovered_from', None):
+                messagebox.showwarning("Восстановление",
+                                       f"Файл заметок был повреждён. Заметки восстановлены "
+                                       f"из резервной копии {self.store.recovered_from}")
+
+        self.load_task = self.run_in_background("Загрузка заметок", work, done,
+                                                cancellable=False)
+            
+    def warm_up(self):
+        """Шаг отложенного построения индексов; между шагами обрабатываются события"""
+        if self.library.warmup_step():
+            self.root.after(1, lambda: self.root.after_idle(self.warm_up))
+        else:
+            self.update_stats()
+            self.build_search_index()
+            self.repeat_partial_search()
+
+    def repeat_partial_search(self):
+        """Повтор поиска, показанного по недостроенному индексу"""
+        if self.partial_search and self.library.search_index_ready:
+            self.search_notes()
+
+    def build_search_index(self):
+        """Построение поискового индекса в фоне по незагруженным текстам
+
+        Тексты читаются пачками в пуле потоков, в индекс пачка добавляется
+        в потоке Tk. Пока индекс строится, поиск отвечает по уже
+        проиндексированной части (NotesLibrary.search_partial).
+        """
+        if not self.library.needs_search_index():
+            return
+        batches = self.library.start_indexing()
+        generation = self.library.index_generation
+        progress = Progress()
+        progress.total = len(batches)
+
+        def next_batch():
+            if self.library.index_generation != generation:
+                # Индекс перестроен заново (например, при замене заметок)
+                return
+            if progress.done == progress.total:
+                self.library.finish_indexing()
+                self.repeat_partial_search()
+                return
+            batch = batches[progress.done]
+
+            def done(contents):
+                if self.library.index_generation == generation:
+                    self.library.index_batch(batch, contents)
+                    progress.done += 1
+                    next_batch()
+
+            def failed(error):
+                if self.library.index_generation == generation:
+                    self.library.cancel_indexing()
+
+            self.tasks.submit("Построение индекса поиска", self.store.read_contents, batch,
+                              on_done=done, on_error=failed, progress=progress)
+
+        next_batch()
+            
+    @traced
     def auto_save(self):
-        """Автоматическое сохранение"""
-        try:
-            with open('notes_data.json', 'w', encoding='utf-8') as f:
-                json.dump(self.notes, f, ensure_ascii=False, indent=2)
-        except:
-            pass
+        """Автоматическое сохранение
+
+        Выполняется в потоке интерфейса: снимает копии отмеченных заметок
+        и отдаёт их потоку записи. Без изменений ничего не пишется.
+        """
+        self.flush_edits()
+        snapshot = self.change_tracker.snapshot(self.notes,
+                                                compact=self.store.needs_compaction())
+        if snapshot is not None:
+            self.store_writer.submit(snapshot)
+        self.report_store_errors()
+        
+    def report_store_errors(self):
+        """Показ ошибок потока записи в информационной метке"""
+        errors = self.store_writer.pending_errors()
+        if errors:
+            self.info_label.configure(text=f"⚠️ Ошибка автосохранения: {errors[-1]}")
             
     def start_autosave(self):
         """Запуск автосохранения"""
-        def autosave_worker():
-            while True:
-                time.sleep(30)  # Автосохранение каждые 30 секунд
-                self.auto_save()
-                
-        thread = threading.Thread(target=autosave_worker, daemon=True)
-        thread.start()
+        def autosave_tick():
+            self.auto_save()
+            self.root.after(30000, autosave_tick)  # Автосохранение каждые 30 секунд
+            
+        self.root.after(30000, autosave_tick)
         
     def load_settings(self):
         """Загрузка настроек"""
         try:
-            if os.path.exists('app_settings.json'):
-                with open('app_settings.json', 'r', encoding='utf-8') as f:
-                    return json.load(f)
+            settings, _ = read_with_fallback('app_settings.json', json.load, generations=2)
+            if settings:
+                return settings
         except:
             pass
         return {}
         
+    def current_settings(self):
+        """Настройки для записи (снимаются в потоке интерфейса)"""
+        # Остальные ключи (например, 'storage') сохраняются как есть
+        settings = dict(self.settings)
+        settings.update({
+            'theme': self.current_theme,
+            'diagnostics': self.diag.enabled,
+            'window_position': f"{self.root.winfo_x()}+{self.root.winfo_y()}"
+        })
+        return settings
+
     def save_settings(self):
-        """Сохранение настроек"""
-        try:
-            settings = {
-                'theme': self.current_theme,
-                'window_position': f"{self.root.winfo_x()}+{self.root.winfo_y()}"
-            }
-            with open('app_settings.json', 'w', encoding='utf-8') as f:
-                json.dump(settings, f, ensure_ascii=False, indent=2)
-        except:
-            pass
+        """Сохранение настроек в пуле потоков"""
+        self.tasks.submit("Сохранение настроек", self.write_settings, self.current_settings())
+
+    def write_settings(self, settings):
+        """Запись файла настроек; ошибка доходит до обработчика задачи"""
+        atomic_write('app_settings.json',
+                     lambda f: json.dump(settings, f, ensure_ascii=False, indent=2),
+                     generations=2)
         
     def run(self):
         """Запуск приложения"""
@@ -1069,10 +1754,52 @@ class ModernNotesApp:
         self.root.mainloop()
         
     def on_closing(self):
-        """Обработка закрытия приложения"""
+        """Обработка закрытия приложения
+
+        Окно сразу прячется; последний снимок, закрытие хранилища и
+        настройки записываются в пуле потоков, после чего окно уничтожается.
+        Если записать не удалось, окно возвращается: правки остаются в
+        памяти, и закрытие можно повторить. Пока идёт чтение хранилища
+        при запуске, закрытие откладывается до его окончания.
+        """
+        if self.closing:
+            return
+        if self.load_task is not None:
+            self.root.after(100, self.on_closing)
+            return
+        self.closing = True
+        if self.search_progress is not None:
+            self.search_progress.cancel()
+            self.search_progress = None
         self.auto_save()
-        self.save_settings()
-        self.root.destroy()
+        settings = self.current_settings()
+        self.root.withdraw()
+
+        def finish():
+            self.store_writer.close()  # Дожидаемся записи последнего снимка
+            errors = self.store_writer.pending_errors()
+            if errors:
+                # Хранилище не закрываем: окно вернётся для повторной попытки
+                raise errors[-1]
+            self.write_settings(settings)
+            self.store.close()
+
+        def destroy():
+            self.tasks.shutdown()
+            self.root.destroy()
+
+        def failed(error):
+            # Отметки несохранённых заметок возвращены трекеру; поток записи
+            # остановлен - запускаем новый для автосохранения
+            self.store_writer = StoreWriter(self.store, self.change_tracker)
+            self.closing = False
+            self.root.deiconify()
+            messagebox.showerror("Ошибка", f"❌ Не удалось сохранить заметки или настройки "
+                                           f"перед выходом: {str(error)}\n"
+                                           f"Окно не закрыто, чтобы не потерять правки")
+
+        self.tasks.submit("Сохранение перед выходом", finish,
+                          on_done=lambda result: destroy(), on_error=failed)
 
 if __name__ == "__main__":
     app = ModernNotesApp()
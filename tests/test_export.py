@@ -0,0 +1,54 @@
+import os
+import shutil
+import sys
+import tempfile
+import unittest
+import zipfile
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from notes_export import export_all
+from notes_model import Note
+from notes_storage import JournalStore
+
+
+class ZipExportTest(unittest.TestCase):
+    """Повторная выгрузка в архив: неизменённые записи копируются как есть"""
+
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.dir)
+        self.store = JournalStore(os.path.join(self.dir, 'notes_data.json'))
+        self.notes = self.store.load()
+        self.addCleanup(self.store.close)
+        for i in range(20):
+            self.notes.append(Note(self.store.allocate_id(), f'Заметка {i}', f'текст {i} ' * 100))
+        self.target = os.path.join(self.dir, 'notes.zip')
+
+    def members(self):
+        """{имя: (CRC, сжатый размер)} и проверка целостности архива"""
+        with zipfile.ZipFile(self.target) as archive:
+            self.assertIsNone(archive.testzip())
+            return {info.filename: (info.CRC, info.compress_size)
+                    for info in archive.infolist()}
+
+    def test_unchanged_members_are_copied(self):
+        self.assertEqual(export_all(self.notes, self.store, self.target, workers=0), (20, 0))
+        before = self.members()
+        self.notes[3].content = 'правка'
+        self.notes[3].modified += 1
+        removed = self.notes.pop(7)
+
+        self.assertEqual(export_all(self.notes, self.store, self.target, workers=0), (1, 18))
+        after = self.members()
+        changed = {name for name in after if after[name] != before.get(name)}
+        self.assertEqual(len(changed), 2)  # правленая заметка и манифест
+        self.assertEqual(len(after), 20)
+        with zipfile.ZipFile(self.target) as archive:
+            texts = [archive.read(name).decode('utf-8') for name in archive.namelist()]
+        self.assertTrue(any('правка' in text for text in texts))
+        self.assertFalse(any(f'текст {removed.id} ' in text for text in texts))
+
+
+if __name__ == '__main__':
+    unittest.main()
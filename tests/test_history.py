@@ -0,0 +1,51 @@
+import os
+import shutil
+import sys
+import tempfile
+import unittest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from notes_history import EditHistory
+from notes_model import Note
+from notes_storage import ChangeTracker, JournalStore
+
+
+class InFlightHistoryTest(unittest.TestCase):
+    """История, взятая в снимок, не вытесняется до записи потоком записи"""
+
+    def setUp(self):
+        self.path = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.path)
+        self.store = JournalStore(os.path.join(self.path, 'notes_data.json'))
+        self.store.load()
+        self.tracker = ChangeTracker()
+        self.history = EditHistory(self.store, self.tracker, budget=300)
+
+    def edit(self, note, text):
+        old_title, old_content = note.title, note.content
+        note.content = text
+        self.history.record(note, old_title, old_content)
+
+    def test_in_flight_history_is_not_evicted(self):
+        first = Note(self.store.allocate_id(), 'A', '')
+        second = Note(self.store.allocate_id(), 'B', '')
+        for note in (first, second):
+            self.tracker.mark(note)
+        self.edit(first, 'a' * 200)
+        # Снимок взят, но поток записи его ещё не записал
+        snapshot = self.tracker.snapshot([first, second])
+        self.assertFalse(self.tracker.histories)
+        self.edit(second, 'b' * 200)
+        self.assertIn(first.id, self.history.histories)
+
+        self.tracker.apply(self.store, snapshot)
+        self.edit(second, 'b' * 400)
+        self.assertNotIn(first.id, self.history.histories)
+        # Вытесненная после записи история читается из хранилища целиком
+        self.assertEqual(self.history.undo(first).text, '')
+        self.assertEqual(first.content, '')
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,56 @@
+import os
+import random
+import sys
+import unittest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from notes_index import FUZZY_MIN, SearchIndex, tokenize
+
+
+WORDS = ("заметка план идея проект встреча задача дедлайн бюджет цель решение "
+         "note plan idea project meeting task deadline budget goal decision").split()
+
+
+def linear_scan(notes, query):
+    """Ключи заметок, где каждое слово запроса - подстрока заголовка или текста"""
+    terms = tokenize(query)
+    return {key for key, title, content in notes
+            if all(term in title.lower() or term in content.lower() for term in terms)}
+
+
+class RankRecallTest(unittest.TestCase):
+    """rank() находит всё, что находит поиск подстроки"""
+
+    def setUp(self):
+        rnd = random.Random(3)
+        self.notes = []
+        for key in range(300):
+            words = [rnd.choice(WORDS) for _ in range(rnd.randint(5, 30))]
+            # Много разных слов с общим началом и серединой
+            words.append(f"pre{key}fix")
+            self.notes.append((key, rnd.choice(WORDS).capitalize(), " ".join(words)))
+        self.index = SearchIndex()
+        self.index.build(self.notes)
+
+    def ranked(self, query):
+        return {key for _, key, _ in self.index.rank(query)}
+
+    def test_many_matching_words(self):
+        for query in ("pre", "re", "fix", "e1", "pre1"):
+            with self.subTest(query=query):
+                self.assertEqual(self.ranked(query), linear_scan(self.notes, query))
+
+    def test_same_as_linear_scan(self):
+        for query in ("проект", "ект", "де", "me", "a", "idea proj", "план 12", "zzz"):
+            with self.subTest(query=query):
+                expected = linear_scan(self.notes, query)
+                found = self.ranked(query)
+                self.assertLessEqual(expected, found)
+                if all(len(term) < FUZZY_MIN for term in tokenize(query)):
+                    # Без поиска с опечатками лишних заметок нет
+                    self.assertEqual(found, expected)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,386 @@
+import os
+import shutil
+import sys
+import tempfile
+import threading
+import unittest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from notes_model import Note, make_preview
+from notes_pack import MAGIC
+from notes_storage import (ChangeTracker, ContentCache, JournalStore, SqliteStore, StoreWriter,
+                           atomic_write, ensure_unique_ids, generation_path)
+
+
+class StoreTestCase(unittest.TestCase):
+    """Хранилище во временном каталоге"""
+
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.dir)
+        self.path = os.path.join(self.dir, 'notes_data.json')
+
+    def open(self, **options):
+        store = JournalStore(self.path, **options)
+        notes = store.load()
+        self.addCleanup(store.close)
+        return store, notes
+
+    def contents(self, store, notes):
+        """{id: текст} с подгрузкой незагруженных текстов"""
+        return {note.id: store.load_content(note).content for note in notes}
+
+
+class JournalTest(StoreTestCase):
+    """Журнал: дописывание, проигрывание при запуске и сжатие"""
+
+    def test_replay(self):
+        store, notes = self.open()
+        first = Note(store.allocate_id(), 'Первая', 'один')
+        second = Note(store.allocate_id(), 'Вторая', 'два')
+        notes[:0] = [second, first]
+        store.save(notes)
+        first.content = 'один, правка'
+        first.modified += 1
+        del notes[0]
+        store.save(notes)
+        store.close()
+
+        store, notes = self.open()
+        self.assertEqual(self.contents(store, notes), {first.id: 'один, правка'})
+
+    def test_torn_tail(self):
+        store, notes = self.open()
+        notes.append(Note(store.allocate_id(), 'Целая', 'текст'))
+        store.save(notes)
+        store.close()
+        # Аварийное завершение посреди записи
+        with open(store.journal_path, 'a', encoding='utf-8') as f:
+            f.write('{"op": "put", "note": {"id": 5, "tit')
+
+        store, notes = self.open()
+        self.assertEqual([note.title for note in notes], ['Целая'])
+        # Повреждённый журнал сразу заменяется чистым снимком
+        self.assertFalse(os.path.exists(store.journal_path))
+        store.close()
+        store, notes = self.open()
+        self.assertEqual(self.contents(store, notes), {notes[0].id: 'текст'})
+
+    def test_empty_store_is_not_compacted_on_load(self):
+        for _ in range(2):
+            store, notes = self.open()
+            store.close()
+            self.assertEqual(notes, [])
+        self.assertFalse(os.path.exists(self.path))
+
+    def test_appends_during_compaction(self):
+        store, notes = self.open()
+        for i in range(20):
+            notes.append(Note(store.allocate_id(), f'Заметка {i}', f'текст {i}'))
+        store.compact(notes, background=False)
+        store.close()
+        store, notes = self.open()
+
+        started, release = threading.Event(), threading.Event()
+        write_snapshot = store._write_snapshot
+
+        def slow_write(snapshot, source):
+            started.set()
+            release.wait(5)
+            write_snapshot(snapshot, source)
+
+        store._write_snapshot = slow_write
+        store.compact(notes)
+        self.assertTrue(started.wait(5))
+        # Правка и удаление, пока снимок пишется в фоне
+        edited = store.load_content(notes[3])
+        edited.content = 'правка во время сжатия'
+        edited.modified += 1
+        removed = notes.pop(5)
+        store.save(dirty={edited.id: edited}, deleted={removed.id})
+        release.set()
+        store.compactor.join()
+        self.assertEqual(store.background_errors(), [])
+        # Снимок записан, но в нём устаревшая версия правленой заметки
+        self.assertNotIn(edited.id, store.offsets)
+        self.assertNotIn(removed.id, store.offsets)
+        store.close()
+
+        store, reloaded = self.open()
+        contents = self.contents(store, reloaded)
+        self.assertEqual(contents[edited.id], 'правка во время сжатия')
+        self.assertNotIn(removed.id, contents)
+        self.assertEqual(len(contents), 19)
+
+
+class DirtyTrackingTest(StoreTestCase):
+    """Автосохранение пишет только отмеченные заметки и пропускает пустые циклы"""
+
+    def journal_lines(self, store):
+        with open(store.journal_path, encoding='utf-8') as f:
+            return len(f.readlines())
+
+    def test_only_dirty_notes_are_written(self):
+        store, notes = self.open()
+        tracker = ChangeTracker()
+        for i in range(10):
+            note = Note(store.allocate_id(), f'Заметка {i}', 'текст')
+            notes.append(note)
+            tracker.mark(note)
+        self.assertEqual(tracker.flush(store, notes), 10)
+
+        notes[4].content = 'правка'
+        notes[4].modified += 1
+        tracker.mark(notes[4])
+        # Отмеченная, но не изменённая заметка не записывается
+        tracker.mark(notes[7])
+        self.assertEqual(tracker.flush(store, notes), 1)
+        self.assertEqual(self.journal_lines(store), 11)
+        self.assertEqual(tracker.counters['notes_written'], 11)
+        self.assertEqual(tracker.counters['writes_avoided'], 1)
+
+    def test_idle_autosave_is_skipped(self):
+        store, notes = self.open()
+        tracker = ChangeTracker()
+        for _ in range(3):
+            self.assertIsNone(tracker.snapshot(notes))
+        self.assertEqual(tracker.counters['autosaves'], 3)
+        self.assertEqual(tracker.counters['idle_skips'], 3)
+        self.assertFalse(os.path.exists(store.journal_path))
+
+
+class StoreWriterTest(StoreTestCase):
+    """Поток записи: снимки неизменяемы, ошибки возвращают изменения трекеру"""
+
+    def test_snapshot_is_isolated_from_later_edits(self):
+        store, notes = self.open()
+        tracker = ChangeTracker()
+        writer = StoreWriter(store, tracker)
+        note = Note(store.allocate_id(), 'Заметка', 'первая версия')
+        notes.append(note)
+        tracker.mark(note)
+        writer.submit(tracker.snapshot(notes))
+        # Правка после снимка попадает только в следующий снимок
+        note.content = 'вторая версия'
+        note.modified += 1
+        tracker.mark(note)
+        writer.submit(tracker.snapshot(notes))
+        writer.close()
+        self.assertEqual(writer.pending_errors(), [])
+        store.close()
+
+        with open(store.journal_path, encoding='utf-8') as f:
+            journal = f.read()
+        self.assertLess(journal.index('первая версия'), journal.index('вторая версия'))
+        store, notes = self.open()
+        self.assertEqual(self.contents(store, notes), {note.id: 'вторая версия'})
+
+    def test_failed_write_is_retried(self):
+        store, notes = self.open()
+        tracker = ChangeTracker()
+        writer = StoreWriter(store, tracker)
+        note = Note(store.allocate_id(), 'Заметка', 'текст')
+        notes.append(note)
+        tracker.mark(note)
+        save = store.save
+
+        def failing_save(*args, **kwargs):
+            store.save = save
+            raise OSError('диск заполнен')
+
+        store.save = failing_save
+        writer.submit(tracker.snapshot(notes))
+        writer.close()
+        self.assertEqual([str(e) for e in writer.pending_errors()], ['диск заполнен'])
+        # Отметка возвращена трекеру - следующий цикл запишет заметку
+        self.assertIn(note.id, tracker.dirty)
+        self.assertEqual(tracker.flush(store, notes), 1)
+
+
+class RecoveryTest(StoreTestCase):
+    """Атомарная запись и откат на предыдущее поколение снимка"""
+
+    def write_versions(self, *versions):
+        store, notes = self.open()
+        note = Note(store.allocate_id(), 'Заметка', '')
+        notes.append(note)
+        for i, content in enumerate(versions):
+            note.content = content
+            note.modified += i + 1
+            store.compact(notes, background=False)
+        store.close()
+        return note
+
+    def test_fallback_to_previous_generation(self):
+        note = self.write_versions('первая', 'вторая')
+        with open(self.path, 'wb') as f:
+            f.write(b'[\n{"id": 0, "tit')
+
+        store, notes = self.open()
+        self.assertEqual(store.recovered_from, generation_path(self.path, 1))
+        self.assertEqual(self.contents(store, notes), {note.id: 'первая'})
+        store.close()
+        # Восстановленная версия сразу переписана в основной снимок
+        store, notes = self.open()
+        self.assertIsNone(store.recovered_from)
+        self.assertEqual(self.contents(store, notes), {note.id: 'первая'})
+
+    def test_all_generations_damaged(self):
+        self.write_versions('первая')
+        for path in (self.path, generation_path(self.path, 1)):
+            if os.path.exists(path):
+                with open(path, 'wb') as f:
+                    f.write(b'{')
+        with self.assertRaises(ValueError):
+            JournalStore(self.path).load()
+        self.assertTrue(os.path.exists(self.path + '.damaged'))
+
+    def test_failed_write_keeps_old_file(self):
+        path = os.path.join(self.dir, 'app_settings.json')
+        atomic_write(path, lambda f: f.write('{"theme": "dark"}'))
+
+        def broken(f):
+            f.write('{"theme": ')
+            raise OSError('диск заполнен')
+
+        with self.assertRaises(OSError):
+            atomic_write(path, broken)
+        with open(path, encoding='utf-8') as f:
+            self.assertEqual(f.read(), '{"theme": "dark"}')
+        self.assertFalse(os.path.exists(path + '.tmp'))
+
+
+class LazyCacheTest(StoreTestCase):
+    """Ленивая загрузка: оглавление при запуске, выгрузка и повторное чтение текстов"""
+
+    def setUp(self):
+        super().setUp()
+        store, notes = self.open()
+        for i in range(5):
+            notes.append(Note(store.allocate_id(), f'Заметка {i}', f'{i}' * 100))
+        store.compact(notes, background=False)
+        store.close()
+
+    def test_startup_reads_index_only(self):
+        store, notes = self.open()
+        self.assertEqual(len(notes), 5)
+        self.assertFalse(any(note.loaded for note in notes))
+        self.assertEqual(notes[2].preview, make_preview('2' * 100))
+        self.assertEqual(notes[2].chars, 100)
+
+    def test_eviction_and_reload(self):
+        store, notes = self.open()
+        cache = ContentCache(store, budget=250)
+        for note in notes[:3]:
+            cache.touch(store.load_content(note))
+        # Самый старый текст выгружен, два свежих остались
+        self.assertEqual([note.loaded for note in notes[:3]], [False, True, True])
+        self.assertEqual(cache.size, 200)
+        self.assertEqual(store.load_content(notes[0]).content, '0' * 100)
+
+    def test_unsaved_edit_is_not_evicted(self):
+        store, notes = self.open()
+        cache = ContentCache(store, budget=150)
+        edited = store.load_content(notes[0])
+        edited.content = 'несохранённая правка' * 10
+        edited.modified += 1
+        cache.touch(edited)
+        for note in notes[1:3]:
+            cache.touch(store.load_content(note))
+        self.assertEqual(edited.content, 'несохранённая правка' * 10)
+        self.assertFalse(notes[1].loaded)
+
+
+class NoteIdTest(StoreTestCase):
+    """id заметок уникальны и не переиспользуются после удаления"""
+
+    def test_counter_survives_restarts(self):
+        store, notes = self.open()
+        notes.extend(Note(store.allocate_id(), f'Заметка {i}', 'текст') for i in range(3))
+        store.save(notes)
+        removed = notes.pop()
+        store.save(notes)
+        store.close()
+
+        # Удалённый id занят и после проигрывания журнала, и после сжатия
+        for lazy in (True, False):
+            store, notes = self.open(lazy=lazy)
+            self.assertGreater(store.allocate_id(), removed.id)
+            store.compact(notes, background=False)
+            store.close()
+
+    def test_duplicate_ids_are_renumbered(self):
+        notes = [Note(1, 'а'), Note(1, 'б'), Note(None, 'в'), Note(4, 'г')]
+        self.assertTrue(ensure_unique_ids(notes))
+        self.assertEqual([note.id for note in notes], [1, 5, 6, 4])
+        self.assertFalse(ensure_unique_ids(notes))
+
+
+class PackedFormatTest(StoreTestCase):
+    """Двоичный снимок: сжатие записей и перенос заметок из JSON"""
+
+    def setUp(self):
+        super().setUp()
+        self.pack_path = os.path.join(self.dir, 'notes_data.pack')
+        self.texts = ['короткая', 'длинная заметка ' * 200, '']
+
+    def fill(self, store, notes):
+        for i, content in enumerate(self.texts):
+            notes.append(Note(store.allocate_id(), f'Заметка {i}', content))
+        store.compact(notes, background=False)
+        store.close()
+
+    def open_packed(self, compression):
+        store = JournalStore(self.pack_path, packed=True, compression=compression)
+        notes = store.load()
+        self.addCleanup(store.close)
+        return store, notes
+
+    def test_round_trip(self):
+        for compression in ('zlib', 'lzma', 'none'):
+            with self.subTest(compression=compression):
+                self.fill(*self.open_packed(compression))
+                with open(self.pack_path, 'rb') as f:
+                    self.assertEqual(f.read(len(MAGIC)), MAGIC)
+                store, notes = self.open_packed(compression)
+                self.assertEqual(list(self.contents(store, notes).values()), self.texts)
+                store.close()
+                os.remove(self.pack_path)
+                os.remove(store.index_path)
+
+    def test_migration_from_json(self):
+        self.fill(*self.open())
+        store, notes = self.open_packed('lzma')
+        self.assertEqual(list(self.contents(store, notes).values()), self.texts)
+        self.assertFalse(os.path.exists(self.path))
+        self.assertTrue(os.path.exists(self.path + '.migrated'))
+        self.assertLess(os.path.getsize(self.pack_path),
+                        os.path.getsize(self.path + '.migrated'))
+        store.close()
+
+        # Повторный запуск читает уже двоичный снимок
+        store, notes = self.open_packed('lzma')
+        self.assertEqual(list(self.contents(store, notes).values()), self.texts)
+
+
+class SqliteSearchTest(StoreTestCase):
+    """Поиск SQLite: каждое слово запроса - отдельная подстрока"""
+
+    def test_every_word_must_match(self):
+        store = SqliteStore(os.path.join(self.dir, 'notes.db'), self.path)
+        self.addCleanup(store.close)
+        notes = store.load()
+        notes[:0] = [Note(store.allocate_id(), 'План встречи', 'обсудить бюджет проекта'),
+                     Note(store.allocate_id(), 'Бюджет', 'план на год'),
+                     Note(store.allocate_id(), 'Идея', 'ab "в кавычках"')]
+        store.save(notes)
+        for query, expected in (('встречи план', {0}), ('бюджет план', {0, 1}),
+                                ('пл год', {1}), ('ab идея', {2}), ('"в', {2}),
+                                ('план идея', set())):
+            with self.subTest(query=query):
+                self.assertEqual(set(store.search(query)), expected)
+
+
+if __name__ == '__main__':
+    unittest.main()